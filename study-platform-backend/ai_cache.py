@@ -0,0 +1,222 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+load_dotenv()
+
+
+AI_CACHE_BACKEND: str = os.getenv("AI_CACHE_BACKEND", "memory")
+AI_CACHE_URL: str = os.getenv("AI_CACHE_URL", "")
+AI_CACHE_TTL_SECONDS: int = int(os.getenv("AI_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+AI_CACHE_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+
+
+def content_key(*parts: str) -> str:
+    """Stable hash over the given parts (order matters)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = (part or "").encode("utf-8")
+        digest.update(str(len(data)).encode("ascii") + b":" + data)
+    return digest.hexdigest()
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join((topic or "").split()).casefold()
+
+
+class MemoryBackend:
+    """In-process LRU map with per-entry expiry."""
+
+    # never waits on I/O, so coroutines may call it inline
+    blocking = False
+
+    def __init__(self, max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """File-backed cache that survives restarts and is shared between workers."""
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_ai_cache_accessed_at ON ai_cache (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM ai_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE ai_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, value, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM ai_cache WHERE key IN ("
+                " SELECT key FROM ai_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+
+
+class RedisBackend:
+    """
+    Any Redis-protocol server (Redis, Valkey, KeyDB, ...). TTL is native;
+    LRU is delegated to the server's `maxmemory-policy allkeys-lru`.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str, prefix: str = "ai_cache:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError("AI_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(self.prefix + key)
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        self._client.set(self.prefix + key, value, ex=ttl)
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._client.scan_iter(self.prefix + "*"))
+
+
+class ResponseCache:
+    """Counts hits and misses on top of a storage backend."""
+
+    def __init__(self, backend, ttl: int = AI_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception:
+            # a broken cache must never fail the request
+            pass
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """get() for coroutines; a blocking backend is read from the threadpool."""
+        if self.backend.blocking:
+            return await run_in_threadpool(self.get, key)
+        return self.get(key)
+
+    async def set_async(self, key: str, value: str) -> None:
+        if self.backend.blocking:
+            await run_in_threadpool(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def build_cache(
+    backend: str = AI_CACHE_BACKEND,
+    url: str = AI_CACHE_URL,
+) -> ResponseCache:
+    """Build a cache from AI_CACHE_BACKEND (memory | sqlite | redis) and AI_CACHE_URL."""
+    if backend == "memory":
+        return ResponseCache(MemoryBackend())
+    if backend == "sqlite":
+        return ResponseCache(SQLiteBackend(url or "ai_cache.sqlite3"))
+    if backend == "redis":
+        return ResponseCache(RedisBackend(url or "redis://localhost:6379/0"))
+    raise ValueError(f"Unknown AI_CACHE_BACKEND: {backend}")
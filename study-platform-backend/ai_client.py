@@ -0,0 +1,527 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Type
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+load_dotenv()
+
+
+AI_MAX_CONCURRENCY: int = int(os.getenv("AI_MAX_CONCURRENCY", "16"))
+# Time allowed for one model call including retries, and for a single attempt
+# (for streams: until the first chunk, and between chunks)
+AI_DEADLINE_SECONDS: float = float(os.getenv("AI_DEADLINE_SECONDS", "45"))
+AI_ATTEMPT_TIMEOUT_SECONDS: float = float(os.getenv("AI_ATTEMPT_TIMEOUT_SECONDS", "20"))
+# Extra attempts after a transient failure; full-jitter backoff doubling from the base
+AI_RETRIES: int = int(os.getenv("AI_RETRIES", "2"))
+AI_RETRY_BASE_SECONDS: float = float(os.getenv("AI_RETRY_BASE_SECONDS", "0.5"))
+# A duplicate request is sent when an attempt outlives the recent p95 latency
+# of its kind of call (never sooner than AI_HEDGE_MIN_SECONDS), for at most
+# this fraction of attempts; 0 disables hedging
+AI_HEDGE_BUDGET: float = float(os.getenv("AI_HEDGE_BUDGET", "0.05"))
+AI_HEDGE_MIN_SECONDS: float = float(os.getenv("AI_HEDGE_MIN_SECONDS", "1"))
+# Consecutive transient failures that open the circuit, and seconds it stays
+# open before one probe call is let through
+AI_BREAKER_FAILURES: int = int(os.getenv("AI_BREAKER_FAILURES", "5"))
+AI_BREAKER_RESET_SECONDS: float = float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+
+# Latencies kept per kind of call, and how many are needed before hedging
+_LATENCY_WINDOW = 200
+_HEDGE_MIN_SAMPLES = 20
+_TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class AIUnavailableError(Exception):
+    """The model could not answer in time: deadline passed, retries exhausted or circuit open."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(AIUnavailableError):
+    """Rejected without calling the model because the circuit breaker is open."""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Worth retrying: timeouts, dropped connections, rate limits and 5xx responses."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # google.api_core errors carry the HTTP status as `code`
+    return getattr(error, "code", None) in _TRANSIENT_STATUS
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), without a tokenizer call."""
+    return (len(text or "") + 3) // 4
+
+
+class TokenMeter:
+    """Running token totals per kind of model call, for /health."""
+
+    def __init__(self):
+        self._kinds: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, prompt_tokens: int, answer_tokens: int) -> None:
+        totals = self._kinds.setdefault(
+            kind, {"requests": 0, "prompt_tokens": 0, "answer_tokens": 0, "max_prompt_tokens": 0}
+        )
+        totals["requests"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["answer_tokens"] += answer_tokens
+        totals["max_prompt_tokens"] = max(totals["max_prompt_tokens"], prompt_tokens)
+
+    def stats(self) -> dict:
+        return {
+            kind: dict(
+                totals,
+                avg_prompt_tokens=round(totals["prompt_tokens"] / totals["requests"], 1),
+            )
+            for kind, totals in self._kinds.items()
+        }
+
+
+class ParseStats:
+    """Structured-output outcomes per kind of call: parse failures and repair retries."""
+
+    def __init__(self):
+        self._kinds: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, attempts: int, ok: bool) -> None:
+        """One request that took `attempts` model calls; `ok` if the last one validated."""
+        totals = self._kinds.setdefault(
+            kind, {"requests": 0, "attempts": 0, "parse_failures": 0, "repair_calls": 0, "failed": 0}
+        )
+        totals["requests"] += 1
+        totals["attempts"] += attempts
+        totals["parse_failures"] += attempts - 1 if ok else attempts
+        totals["repair_calls"] += attempts - 1
+        totals["failed"] += 0 if ok else 1
+
+    def stats(self) -> dict:
+        return {
+            kind: dict(
+                totals,
+                parse_failure_rate=round(totals["parse_failures"] / totals["attempts"], 4),
+            )
+            for kind, totals in self._kinds.items()
+        }
+
+
+_GEMINI_TYPES = {
+    "string": "string", "integer": "integer", "number": "number",
+    "boolean": "boolean", "array": "array", "object": "object",
+}
+
+
+def gemini_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    `model`'s JSON schema in the subset Gemini's response_schema accepts:
+    references inlined, Optional as nullable, and numeric bounds moved into
+    the description (the model is told, pydantic enforces them).
+    """
+    full = model.model_json_schema()
+    definitions = full.get("$defs", {})
+
+    def resolve(node: Dict[str, Any]) -> Dict[str, Any]:
+        if "$ref" in node:
+            return definitions[node["$ref"].rsplit("/", 1)[-1]]
+        return node
+
+    def convert(node: Dict[str, Any]) -> Dict[str, Any]:
+        node = resolve(node)
+        nullable = False
+        if "anyOf" in node:
+            options = [option for option in node["anyOf"] if option.get("type") != "null"]
+            nullable = len(options) < len(node["anyOf"])
+            node = {**resolve(options[0]), **{k: v for k, v in node.items() if k != "anyOf"}}
+        out: Dict[str, Any] = {"type": _GEMINI_TYPES[node["type"]]}
+        notes = [node["description"]] if node.get("description") else []
+        if "minimum" in node or "maximum" in node:
+            notes.append(f"between {node.get('minimum', '-inf')} and {node.get('maximum', 'inf')}")
+        if notes:
+            out["description"] = "; ".join(notes)
+        if nullable:
+            out["nullable"] = True
+        if "enum" in node:
+            out["enum"] = [str(value) for value in node["enum"]]
+        if node["type"] == "object":
+            out["properties"] = {name: convert(prop) for name, prop in node.get("properties", {}).items()}
+            if node.get("required"):
+                out["required"] = list(node["required"])
+        if node["type"] == "array":
+            out["items"] = convert(node["items"])
+        return out
+
+    return convert(full)
+
+
+class CircuitBreaker:
+    """
+    Closed until `failures` transient failures in a row; then open, failing
+    calls fast for `reset_seconds`; then half-open, letting a single probe
+    through whose outcome closes or re-opens it.
+    """
+
+    def __init__(
+        self,
+        failures: int = AI_BREAKER_FAILURES,
+        reset_seconds: float = AI_BREAKER_RESET_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (self._clock() - self._opened_at))
+
+    def allow(self) -> None:
+        """Raise CircuitOpenError unless a call may go upstream now."""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError("AI service circuit is open", max(1.0, self.retry_after()))
+
+    def record(self, ok: bool) -> None:
+        """Outcome of an allowed call; `ok` is False only for transient failures."""
+        self._probing = False
+        if ok:
+            self._consecutive = 0
+            self._opened_at = None
+            return
+        self._consecutive += 1
+        if self._opened_at is not None or self._consecutive >= self.failures:
+            if self._opened_at is None:
+                self.opened += 1
+            self._opened_at = self._clock()
+
+    def release(self) -> None:
+        """An allowed call was cancelled before it had an outcome."""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive,
+            "retry_after": round(self.retry_after(), 1),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class AIClient:
+    """
+    asyncio-native wrapper around a Gemini model.
+    Runs at most `max_concurrency` upstream calls at once and coalesces
+    identical in-flight prompts so they share a single upstream call.
+    Every call has a deadline; transient failures are retried with jittered
+    backoff, slow attempts are hedged with a duplicate request, and a
+    circuit breaker fails calls fast while the upstream keeps failing.
+    Callers see AIUnavailableError (or CircuitOpenError) for all of these;
+    other model errors propagate unchanged.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_concurrency: int = AI_MAX_CONCURRENCY,
+        deadline: float = AI_DEADLINE_SECONDS,
+        attempt_timeout: float = AI_ATTEMPT_TIMEOUT_SECONDS,
+        retries: int = AI_RETRIES,
+        hedge_budget: float = AI_HEDGE_BUDGET,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.hedge_budget = hedge_budget
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.counts = {
+            "calls": 0, "attempts": 0, "retries": 0, "timeouts": 0,
+            "deadline_exceeded": 0, "hedges": 0, "hedge_wins": 0,
+        }
+
+    @staticmethod
+    def prompt_key(prompt: str, **options: Any) -> str:
+        raw = prompt + "\x00" + repr(sorted(options.items()))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def generate(
+        self, prompt: str, kind: str = "default", deadline: Optional[float] = None, **options: Any,
+    ) -> str:
+        """
+        Return the stripped response text for `prompt`. `kind` groups
+        calls for hedging (their latencies differ); `deadline` overrides
+        the client's for this call.
+        """
+        key = self.prompt_key(prompt, **options)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(prompt, kind, deadline or self.deadline, options))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # shield so one cancelled waiter does not cancel the shared call
+        return await asyncio.shield(task)
+
+    async def _backoff(self, attempt: int) -> None:
+        self.counts["retries"] += 1
+        await asyncio.sleep(random.uniform(0, AI_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    async def _call(self, prompt: str, kind: str, deadline: float, options: Dict[str, Any]) -> str:
+        self.counts["calls"] += 1
+        try:
+            async with asyncio.timeout(deadline):
+                for attempt in range(self.retries + 1):
+                    try:
+                        return await self._hedged(prompt, kind, options)
+                    except AIUnavailableError:
+                        raise
+                    except Exception as e:
+                        if not is_transient(e):
+                            raise
+                        if attempt == self.retries:
+                            raise AIUnavailableError(f"AI service failed {attempt + 1} times: {e!r}") from e
+                    await self._backoff(attempt)
+        except TimeoutError as e:
+            self.counts["deadline_exceeded"] += 1
+            raise AIUnavailableError(f"AI service did not answer within {deadline:g}s") from e
+
+    def _p95(self, kind: str) -> Optional[float]:
+        latencies = self._latencies.get(kind)
+        if latencies is None or len(latencies) < _HEDGE_MIN_SAMPLES:
+            return None
+        return sorted(latencies)[int(len(latencies) * 0.95)]
+
+    def _hedge_delay(self, kind: str) -> Optional[float]:
+        p95 = self._p95(kind)
+        if p95 is None or self.counts["hedges"] >= self.hedge_budget * self.counts["attempts"]:
+            return None
+        return max(AI_HEDGE_MIN_SECONDS, p95)
+
+    async def _hedged(self, prompt: str, kind: str, options: Dict[str, Any]) -> str:
+        """One attempt, plus a duplicate if it is slower than usual; the first success wins."""
+        first = asyncio.ensure_future(self._attempt(prompt, kind, options))
+        delay = self._hedge_delay(kind)
+        if delay is None:
+            return await first
+        second = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            # no duplicates while the upstream is struggling or the client is saturated
+            if done or self.breaker.state != "closed" or self._semaphore.locked():
+                return await first
+            self.counts["hedges"] += 1
+            second = asyncio.ensure_future(self._attempt(prompt, kind, options))
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.counts["hedge_wins"] += task is second
+                        return task.result()
+            return first.result()
+        finally:
+            first.cancel()
+            if second is not None:
+                second.cancel()
+
+    async def _attempt(self, prompt: str, kind: str, options: Dict[str, Any]) -> str:
+        self.breaker.allow()
+        self.counts["attempts"] += 1
+        try:
+            async with self._semaphore:
+                started = time.monotonic()
+                response = await asyncio.wait_for(
+                    self.model.generate_content_async(prompt, **options), self.attempt_timeout,
+                )
+                text = response.text.strip()
+                elapsed = time.monotonic() - started
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.counts["timeouts"] += isinstance(e, TimeoutError)
+            self.breaker.record(ok=not is_transient(e))
+            raise
+        self.breaker.record(ok=True)
+        self._latencies.setdefault(kind, deque(maxlen=_LATENCY_WINDOW)).append(elapsed)
+        return text
+
+    async def stream(self, prompt: str, **options: Any) -> AsyncIterator[str]:
+        """
+        Yield text chunks as the model produces them (never coalesced or
+        hedged). Failures before the first chunk are retried; a stall of
+        more than the attempt timeout ends the stream with AIUnavailableError.
+        """
+        for attempt in range(self.retries + 1):
+            started = False
+            self.breaker.allow()
+            self.counts["attempts"] += 1
+            recorded = False
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(prompt, stream=True, **options),
+                        self.attempt_timeout,
+                    )
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), self.attempt_timeout)
+                        except StopAsyncIteration:
+                            break
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # chunk carried no text part (e.g. only finish metadata)
+                            continue
+                        if text:
+                            started = True
+                            yield text
+            except Exception as e:
+                recorded = True
+                self.counts["timeouts"] += isinstance(e, TimeoutError)
+                self.breaker.record(ok=not is_transient(e))
+                if not is_transient(e):
+                    raise
+                if started or attempt == self.retries:
+                    raise AIUnavailableError(f"AI stream failed: {e!r}") from e
+            else:
+                recorded = True
+                self.breaker.record(ok=True)
+                return
+            finally:
+                if not recorded:
+                    # the consumer went away mid-stream
+                    self.breaker.release()
+            await self._backoff(attempt)
+
+    def stats(self) -> dict:
+        return {
+            **self.counts,
+            "inflight": self.inflight,
+            "p95_seconds": {
+                kind: round(p95, 2)
+                for kind in self._latencies
+                for p95 in [self._p95(kind)]
+                if p95 is not None
+            },
+            "breaker": self.breaker.stats(),
+        }
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+class FakeUpstreamError(Exception):
+    """What FakeModel raises for an injected failure: a 503 from the API."""
+
+    code = 503
+
+
+class FakeModel:
+    """
+    Offline stand-in for a Gemini model with a predictable latency profile:
+    `first_token_delay` seconds before the first chunk, then one word every
+    `token_delay` seconds. A `slow_rate` fraction of calls is `slow_factor`
+    times slower and a `failure_rate` fraction fails with a 503 after the
+    first-token delay. Enable with AI_FAKE_MODEL=1.
+    """
+
+    def __init__(
+        self,
+        text: str = "This is a canned answer from the offline fake model.",
+        first_token_delay: float = float(os.getenv("AI_FAKE_FIRST_TOKEN_DELAY", "0.5")),
+        token_delay: float = float(os.getenv("AI_FAKE_TOKEN_DELAY", "0.02")),
+        failure_rate: float = float(os.getenv("AI_FAKE_FAILURE_RATE", "0")),
+        slow_rate: float = float(os.getenv("AI_FAKE_SLOW_RATE", "0")),
+        slow_factor: float = 10.0,
+    ):
+        self.text = text
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.calls = 0
+
+    def _chunks(self) -> list[str]:
+        words = self.text.split(" ")
+        return [w + " " for w in words[:-1]] + words[-1:]
+
+    def _sample(self, schema: Dict[str, Any], index: int = 0) -> Any:
+        """
+        A value shaped like a Gemini response_schema, for JSON-mode calls.
+        Arrays get min_items elements; the i-th element takes the i-th enum value.
+        """
+        kind = schema.get("type")
+        if schema.get("enum"):
+            return schema["enum"][index % len(schema["enum"])]
+        if kind == "object":
+            return {name: self._sample(prop, index) for name, prop in schema.get("properties", {}).items()}
+        if kind == "array":
+            return [self._sample(schema.get("items", {}), i) for i in range(schema.get("min_items", 1))]
+        if kind == "integer":
+            return 3
+        if kind == "number":
+            return 1.0
+        if kind == "boolean":
+            return True
+        return " ".join(self.text.split(" ")[:4])
+
+    async def generate_content_async(self, prompt, stream: bool = False, **options):
+        self.calls += 1
+        scale = self.slow_factor if random.random() < self.slow_rate else 1.0
+        if random.random() < self.failure_rate:
+            await asyncio.sleep(self.first_token_delay)
+            raise FakeUpstreamError("503 The model is overloaded (fake)")
+        if stream:
+            return self._stream(scale)
+        await asyncio.sleep(
+            (self.first_token_delay + self.token_delay * (len(self._chunks()) - 1)) * scale
+        )
+        config = options.get("generation_config") or {}
+        if config.get("response_mime_type") == "application/json":
+            return SimpleNamespace(text=json.dumps(self._sample(config.get("response_schema") or {})))
+        return SimpleNamespace(text=self.text)
+
+    async def _stream(self, scale: float = 1.0):
+        await asyncio.sleep(self.first_token_delay * scale)
+        for i, chunk in enumerate(self._chunks()):
+            if i:
+                await asyncio.sleep(self.token_delay * scale)
+            yield SimpleNamespace(text=chunk)
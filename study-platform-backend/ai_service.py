@@ -1,26 +1,119 @@
+import asyncio
+import json
 import os
+import re
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
 import google.generativeai as genai
 from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
+
+import ai_cache
+import schemas
+import semantic_cache
+from ai_client import (
+    AIClient, AIUnavailableError, FakeModel, ParseStats, TokenMeter,
+    estimate_tokens, gemini_schema,
+)
 
 # Load environment variables
 load_dotenv()
 
-# Get API key securely
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables.")
+if os.getenv("AI_FAKE_MODEL") == "1":
+    # Offline stand-in for local latency testing; no API key needed
+    model = FakeModel()
+else:
+    # Get API key securely
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables.")
+
+    # Configure Gemini
+    genai.configure(api_key=api_key)
+
+    # Initialize Gemini model
+    model = genai.GenerativeModel("models/gemini-2.5-flash")
+
+# Shared async client: bounded concurrency, coalescing of identical prompts,
+# deadlines, retries, hedging and a circuit breaker
+client = AIClient(model)
+
+# Estimated prompt/answer tokens per kind of call (tutor, tutor_summary, ...)
+token_meter = TokenMeter()
+
+# Extra model calls allowed to fix JSON output that does not match its schema
+AI_JSON_REPAIR_RETRIES: int = int(os.getenv("AI_JSON_REPAIR_RETRIES", "2"))
+parse_stats = ParseStats()
+
+T = TypeVar("T", bound=BaseModel)
+
+_JSON_FENCE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.S)
+_json_decoder = json.JSONDecoder()
+
+
+class StructuredOutputError(Exception):
+    """The model kept returning output that does not match the requested schema."""
+
 
-# Configure Gemini
-genai.configure(api_key=api_key)
+def parse_structured(text: str, model: Type[T]) -> T:
+    """
+    Validate model output against `model`. The fast path is pydantic's
+    JSON parser on the raw text; failing that, a Markdown code fence or
+    prose around the first JSON object is tolerated. Raises ValidationError.
+    """
+    try:
+        return model.model_validate_json(text)
+    except ValidationError as error:
+        fenced = _JSON_FENCE.match(text)
+        candidate = fenced.group(1) if fenced else text
+        start = candidate.find("{")
+        if start < 0:
+            raise error
+        try:
+            value, _ = _json_decoder.raw_decode(candidate, start)
+        except ValueError:
+            raise error
+        return model.model_validate(value)
 
-# Initialize Gemini model
-model = genai.GenerativeModel("models/gemini-2.5-flash")
 
+def _repair_prompt(prompt: str, output: str, error: ValidationError) -> str:
+    problems = "; ".join(
+        f"{'.'.join(str(part) for part in problem['loc']) or 'output'}: {problem['msg']}"
+        for problem in error.errors()[:5]
+    )
+    return f"""{prompt}
+
+Your previous reply was not valid:
+{output[:2000]}
+
+Problems: {problems}
+Reply again with only the corrected JSON object.
+"""
 
-def generate_assessment_questions(topic: str, notes: str = "") -> str:
+# Bump whenever the assessment prompt changes so stale cached answers are ignored
+ASSESSMENT_PROMPT_VERSION = "1"
+assessment_cache = ai_cache.build_cache()
+
+# Tutor answers served again for near-identical questions on the same topic
+tutor_cache = semantic_cache.SemanticCache()
+# Older versions stored this apology as the answer when the model call failed
+TUTOR_ERROR_PREFIX = "I apologize, I encountered an error"
+
+
+async def generate_assessment_questions(topic: str, notes: str = "") -> str:
     """
     Generate 5 structured assessment questions from basic to expert level.
+    Answers are cached by (normalized topic, notes, prompt version). While
+    the model is unavailable the topic's questions without notes are served
+    if cached; otherwise AIUnavailableError propagates.
     """
+    cache_key = ai_cache.content_key(
+        ai_cache.normalize_topic(topic),
+        notes or "",
+        ASSESSMENT_PROMPT_VERSION,
+    )
+    cached = await assessment_cache.get_async(cache_key)
+    if cached is not None:
+        return cached
 
     prompt = f"""
 You are an expert instructor.
@@ -56,21 +149,36 @@ Ensure the formatting is clean and Markdown-friendly.
 """
 
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        questions = await client.generate(prompt, kind="assessment")
+    except AIUnavailableError:
+        fallback = await assessment_cache.get_async(ai_cache.content_key(
+            ai_cache.normalize_topic(topic), "", ASSESSMENT_PROMPT_VERSION,
+        ))
+        if fallback is None:
+            raise
+        return fallback
 
-    except Exception as e:
-        return f"Error generating questions: {str(e)}"
+    await assessment_cache.set_async(cache_key, questions)
+    return questions
 
-def generate_tutor_response(topic: str, question: str) -> str:
+class TutorReply:
     """
-    Generate a helpful tutor response to a student's question using Socratic method.
-    Returns well-formatted response with examples and clear structure.
+    A tutor answer with its estimated token cost (no prompt tokens when
+    served from cache). `used_history` is set when the model saw the
+    student's own conversation, so the answer must not be shared.
     """
-    
-    prompt = f"""
-You are an exceptional AI tutor helping a student deeply understand {topic}.
 
+    def __init__(self, answer: str = "", prompt_tokens: int = 0, answer_tokens: int = 0, used_history: bool = False):
+        self.answer = answer
+        self.prompt_tokens = prompt_tokens
+        self.answer_tokens = answer_tokens
+        self.used_history = used_history
+
+
+def build_tutor_prompt(topic: str, question: str, history: str = "") -> str:
+    return f"""
+You are an exceptional AI tutor helping a student deeply understand {topic}.
+{history}
 Student's Question About "{topic}":
 {question}
 
@@ -100,17 +208,155 @@ Guidelines:
 Provide your response in a way that's easy to read and understand:
 """
 
+
+async def generate_tutor_response(topic: str, question: str, history: str = "") -> TutorReply:
+    """
+    Generate a helpful tutor response to a student's question using Socratic method.
+    Returns well-formatted response with examples and clear structure.
+    `history` is the student's earlier conversation on the topic (see
+    tutor_context); without it a stored answer to a similar question on
+    the same topic is reused, and with it that answer is the fallback while
+    the model is unavailable. Raises AIUnavailableError or the model's error.
+    """
+    if not history:
+        cached = tutor_cache.lookup(topic, question)
+        if cached is not None:
+            return TutorReply(cached, 0, estimate_tokens(cached))
+
+    prompt = build_tutor_prompt(topic, question, history)
+
+    try:
+        answer = await client.generate(prompt, kind="tutor")
+    except AIUnavailableError:
+        cached = tutor_cache.lookup(topic, question) if history else None
+        if cached is None:
+            raise
+        return TutorReply(cached, 0, estimate_tokens(cached))
+
+    reply = TutorReply(answer, estimate_tokens(prompt), estimate_tokens(answer), bool(history))
+    token_meter.record("tutor", reply.prompt_tokens, reply.answer_tokens)
+    if not history:
+        tutor_cache.add(topic, question, answer)
+    return reply
+
+
+async def stream_tutor_response(
+    topic: str, question: str, history: str = "", reply: Optional[TutorReply] = None,
+) -> AsyncIterator[str]:
+    """
+    Same prompt as generate_tutor_response, but yields text chunks as the
+    model produces them. Errors propagate to the caller. A cached answer
+    comes back as a single chunk, also as the fallback when the model is
+    unavailable before the first chunk. Once the stream is done, `reply`
+    (if given) holds the full answer and its token estimates.
+    """
+    reply = reply if reply is not None else TutorReply()
+    if not history:
+        cached = tutor_cache.lookup(topic, question)
+        if cached is not None:
+            reply.answer, reply.answer_tokens = cached, estimate_tokens(cached)
+            yield cached
+            return
+
+    prompt = build_tutor_prompt(topic, question, history)
+    parts = []
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        return f"I apologize, I encountered an error: {str(e)}. Please try asking your question again."
+        async for chunk in client.stream(prompt):
+            parts.append(chunk)
+            yield chunk
+    except AIUnavailableError:
+        cached = tutor_cache.lookup(topic, question) if history and not parts else None
+        if cached is None:
+            raise
+        reply.answer, reply.answer_tokens = cached, estimate_tokens(cached)
+        yield cached
+        return
 
+    reply.answer = "".join(parts).strip()
+    reply.prompt_tokens = estimate_tokens(prompt)
+    reply.answer_tokens = estimate_tokens(reply.answer)
+    reply.used_history = bool(history)
+    token_meter.record("tutor", reply.prompt_tokens, reply.answer_tokens)
+    if not history:
+        tutor_cache.add(topic, question, reply.answer)
 
-def generate_card_suggestion(title: str = "", description: str = "", due_date: str | None = None) -> dict:
+
+async def summarize_tutor_turns(
+    topic: str, summary: str, turns: Sequence[Tuple[str, str]], max_words: int,
+) -> str:
+    """
+    Fold older question/answer turns into the running summary of a
+    student's conversation on a topic. Errors propagate to the caller.
+    """
+    transcript = "\n\n".join(f"Student: {question}\nTutor: {answer}" for question, answer in turns)
+    prompt = f"""
+You maintain a running summary of a tutoring conversation about {topic}.
+
+Current summary:
+{summary or "(none yet)"}
+
+Turns to add:
+{transcript}
+
+Task:
+Rewrite the summary so it also covers the new turns. Keep what the student
+asked, what was explained, and any misunderstandings or preferences the tutor
+should remember. Use at most {max_words} words of plain prose.
+Return ONLY the summary.
+"""
+    text = await client.generate(prompt, kind="tutor_summary")
+    token_meter.record("tutor_summary", estimate_tokens(prompt), estimate_tokens(text))
+    return text
+
+
+def warm_tutor_cache(rows) -> None:
+    """Seed the tutor cache from stored (topic, question, answer) rows, oldest first."""
+    tutor_cache.warm(
+        (topic, question, answer)
+        for topic, question, answer in rows
+        if answer and not answer.startswith(TUTOR_ERROR_PREFIX)
+    )
+
+
+async def generate_structured(
+    prompt: str, model: Type[T], kind: str, response_schema: Optional[dict] = None,
+) -> T:
+    """
+    One JSON-mode model call constrained to `model`'s schema (or a
+    narrower `response_schema`), parsed and validated. Output that still
+    does not validate is sent back with the validation errors for up to
+    AI_JSON_REPAIR_RETRIES more calls; after that StructuredOutputError is
+    raised. Model errors propagate.
+    """
+    config = {
+        "response_mime_type": "application/json",
+        "response_schema": response_schema or gemini_schema(model),
+    }
+    attempt_prompt = prompt
+    for attempt in range(1, AI_JSON_REPAIR_RETRIES + 2):
+        text = await client.generate(attempt_prompt, kind=kind, generation_config=config)
+        token_meter.record(
+            kind if attempt == 1 else f"{kind}_repair",
+            estimate_tokens(attempt_prompt),
+            estimate_tokens(text),
+        )
+        try:
+            result = parse_structured(text, model)
+        except ValidationError as e:
+            attempt_prompt = _repair_prompt(prompt, text, e)
+            continue
+        parse_stats.record(kind, attempt, True)
+        return result
+
+    parse_stats.record(kind, AI_JSON_REPAIR_RETRIES + 1, False)
+    raise StructuredOutputError(f"model output did not match {model.__name__}")
+
+
+async def generate_card_suggestion(title: str = "", description: str = "", due_date: str | None = None) -> dict:
     """
     Suggest a better title, priority (1 high - 5 low), and short notes for a kanban card.
-    Returns a dict compatible with KanbanSuggestionResponse.
+    Returns a dict compatible with KanbanSuggestionResponse; raises
+    StructuredOutputError when the model cannot produce one.
     """
     prompt = f"""
 You are an expert productivity assistant.
@@ -124,36 +370,115 @@ Task Title: {title}
 Description: {description}
 Due Date: {due_date}
 
-Return results in JSON with keys: suggested_title, suggested_priority, suggested_notes.
-Do not add extra commentary.
+Respond with a JSON object with keys suggested_title, suggested_priority and suggested_notes.
+"""
+    suggestion = await generate_structured(prompt, schemas.KanbanSuggestionResponse, "card_suggestion")
+    return suggestion.model_dump()
+
+
+# Card text packed into one batch suggestion prompt, and cards per prompt
+AI_SUGGEST_BATCH_TOKENS: int = int(os.getenv("AI_SUGGEST_BATCH_TOKENS", "1500"))
+AI_SUGGEST_BATCH_CARDS: int = int(os.getenv("AI_SUGGEST_BATCH_CARDS", "20"))
+# Batch prompts of one request in flight at once (AIClient still caps the total)
+AI_SUGGEST_BATCH_CONCURRENCY: int = int(os.getenv("AI_SUGGEST_BATCH_CONCURRENCY", "4"))
+
+_card_batch_schema = gemini_schema(schemas.KanbanCardSuggestionBatch)
+
+
+def _card_line(card: dict) -> str:
+    return json.dumps({
+        "card_id": card["id"],
+        "title": card.get("title") or "",
+        "description": (card.get("description") or "")[:500],
+        "due_date": card.get("due_date"),
+    })
+
+
+def pack_card_batches(cards: Sequence[dict]) -> List[List[dict]]:
+    """
+    Split cards, in order, into batches of at most AI_SUGGEST_BATCH_CARDS
+    whose card text stays within AI_SUGGEST_BATCH_TOKENS (a single larger
+    card still gets a batch of its own).
+    """
+    batches: List[List[dict]] = []
+    current: List[dict] = []
+    used = 0
+    for card in cards:
+        tokens = estimate_tokens(_card_line(card))
+        if current and (used + tokens > AI_SUGGEST_BATCH_TOKENS or len(current) >= AI_SUGGEST_BATCH_CARDS):
+            batches.append(current)
+            current, used = [], 0
+        current.append(card)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _suggest_batch(cards: List[dict]) -> List[dict]:
+    """Suggestions for one packed batch, one model call (plus repairs)."""
+    ids = [card["id"] for card in cards]
+    # exactly one suggestion per card, and only for these cards
+    items = dict(_card_batch_schema["properties"]["suggestions"]["items"])
+    items["properties"] = dict(items["properties"], card_id={"type": "string", "enum": [str(i) for i in ids]})
+    response_schema = dict(_card_batch_schema, properties={"suggestions": {
+        "type": "array", "items": items, "min_items": len(ids), "max_items": len(ids),
+    }})
+    prompt = f"""
+You are an expert productivity assistant.
+
+For EACH task below (one JSON object per line), suggest:
+- a concise, clearer title (1-8 words)
+- a priority integer from 1 (highest) to 5 (lowest)
+- one short note to help the user act on it immediately
+
+Tasks:
+{chr(10).join(_card_line(card) for card in cards)}
+
+Respond with a JSON object {{"suggestions": [...]}} holding one entry per task with keys
+card_id, suggested_title, suggested_priority and suggested_notes.
 """
+    batch = await generate_structured(
+        prompt, schemas.KanbanCardSuggestionBatch, "card_suggestion_batch", response_schema,
+    )
+    by_id: Dict[int, dict] = {}
+    for suggestion in batch.suggestions:
+        if suggestion.card_id in ids and suggestion.card_id not in by_id:
+            by_id[suggestion.card_id] = {
+                "card_id": suggestion.card_id, **suggestion.model_dump(exclude={"card_id"}),
+            }
+    # anything the batch skipped gets a call of its own
+    missing = [card for card in cards if card["id"] not in by_id]
+    singles = await asyncio.gather(*[
+        generate_card_suggestion(card.get("title") or "", card.get("description") or "", card.get("due_date"))
+        for card in missing
+    ])
+    for card, suggestion in zip(missing, singles):
+        by_id[card["id"]] = {"card_id": card["id"], **suggestion}
+    return [by_id[card_id] for card_id in ids]
+
+
+async def generate_card_suggestions(cards: Sequence[dict]) -> AsyncIterator[List[dict]]:
+    """
+    Suggestions for many cards (dicts with id, title, description,
+    due_date): packed into as few prompts as the token budget allows, run
+    concurrently, yielded a batch at a time as each finishes. A batch that
+    fails yields {"card_id", "error"} entries for its cards instead.
+    """
+    slots = asyncio.Semaphore(AI_SUGGEST_BATCH_CONCURRENCY)
+
+    async def run(batch: List[dict]) -> List[dict]:
+        async with slots:
+            try:
+                return await _suggest_batch(batch)
+            except Exception:
+                return [{"card_id": card["id"], "error": "Could not generate a suggestion"} for card in batch]
+
+    tasks = [asyncio.ensure_future(run(batch)) for batch in pack_card_batches(cards)]
     try:
-        resp = model.generate_content(prompt)
-        text = resp.text.strip()
-        # naive parse: try to extract JSON, otherwise fallback to plain parsing
-        import json, re
-        m = re.search(r"\{.*\}", text, re.S)
-        if m:
-            payload = json.loads(m.group(0))
-            return payload
-        # fallback: split lines
-        lines = [l.strip() for l in text.splitlines() if l.strip()]
-        suggested_title = lines[0] if lines else title
-        suggested_priority = 3
-        suggested_notes = ""
-        for ln in lines:
-            if "priority" in ln.lower():
-                import re
-                d = re.findall(r"\d", ln)
-                if d:
-                    suggested_priority = int(d[0])
-            if "note" in ln.lower() or "notes" in ln.lower():
-                suggested_notes = ln.split(":", 1)[-1].strip()
-
-        return {
-            "suggested_title": suggested_title,
-            "suggested_priority": suggested_priority,
-            "suggested_notes": suggested_notes,
-        }
-    except Exception as e:
-        return {"suggested_title": title or "Suggested Task", "suggested_priority": 3, "suggested_notes": f"(error: {str(e)})"}
\ No newline at end of file
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # the client went away: stop paying for the rest
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,39 @@
+"""add user_study_stats
+
+Revision ID: 3f9a6c2d8e14
+Revises: cecdbc479ad1
+Create Date: 2026-10-17 10:12:41.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a6c2d8e14'
+down_revision: Union[str, Sequence[str], None] = 'cecdbc479ad1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_study_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total_hours', sa.Float(), nullable=False),
+    sa.Column('session_count', sa.Integer(), nullable=False),
+    sa.Column('topic_count', sa.Integer(), nullable=False),
+    sa.Column('streak_length', sa.Integer(), nullable=False),
+    sa.Column('last_study_date', sa.Date(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Populate it afterwards with: python stats.py backfill
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_study_stats')
@@ -0,0 +1,66 @@
+"""add lexicographic rank keys to kanban columns and cards
+
+Revision ID: 5d0c8e7a91f2
+Revises: c71d09e5a3b6
+Create Date: 2026-10-17 13:41:06.274519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from ranking import spread
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0c8e7a91f2'
+down_revision: Union[str, Sequence[str], None] = 'c71d09e5a3b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+rank_key = sa.String(length=255).with_variant(sa.String(length=255, collation='C'), 'postgresql')
+
+
+def _backfill(table: str, parent: str) -> None:
+    # existing rows keep their integer order
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        f'SELECT id, {parent} FROM {table} ORDER BY {parent}, position, id'
+    )).all()
+    by_parent: dict[int, list[int]] = {}
+    for row_id, parent_id in rows:
+        by_parent.setdefault(parent_id, []).append(row_id)
+    updates = [
+        {'row_id': row_id, 'new_rank': key}
+        for ids in by_parent.values()
+        for row_id, key in zip(ids, spread(len(ids)))
+    ]
+    if updates:
+        bind.execute(sa.text(f'UPDATE {table} SET rank = :new_rank WHERE id = :row_id'), updates)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('kanban_columns', sa.Column('rank', rank_key, nullable=True))
+    op.add_column('kanban_columns', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('kanban_cards', sa.Column('rank', rank_key, nullable=True))
+    _backfill('kanban_columns', 'board_id')
+    _backfill('kanban_cards', 'column_id')
+    op.drop_index('ix_kanban_columns_board_id_position', table_name='kanban_columns')
+    op.drop_index('ix_kanban_cards_column_id_position', table_name='kanban_cards')
+    op.create_index('ix_kanban_columns_board_id_rank', 'kanban_columns', ['board_id', 'rank'], unique=False)
+    op.create_index('ix_kanban_cards_column_id_rank', 'kanban_cards', ['column_id', 'rank'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_kanban_cards_column_id_rank', table_name='kanban_cards')
+    op.drop_index('ix_kanban_columns_board_id_rank', table_name='kanban_columns')
+    op.create_index('ix_kanban_cards_column_id_position', 'kanban_cards', ['column_id', 'position'], unique=False)
+    op.create_index('ix_kanban_columns_board_id_position', 'kanban_columns', ['board_id', 'position'], unique=False)
+    with op.batch_alter_table('kanban_cards') as batch_op:
+        batch_op.drop_column('rank')
+    with op.batch_alter_table('kanban_columns') as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('rank')
@@ -0,0 +1,50 @@
+"""add composite indexes for endpoint query shapes
+
+Revision ID: 8b2e41d7c5a0
+Revises: 3f9a6c2d8e14
+Create Date: 2026-10-17 11:04:18.552907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e41d7c5a0'
+down_revision: Union[str, Sequence[str], None] = '3f9a6c2d8e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # /api/logs, dashboard chart, streaks, leaderboard hour sums
+    op.create_index('ix_study_logs_user_id_study_date', 'study_logs', ['user_id', 'study_date'], unique=False, postgresql_include=['hours'])
+    # assessment notes lookup, distinct-topic check
+    op.create_index('ix_study_logs_user_id_topic_id', 'study_logs', ['user_id', 'topic', 'id'], unique=False)
+    # /api/tutor/history
+    op.create_index('ix_conversations_user_id_created_at', 'conversations', ['user_id', 'created_at'], unique=False)
+    # leaderboards: ORDER BY total_xp DESC and rank counting
+    op.create_index('ix_users_total_xp_id', 'users', ['total_xp', 'id'], unique=False)
+    # /api/study-groups (public, newest first) and member lists
+    op.create_index('ix_study_groups_is_public_created_at', 'study_groups', ['is_public', 'created_at'], unique=False)
+    op.create_index('ix_study_group_members_group_id', 'study_group_members', ['group_id'], unique=False)
+    # kanban ownership and ordered children
+    op.create_index('ix_kanban_boards_owner_id', 'kanban_boards', ['owner_id'], unique=False)
+    op.create_index('ix_kanban_columns_board_id_position', 'kanban_columns', ['board_id', 'position'], unique=False)
+    op.create_index('ix_kanban_cards_column_id_position', 'kanban_cards', ['column_id', 'position'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_kanban_cards_column_id_position', table_name='kanban_cards')
+    op.drop_index('ix_kanban_columns_board_id_position', table_name='kanban_columns')
+    op.drop_index('ix_kanban_boards_owner_id', table_name='kanban_boards')
+    op.drop_index('ix_study_group_members_group_id', table_name='study_group_members')
+    op.drop_index('ix_study_groups_is_public_created_at', table_name='study_groups')
+    op.drop_index('ix_users_total_xp_id', table_name='users')
+    op.drop_index('ix_conversations_user_id_created_at', table_name='conversations')
+    op.drop_index('ix_study_logs_user_id_topic_id', table_name='study_logs')
+    op.drop_index('ix_study_logs_user_id_study_date', table_name='study_logs')
@@ -0,0 +1,47 @@
+"""add tutor_contexts and conversation token counts
+
+Revision ID: 9e4b1f6a2c73
+Revises: 5d0c8e7a91f2
+Create Date: 2026-10-17 15:12:40.583106
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4b1f6a2c73'
+down_revision: Union[str, Sequence[str], None] = '5d0c8e7a91f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('tutor_contexts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('topic', sa.String(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('summarized_through_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'topic', name='uq_tutor_contexts_user_id_topic')
+    )
+    op.create_index(op.f('ix_tutor_contexts_id'), 'tutor_contexts', ['id'], unique=False)
+    op.add_column('conversations', sa.Column('prompt_tokens', sa.Integer(), nullable=True))
+    op.add_column('conversations', sa.Column('answer_tokens', sa.Integer(), nullable=True))
+    op.create_index('ix_conversations_user_id_topic_id', 'conversations', ['user_id', 'topic', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_conversations_user_id_topic_id', table_name='conversations')
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('answer_tokens')
+        batch_op.drop_column('prompt_tokens')
+    op.drop_index(op.f('ix_tutor_contexts_id'), table_name='tutor_contexts')
+    op.drop_table('tutor_contexts')
@@ -0,0 +1,37 @@
+"""one xp_events balance row per user
+
+Revision ID: a4c9e2d7b153
+Revises: f2a8d4c61e09
+Create Date: 2026-10-18 11:32:49.617208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e2d7b153'
+down_revision: Union[str, Sequence[str], None] = 'f2a8d4c61e09'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # workers seeding opening balances at the same startup could each add one
+    op.execute(
+        "DELETE FROM xp_events WHERE reason = 'balance' AND id NOT IN ("
+        " SELECT MIN(id) FROM xp_events WHERE reason = 'balance' GROUP BY user_id)"
+    )
+    op.create_index(
+        'uq_xp_events_user_id_balance', 'xp_events', ['user_id'], unique=True,
+        sqlite_where=sa.text("reason = 'balance'"),
+        postgresql_where=sa.text("reason = 'balance'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_xp_events_user_id_balance', table_name='xp_events')
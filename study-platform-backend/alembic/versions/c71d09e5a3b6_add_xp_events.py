@@ -0,0 +1,45 @@
+"""add xp_events ledger
+
+Revision ID: c71d09e5a3b6
+Revises: 8b2e41d7c5a0
+Create Date: 2026-10-17 12:27:55.918340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c71d09e5a3b6'
+down_revision: Union[str, Sequence[str], None] = '8b2e41d7c5a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('xp_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('reason', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_xp_events_id'), 'xp_events', ['id'], unique=False)
+    op.create_index('ix_xp_events_user_id_created_at', 'xp_events', ['user_id', 'created_at'], unique=False)
+    # opening balance so ledger sums cover XP awarded before the ledger existed
+    op.execute(
+        "INSERT INTO xp_events (user_id, amount, reason, created_at) "
+        "SELECT id, total_xp, 'balance', COALESCE(created_at, CURRENT_TIMESTAMP) FROM users WHERE total_xp > 0"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_xp_events_user_id_created_at', table_name='xp_events')
+    op.drop_index(op.f('ix_xp_events_id'), table_name='xp_events')
+    op.drop_table('xp_events')
@@ -0,0 +1,29 @@
+"""add per-job webhook signing secret
+
+Revision ID: e6a1c4f8b527
+Revises: b3d7e2a9f410
+Create Date: 2026-10-17 19:42:08.315904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a1c4f8b527'
+down_revision: Union[str, Sequence[str], None] = 'b3d7e2a9f410'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('webhook_secret', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('jobs') as batch_op:
+        batch_op.drop_column('webhook_secret')
@@ -0,0 +1,37 @@
+"""add conversations.used_history
+
+Revision ID: f2a8d4c61e09
+Revises: e6a1c4f8b527
+Create Date: 2026-10-18 10:05:27.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a8d4c61e09'
+down_revision: Union[str, Sequence[str], None] = 'e6a1c4f8b527'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('used_history', sa.Boolean(), nullable=True))
+    # Only the first turn of a user on a topic is known to have had no history
+    op.execute(
+        "UPDATE conversations SET used_history = EXISTS ("
+        " SELECT 1 FROM conversations AS earlier"
+        " WHERE earlier.user_id = conversations.user_id"
+        " AND earlier.topic = conversations.topic"
+        " AND earlier.id < conversations.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('used_history')
@@ -1,32 +1,40 @@
 import os
-import bcrypt
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
+from typing import Annotated, Optional, Dict, Any
 
-from jose import jwt
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+import database
+import models
+import passwords
 
 SECRET_KEY: str = os.getenv("SECRET_KEY", "")
 ALGORITHM: str = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
+# Each worker has its own user cache and only invalidates its own, so a
+# deleted account or changed email is seen by the others after at most this
+USER_CACHE_TTL_SECONDS: int = int(os.getenv("USER_CACHE_TTL_SECONDS", "5"))
+USER_CACHE_MAX_ENTRIES: int = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
 
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY must be set in environment variables")
 
 
 def hash_password(password: str) -> str:
-    password_bytes = password.encode("utf-8")[:72]
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode("utf-8")
+    """Blocking hash; request handlers use passwords.hash_password instead."""
+    return passwords.hash_sync(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    try:
-        plain_bytes = plain_password.encode("utf-8")[:72]
-        hashed_bytes = hashed_password.encode("utf-8")
-        return bcrypt.checkpw(plain_bytes, hashed_bytes)
-    except Exception:
-        return False
+    return passwords.verify_sync(plain_password, hashed_password)
 
 
 def create_access_token(
@@ -42,3 +50,239 @@ def create_access_token(
     to_encode.update({"exp": expire})
 
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+# Columns kept in the cached snapshot (never the password hash)
+SNAPSHOT_FIELDS = ("id", "email", "total_xp", "created_at")
+
+
+class UserCache:
+    """
+    Bounded LRU of verified token -> user snapshot. Entries live for
+    `ttl` seconds or until the token expires, whichever comes first.
+
+    The cache is per process: invalidate() and update() only reach this
+    worker's copy. With several workers a change made through another one
+    shows up here once the entry expires, so keep `ttl` to a few seconds;
+    it is meant to absorb bursts of requests, not to hold users for long.
+    """
+
+    def __init__(self, ttl: int = USER_CACHE_TTL_SECONDS, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, set] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return dict(entry[1])
+            if entry is not None:
+                self._drop(token)
+            self.misses += 1
+            return None
+
+    def put(self, token: str, snapshot: dict, token_exp: Optional[float] = None) -> None:
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, float(token_exp))
+        with self._lock:
+            self._drop(token)
+            self._entries[token] = (expires_at, snapshot)
+            self._tokens_by_user.setdefault(snapshot["id"], set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def update(self, user_id: int, **fields: Any) -> None:
+        """Patch the cached snapshots of one user in place."""
+        with self._lock:
+            for token in self._tokens_by_user.get(user_id, ()):
+                self._entries[token][1].update(fields)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._drop(token)
+
+    def _drop(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[1]["id"])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[1]["id"]]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+user_cache = UserCache()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _cached_user(token: str) -> Optional[models.User]:
+    """Detached User rebuilt from the cached snapshot, if the token is cached."""
+    snapshot = user_cache.get(token)
+    if snapshot is None:
+        return None
+    user = models.User(**snapshot)
+    make_transient_to_detached(user)
+    return user
+
+
+def _user_query(token: str) -> tuple:
+    """(select statement for the token's user, token expiry). Raises 401."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise _credentials_exception()
+
+    subject = payload.get("sub")
+    if subject is None:
+        raise _credentials_exception()
+
+    # sub is the immutable user id; tokens issued before that carry the email
+    if str(subject).isdigit():
+        statement = select(models.User).where(models.User.id == int(subject))
+    else:
+        statement = select(models.User).where(models.User.email == subject)
+    return statement.limit(1), payload.get("exp")
+
+
+def _remember(token: str, user: Optional[models.User], token_exp) -> models.User:
+    if not user:
+        raise _credentials_exception()
+    user_cache.put(
+        token,
+        {field: getattr(user, field) for field in SNAPSHOT_FIELDS},
+        token_exp,
+    )
+    return user
+
+
+def get_current_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[Session, Depends(database.get_db)],
+) -> models.User:
+    """
+    Resolve the bearer token to a User attached to the request session.
+    Cache hits are re-attached without a query; attributes outside the
+    snapshot load lazily if a handler touches them.
+    """
+    user = _cached_user(token)
+    if user is not None:
+        return db.merge(user, load=False)
+
+    statement, token_exp = _user_query(token)
+    return _remember(token, db.execute(statement).scalar_one_or_none(), token_exp)
+
+
+async def get_current_user_async(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[AsyncSession, Depends(database.get_async_db)],
+) -> models.User:
+    """
+    get_current_user for handlers on the async session. Only the snapshot
+    columns are guaranteed loaded; there are no lazy loads on this path.
+    """
+    user = _cached_user(token)
+    if user is not None:
+        return await db.merge(user, load=False)
+
+    statement, token_exp = _user_query(token)
+    return _remember(token, (await db.execute(statement)).scalar_one_or_none(), token_exp)
+
+
+# Sessions for read-only endpoints, routed by database.router for the caller
+
+def get_read_db(current_user: Annotated[models.User, Depends(get_current_user)]):
+    db = database.router.session_for(current_user.id)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(current_user: Annotated[models.User, Depends(get_current_user_async)]):
+    async with database.router.async_session_for(current_user.id) as db:
+        yield db
+
+
+def token_user_id(authorization: Optional[str]) -> Optional[int]:
+    """User id from an Authorization header without touching the database."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        subject = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+    if str(subject).isdigit():
+        return int(subject)
+    # tokens issued before ids were used carry the email; the cache may know it
+    snapshot = user_cache.get(token)
+    return snapshot["id"] if snapshot else None
+
+
+class ReadYourWritesMiddleware:
+    """
+    Once a mutating request by a signed-in user has finished, pins that
+    user's reads to the primary for the read-your-writes window.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] in self.SAFE_METHODS
+            or not database.router.replicas
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_and_track(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif (
+                message["type"] == "http.response.body"
+                and not message.get("more_body")
+                and status_code < 400
+            ):
+                # before the last byte goes out, so the client's next read
+                # cannot overtake it
+                headers = dict(scope["headers"])
+                user_id = token_user_id(headers.get(b"authorization", b"").decode("latin-1"))
+                if user_id is not None:
+                    database.router.note_write(user_id)
+            await send(message)
+
+        await self.app(scope, receive, send_and_track)
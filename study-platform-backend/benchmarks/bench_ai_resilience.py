@@ -0,0 +1,95 @@
+"""
+AI client resilience benchmark against the offline fake model: tail latency
+with and without hedged requests when a few calls are very slow, how long a
+hung upstream holds a caller, and how the circuit breaker sheds load while
+the upstream keeps failing.
+
+    python benchmarks/bench_ai_resilience.py [--calls 400] [--slow-rate 0.05]
+
+Timings are scaled down (tens of milliseconds instead of seconds) so the
+run takes a few seconds; the ratios are what matter.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import ai_client  # noqa: E402
+from ai_client import AIClient, AIUnavailableError, CircuitBreaker, FakeModel  # noqa: E402
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def tail_latency(calls: int, slow_rate: float, hedge_budget: float) -> None:
+    model = FakeModel(first_token_delay=0.02, token_delay=0.0, slow_rate=slow_rate, slow_factor=20)
+    client = AIClient(model, hedge_budget=hedge_budget)
+    timings = []
+    for i in range(calls):
+        started = time.perf_counter()
+        # distinct prompts so coalescing does not merge them
+        await client.generate(f"question {i}", kind="bench")
+        timings.append((time.perf_counter() - started) * 1000)
+    stats = client.stats()
+    print(f"hedge budget {hedge_budget:<5} p50 {statistics.median(timings):6.1f}ms  "
+          f"p99 {percentile(timings, 0.99):6.1f}ms  max {max(timings):6.1f}ms  "
+          f"upstream calls {model.calls / calls:.3f}/request  hedges {stats['hedges']} "
+          f"(won {stats['hedge_wins']})")
+
+
+async def hung_upstream() -> None:
+    model = FakeModel(first_token_delay=10.0, token_delay=0.0)
+    client = AIClient(model, deadline=0.3, attempt_timeout=0.1, retries=2)
+    started = time.perf_counter()
+    try:
+        await client.generate("hangs", kind="bench")
+    except AIUnavailableError as e:
+        print(f"hung upstream: gave up after {time.perf_counter() - started:.2f}s ({e})")
+    print(f"  {client.stats()['attempts']} attempts, {client.stats()['timeouts']} attempt timeouts")
+
+
+async def failing_upstream(calls: int) -> None:
+    model = FakeModel(first_token_delay=0.01, token_delay=0.0, failure_rate=1.0)
+    client = AIClient(model, retries=1, breaker=CircuitBreaker(failures=5, reset_seconds=0.2))
+    fast = 0
+    started = time.perf_counter()
+    for i in range(calls):
+        began = time.perf_counter()
+        try:
+            await client.generate(f"question {i}", kind="bench")
+        except AIUnavailableError:
+            fast += time.perf_counter() - began < 0.005
+        if i == calls // 2:
+            # the upstream recovers; the next probe closes the circuit again
+            model.failure_rate = 0.0
+            await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    print(f"failing upstream: {calls} calls in {elapsed:.2f}s, {model.calls} reached the model, "
+          f"{fast} failed fast; breaker now {client.breaker.stats()}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--slow-rate", type=float, default=0.02)
+    args = parser.parse_args()
+    ai_client.AI_HEDGE_MIN_SECONDS = 0.0
+    ai_client.AI_RETRY_BASE_SECONDS = 0.005
+
+    print(f"{args.calls} sequential calls, {args.slow_rate:.0%} of upstream calls 20x slower")
+    for budget in (0.0, 0.1):
+        await tail_latency(args.calls, args.slow_rate, budget)
+    print()
+    await hung_upstream()
+    print()
+    await failing_upstream(40)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
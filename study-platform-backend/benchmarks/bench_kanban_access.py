@@ -0,0 +1,158 @@
+"""
+Kanban mutation round-trips: the old fetch-then-check-owner handlers vs the
+single-query ownership checks in kanban_access.
+
+    python benchmarks/bench_kanban_access.py [--repeat 200]
+
+Counts the SQL statements each call sends (including COMMIT) and times it.
+Uses BENCH_DATABASE_URL if set (e.g. a local Postgres), otherwise a
+throwaway SQLite file. The target database is wiped and reseeded.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_kanban_access.db"),
+)
+os.environ.setdefault("SECRET_KEY", "bench-kanban-access")
+os.environ.setdefault("AI_FAKE_MODEL", "1")
+
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import database  # noqa: E402
+import kanban  # noqa: E402
+import kanban_access  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+
+
+def seed(db) -> tuple[models.User, models.KanbanColumn]:
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    user = models.User(email="bench@example.com", hashed_password="x", total_xp=0)
+    db.add(user)
+    db.flush()
+    board = models.KanbanBoard(name="bench", owner_id=user.id)
+    db.add(board)
+    db.flush()
+    column = models.KanbanColumn(title="todo", board_id=board.id, rank="V")
+    db.add(column)
+    db.commit()
+    return user, column
+
+
+# The handlers as they were before kanban_access, minus the rank bookkeeping
+
+def legacy_create_card(db, user, column_id):
+    col = db.query(models.KanbanColumn).filter_by(id=column_id).first()
+    if not col:
+        raise HTTPException(status_code=404, detail="Column not found")
+    board = db.query(models.KanbanBoard).filter_by(id=col.board_id, owner_id=user.id).first()
+    if not board:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    new = models.KanbanCard(title="card", priority=3, column_id=column_id)
+    db.add(new)
+    db.commit()
+    db.refresh(new)
+    return new
+
+
+def legacy_update_card(db, user, card_id, payload):
+    card = db.query(models.KanbanCard).filter_by(id=card_id).first()
+    if not card:
+        raise HTTPException(status_code=404, detail="Card not found")
+    board = db.query(models.KanbanBoard).filter_by(id=card.column.board_id, owner_id=user.id).first()
+    if not board:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    for k, v in payload.__dict__.items():
+        if v is not None:
+            setattr(card, k, v)
+    db.commit()
+    db.refresh(card)
+    return card
+
+
+def legacy_delete_card(db, user, card_id):
+    card = db.query(models.KanbanCard).filter_by(id=card_id).first()
+    if not card:
+        raise HTTPException(status_code=404, detail="Card not found")
+    board = db.query(models.KanbanBoard).filter_by(id=card.column.board_id, owner_id=user.id).first()
+    if not board:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    db.delete(card)
+    db.commit()
+
+
+def current_update_card(db, user, card_id, payload):
+    card = kanban_access.get_owned_card(card_id, db, user)
+    return kanban.update_card(payload, card, db, user)
+
+
+def measure(fn, repeat: int) -> tuple[float, float]:
+    """Mean statements and milliseconds per call; each call gets a fresh session."""
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(database.engine, "before_cursor_execute", count)
+    event.listen(database.engine, "commit", count)
+    try:
+        start = time.perf_counter()
+        for i in range(repeat):
+            with database.SessionLocal() as db:
+                fn(db, i)
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(database.engine, "before_cursor_execute", count)
+        event.remove(database.engine, "commit", count)
+    return statements / repeat, elapsed / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    n = args.repeat
+
+    with database.SessionLocal() as db:
+        user, column = seed(db)
+    column_id = column.id
+    patch = schemas.KanbanCardUpdate(priority=2, title="renamed")
+    create = schemas.KanbanCardCreate(title="card", column_id=column_id)
+
+    def card_ids(db, count):
+        return [row.id for row in db.query(models.KanbanCard.id).order_by(models.KanbanCard.id).limit(count)]
+
+    rows = []
+    legacy = measure(lambda db, i: legacy_create_card(db, user, column_id), n)
+    current = measure(lambda db, i: kanban.create_card(create, db, user), n)
+    rows.append(("POST /cards", legacy, current))
+
+    with database.SessionLocal() as db:
+        ids = card_ids(db, n)
+    legacy = measure(lambda db, i: legacy_update_card(db, user, ids[i], patch), n)
+    current = measure(lambda db, i: current_update_card(db, user, ids[i], patch), n)
+    rows.append(("PATCH /cards/{id}", legacy, current))
+
+    with database.SessionLocal() as db:
+        ids = card_ids(db, 2 * n)
+    legacy = measure(lambda db, i: legacy_delete_card(db, user, ids[i]), n)
+    current = measure(lambda db, i: kanban.delete_card(ids[n + i], db, user), n)
+    rows.append(("DELETE /cards/{id}", legacy, current))
+
+    print(f"{n} calls each on {database.engine.dialect.name}; statements include COMMIT")
+    print(f"{'call':<20} {'legacy stmts':>12} {'now stmts':>10} {'legacy ms':>10} {'now ms':>8}")
+    for label, (old_q, old_ms), (new_q, new_ms) in rows:
+        print(f"{label:<20} {old_q:>12.1f} {new_q:>10.1f} {old_ms:>10.2f} {new_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
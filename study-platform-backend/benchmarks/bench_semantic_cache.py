@@ -0,0 +1,154 @@
+"""
+Semantic tutor cache benchmark: how well the hashed embedding separates
+rewordings from different questions, and lookup cost / LSH recall as a
+topic partition grows.
+
+    python benchmarks/bench_semantic_cache.py [--sizes 200,1000,5000] [--threshold 0.85]
+
+Questions are synthetic: templates over a vocabulary of concepts. A
+"rewording" changes case, punctuation, filler words or makes a typo; a
+"different" question asks something else about the same topic. Stored
+questions in a partition differ only by a trailing "in case N", so "wrong"
+counts hits that returned the answer to a neighbouring question. Near
+misses are hand-written pairs that embed close together but ask different
+things (another number, formula or a negation); none may be a hit.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np  # noqa: E402
+
+import semantic_cache  # noqa: E402
+
+TEMPLATES = [
+    "what is {a} and how does it relate to {b}",
+    "how do I use {a} together with {b}",
+    "why would {a} be preferred over {b}",
+    "explain the difference between {a} and {b}",
+    "when does {a} fail and what does {b} do instead",
+    "give an example of {a} used inside {b}",
+]
+CONCEPTS = [
+    "closures", "recursion", "generators", "decorators", "iterators", "coroutines",
+    "hash tables", "binary trees", "heaps", "graphs", "dynamic programming", "memoization",
+    "garbage collection", "reference counting", "threads", "processes", "locks", "queues",
+    "indexes", "transactions", "joins", "normalization", "caching", "sharding",
+]
+FILLERS = ["can you ", "please ", "quick question: ", "hey, ", ""]
+# (topic, cached question, different question that must not be served its answer)
+NEAR_MISSES = [
+    ("calculus", "What is the derivative of x^2?", "What is the derivative of x^3?"),
+    ("calculus", "What is the derivative of x^2?", "What is the derivative of y^2?"),
+    ("calculus", "What is the integral of 2x + 1?", "What is the integral of 2x - 1?"),
+    ("chemistry", "Is NaCl an ionic compound?", "Is HCl an ionic compound?"),
+    ("chemistry", "Is NaCl an ionic compound?", "Is NaCl not an ionic compound?"),
+    ("chemistry", "What is the molar mass of H2O?", "What is the molar mass of CO2?"),
+    ("history", "What happened in 1914?", "What happened in 1918?"),
+    ("python", "Why is a list mutable?", "Why isn't a tuple mutable?"),
+    ("networking", "What does TCP guarantee?", "What does UDP guarantee?"),
+]
+
+
+def question(rng: random.Random) -> str:
+    a, b = rng.sample(CONCEPTS, 2)
+    return rng.choice(TEMPLATES).format(a=a, b=b)
+
+
+def reword(text: str, rng: random.Random) -> str:
+    text = rng.choice(FILLERS) + text
+    if rng.random() < 0.5:
+        text = text.capitalize()
+    if rng.random() < 0.5:
+        text += rng.choice(["?", "??", " ?", "."])
+    if rng.random() < 0.5:
+        # one swapped pair of letters
+        i = rng.randrange(1, len(text) - 2)
+        text = text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text
+
+
+def separation(rng: random.Random, threshold: float, pairs: int = 2000) -> None:
+    topic = "computer science"
+    same, different = [], []
+    for _ in range(pairs):
+        q = question(rng)
+        base = semantic_cache.embed(topic, q)
+        same.append(float(base @ semantic_cache.embed(topic, reword(q, rng))))
+        other = question(rng)
+        while other == q:
+            other = question(rng)
+        different.append(float(base @ semantic_cache.embed(topic, other)))
+    for label, values in (("rewordings", same), ("different", different)):
+        values.sort()
+        above = sum(v >= threshold for v in values) / len(values)
+        print(f"{label:<12} p5 {values[len(values) // 20]:.3f}  median {statistics.median(values):.3f}  "
+              f"p95 {values[len(values) * 19 // 20]:.3f}  >= {threshold}: {above:.1%}")
+
+
+def near_misses(threshold: float) -> None:
+    served = 0
+    for topic, cached, other in NEAR_MISSES:
+        cache = semantic_cache.SemanticCache(threshold=threshold)
+        cache.add(topic, cached, cached)
+        cosine = float(semantic_cache.embed(topic, cached) @ semantic_cache.embed(topic, other))
+        hit = cache.lookup(topic, other) is not None
+        served += hit
+        print(f"  {cosine:.3f} {'SERVED' if hit else 'miss  '} {cached!r} -> {other!r}")
+    print(f"near misses served a wrong answer: {served} of {len(NEAR_MISSES)}")
+
+
+def partition_cost(rng: random.Random, size: int, threshold: float, queries: int = 500) -> None:
+    topic = "computer science"
+    cache = semantic_cache.SemanticCache(threshold=threshold, topic_entries=size)
+    stored = []
+    while len(stored) < size:
+        q = question(rng) + f" in case {len(stored)}"
+        stored.append(q)
+        cache.add(topic, q, q)
+    partition = next(iter(cache._partitions.values()))
+    exact_hits = lsh_hits = wrong = 0
+    timings = []
+    for _ in range(queries):
+        original = rng.choice(stored)
+        q = reword(original, rng)
+        vector = semantic_cache.embed(topic, q)
+        key = semantic_cache.question_key(q)
+        same = [slot for slot, stored_key in enumerate(partition.keys) if stored_key == key]
+        exact = float(np.max(partition.vectors[same] @ vector)) if same else 0.0
+        exact_hits += exact >= threshold
+        started = time.perf_counter()
+        answer = cache.lookup(topic, q)
+        timings.append((time.perf_counter() - started) * 1e6)
+        lsh_hits += answer is not None
+        wrong += answer is not None and answer != original
+    timings.sort()
+    recall = lsh_hits / exact_hits if exact_hits else float("nan")
+    print(f"{size:>7}{statistics.median(timings):>10.0f}us{timings[int(len(timings) * 0.99)]:>9.0f}us"
+          f"{exact_hits / queries:>10.1%}{recall:>9.1%}{wrong / queries:>8.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="200,1000,5000")
+    parser.add_argument("--threshold", type=float, default=semantic_cache.SEMANTIC_CACHE_THRESHOLD)
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    print(f"cosine similarity to the original question (dim {semantic_cache.SEMANTIC_CACHE_DIM})")
+    separation(rng, args.threshold)
+    print()
+    near_misses(args.threshold)
+    print()
+    print(f"{'entries':>7}{'lookup p50':>12}{'p99':>11}{'exact hit':>10}{'recall':>9}{'wrong':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        partition_cost(rng, size, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Streak computation benchmark: legacy Python loop vs the SQL gaps-and-islands engine.
+
+    python benchmarks/bench_streaks.py [--users 20] [--logs 12000]
+
+Uses BENCH_DATABASE_URL if set (e.g. a local Postgres), otherwise a throwaway
+SQLite file. The target database is wiped and reseeded.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_streaks.db"),
+)
+
+import database  # noqa: E402
+import models  # noqa: E402
+import streaks  # noqa: E402
+
+
+def seed(db, users: int, logs_per_user: int) -> list[int]:
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    today = datetime.utcnow().date()
+    rng = random.Random(42)
+    user_ids = []
+    for n in range(users):
+        user = models.User(email=f"bench{n}@example.com", hashed_password="x", total_xp=0)
+        db.add(user)
+        db.flush()
+        user_ids.append(user.id)
+        # ~3 sessions a day over the last logs/3 days, with an active streak
+        # of random length and occasional gaps further back
+        streak = rng.randint(1, 200)
+        rows = []
+        day = today
+        while len(rows) < logs_per_user:
+            for _ in range(rng.randint(1, 5)):
+                rows.append({
+                    "user_id": user.id, "topic": f"topic-{rng.randint(1, 40)}",
+                    "hours": 1.0, "study_date": day, "focus_level": "high",
+                    "created_at": datetime.utcnow(),
+                })
+            day -= timedelta(days=1)
+            if (today - day).days > streak and rng.random() < 0.1:
+                day -= timedelta(days=1)
+        db.execute(models.StudyLog.__table__.insert(), rows[:logs_per_user])
+    db.commit()
+    return user_ids
+
+
+def legacy_streak(db, user_id: int) -> int:
+    """The pre-engine approach: pull every date over the wire and loop in Python."""
+    today = datetime.utcnow().date()
+    all_logs = (
+        db.query(models.StudyLog.study_date)
+        .filter(models.StudyLog.user_id == user_id)
+        .order_by(models.StudyLog.study_date.desc())
+        .all()
+    )
+    streak = 0
+    current_date = today
+    for d in sorted(set(row.study_date for row in all_logs), reverse=True):
+        if d == current_date or d == current_date - timedelta(days=1):
+            streak += 1
+            current_date = d
+        else:
+            break
+    return streak
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logs", type=int, default=12000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with database.SessionLocal() as db:
+        print(f"seeding {args.users} users x {args.logs} logs on {database.engine.dialect.name} ...")
+        user_ids = seed(db, args.users, args.logs)
+
+        legacy = {uid: legacy_streak(db, uid) for uid in user_ids}
+        engine = streaks.current_streaks(db, user_ids)
+        assert legacy == engine, "engine disagrees with legacy loop"
+
+        one = user_ids[0]
+        print(f"single user, legacy loop : {timed(lambda: legacy_streak(db, one), args.repeat):8.2f} ms")
+        print(f"single user, SQL engine  : {timed(lambda: streaks.current_streaks(db, [one]), args.repeat):8.2f} ms")
+        print(f"{len(user_ids)} users, legacy loop  : "
+              f"{timed(lambda: [legacy_streak(db, u) for u in user_ids], args.repeat):8.2f} ms")
+        print(f"{len(user_ids)} users, SQL engine   : "
+              f"{timed(lambda: streaks.current_streaks(db, user_ids), args.repeat):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Query-plan regression check: drives every endpoint once, records each SQL
+statement it issues and EXPLAINs it. Exits non-zero if any statement reads a
+table with a full sequential scan instead of an index.
+
+    python benchmarks/check_query_plans.py
+
+Uses BENCH_DATABASE_URL if set (e.g. a local Postgres, where sequential scans
+are disabled so the planner must show that an index is usable), otherwise a
+throwaway SQLite file. The target database is wiped and reseeded.
+"""
+import asyncio
+import os
+import re
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "query_plans.db"),
+)
+os.environ.setdefault("SECRET_KEY", "query-plan-check")
+os.environ.setdefault("AI_FAKE_MODEL", "1")
+os.environ.setdefault("AI_FAKE_FIRST_TOKEN_DELAY", "0")
+os.environ.setdefault("AI_FAKE_TOKEN_DELAY", "0")
+# queue statements are exercised directly below, not by a racing worker
+os.environ.setdefault("JOB_WORKER_IN_PROCESS", "0")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import database  # noqa: E402
+import jobs  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+
+TABLES = set(models.Base.metadata.tables)
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def seed(client: TestClient) -> dict:
+    token = client.post(
+        "/api/register", json={"email": "plans@example.com", "password": "password123"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    other = client.post(
+        "/api/register", json={"email": "other@example.com", "password": "password123"}
+    ).json()["access_token"]
+
+    for i in range(5):
+        client.post("/api/logs", headers=headers, json={
+            "topic": f"topic {i % 2}", "hours": 1.5, "focus_level": "high",
+            "study_date": str(date.today() - timedelta(days=i)), "notes": "notes",
+        })
+    client.post("/api/tutor/ask", headers=headers, json={
+        "topic": "topic 0", "question": "How does this topic work?",
+    })
+    group = client.post("/api/study-groups", headers=headers, json={"name": "plans group"}).json()
+    client.post("/api/study-groups", headers=headers, json={"name": "second group"})
+    client.post(f"/api/study-groups/{group['id']}/join", headers={"Authorization": f"Bearer {other}"})
+    board = client.post("/api/kanban/boards", headers=headers, json={"name": "board"}).json()
+    column = client.post("/api/kanban/columns", headers=headers, json={
+        "title": "todo", "board_id": board["id"],
+    }).json()
+    card = client.post("/api/kanban/cards", headers=headers, json={
+        "title": "card", "column_id": column["id"],
+    }).json()
+    other_card = client.post("/api/kanban/cards", headers=headers, json={
+        "title": "other card", "column_id": column["id"],
+    }).json()
+    other_column = client.post("/api/kanban/columns", headers=headers, json={
+        "title": "done", "board_id": board["id"],
+    }).json()
+    return {
+        "headers": headers, "group": group["id"], "board": board["id"],
+        "column": column["id"], "other_column": other_column["id"],
+        "card": card["id"], "other_card": other_card["id"],
+    }
+
+
+def exercise(client: TestClient, ctx: dict) -> None:
+    h = ctx["headers"]
+    client.get("/api/users/me", headers=h)
+    client.get("/api/users/me/stats", headers=h)
+    page = client.get("/api/logs?limit=2", headers=h).json()
+    client.get("/api/logs", headers=h, params={"limit": 2, "cursor": page["next_cursor"]})
+    client.post("/api/logs", headers=h, json={
+        "topic": "topic 9", "hours": 1, "focus_level": "low",
+        "study_date": str(date.today() - timedelta(days=30)),
+    })
+    client.post(
+        "/api/logs/import", headers={**h, "Content-Type": "text/csv"},
+        content=f"topic,hours,study_date,focus_level\ntopic 8,2,{date.today()},medium\n",
+    )
+    client.get("/api/dashboard/stats", headers=h)
+    client.post("/api/assessment/generate", headers=h, json={"topic": "topic 0"})
+    client.post("/api/tutor/ask", headers=h, json={
+        "topic": "topic 1", "question": "Why does this topic matter?",
+    })
+    page = client.get("/api/tutor/history?limit=1", headers=h).json()
+    client.get("/api/tutor/history", headers=h, params={"limit": 1, "cursor": page["next_cursor"]})
+    client.get("/api/logs/export", headers=h)
+    client.get("/api/tutor/history/export?format=csv", headers=h)
+    page = client.get("/api/study-groups?limit=1", headers=h).json()
+    if page["next_cursor"]:
+        client.get("/api/study-groups", headers=h, params={"limit": 1, "cursor": page["next_cursor"]})
+    client.get("/api/study-groups/my", headers=h)
+    client.get(f"/api/study-groups/{ctx['group']}", headers=h)
+    client.get("/api/leaderboard/global", headers=h)
+    client.get("/api/leaderboard/global?limit=1", headers=h)
+    page = client.get(f"/api/leaderboard/group/{ctx['group']}?limit=1", headers=h).json()
+    client.get(
+        f"/api/leaderboard/group/{ctx['group']}", headers=h,
+        params={"limit": 1, "cursor": page["next_cursor"]},
+    )
+    client.get("/api/kanban/boards", headers=h)
+    client.get("/api/kanban/boards", headers=h, params={"cursor": "WzBd"})
+    client.get(f"/api/kanban/boards/{ctx['board']}", headers=h)
+    client.get(f"/api/kanban/boards/{ctx['board']}/full", headers=h)
+    client.post("/api/kanban/suggest/batch", headers=h, json={"board_id": ctx["board"]})
+    client.post("/api/kanban/suggest/batch", headers=h, json={
+        "board_id": ctx["board"], "column_id": ctx["column"],
+    })
+    job = client.post("/api/jobs", headers=h, json={
+        "kind": "card_suggestion", "payload": {"title": "plan"},
+    }).json()
+    for claimed in jobs.claim("plan-check", 4):
+        asyncio.run(jobs.execute(claimed, "plan-check"))
+    jobs.requeue_expired()
+    client.get(f"/api/jobs/{job['id']}", headers=h)
+    client.get("/health/jobs")
+    client.patch(f"/api/kanban/cards/{ctx['card']}", headers=h, json={"priority": 1})
+    client.patch(f"/api/kanban/cards/{ctx['card']}", headers=h, json={"position": 1})
+    client.post("/api/kanban/moves", headers=h, json={
+        "cards": [
+            {"card_id": ctx["card"], "before_id": ctx["other_card"]},
+            {"card_id": ctx["card"], "after_id": ctx["other_card"]},
+            {"card_id": ctx["other_card"], "column_id": ctx["other_column"]},
+        ],
+        "columns": [{"column_id": ctx["other_column"], "before_id": ctx["column"]}],
+    })
+    client.delete(f"/api/kanban/cards/{ctx['card']}", headers=h)
+
+
+def explain(conn, statement: str, parameters) -> list[str]:
+    """Tables read with a full scan by this statement."""
+    if database.engine.dialect.name == "postgresql":
+        cursor = conn.connection.dbapi_connection.cursor()
+        cursor.execute("SET enable_seqscan = off")
+        if isinstance(parameters, dict):
+            cursor.execute("EXPLAIN " + statement, parameters)
+        else:
+            # asyncpg statements use $n placeholders; let the server bind them
+            cursor.execute("PREPARE plan_check AS " + statement)
+            arguments = f"({', '.join(['%s'] * len(parameters))})" if parameters else ""
+            cursor.execute("EXPLAIN EXECUTE plan_check " + arguments, tuple(parameters))
+        lines = [row[0] for row in cursor.fetchall()]
+        if not isinstance(parameters, dict):
+            cursor.execute("DEALLOCATE plan_check")
+        return [m.group(1) for line in lines for m in [POSTGRES_SCAN.search(line)] if m]
+
+    cursor = conn.connection.dbapi_connection.cursor()
+    cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+    scans = []
+    for row in cursor.fetchall():
+        m = SQLITE_SCAN.match(row[-1])
+        if m and m.group(1) in TABLES:
+            scans.append(m.group(1))
+    return scans
+
+
+def main_() -> int:
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+
+    recorded: list[tuple[str, object]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in ("SELECT", "UPDATE", "DELETE", "WITH") and not executemany:
+            recorded.append((statement, parameters))
+
+    with TestClient(main.app, raise_server_exceptions=False) as client:
+        ctx = seed(client)
+        # the async endpoints run on their own engine
+        engines = (database.engine, database.async_engine.sync_engine)
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", record)
+        try:
+            exercise(client, ctx)
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", record)
+
+    failures = []
+    seen = set()
+    with database.engine.connect() as conn:
+        for statement, parameters in recorded:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            scans = explain(conn, statement, parameters)
+            if scans:
+                failures.append((scans, statement))
+
+    print(f"{len(seen)} distinct statements checked on {database.engine.dialect.name}")
+    for scans, statement in failures:
+        print(f"\nFULL SCAN on {', '.join(sorted(set(scans)))}:\n{' '.join(statement.split())}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,115 @@
+"""
+Read-replica routing check against two SQLite "replicas" of a SQLite primary.
+
+    python benchmarks/check_read_replicas.py
+
+Replication is simulated by copying the primary over each replica with the
+SQLite backup API, only when the script says so, so the replicas lag the
+primary by as much as the check wants. Verifies that read endpoints are
+served from the (stale) replicas, that a user's own write pins their reads
+to the primary for READ_YOUR_WRITES_SECONDS, that the pin expires, that
+round-robin spreads reads evenly and that least_connections avoids a busy
+replica. Exits non-zero on the first failure.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+DIRECTORY = tempfile.mkdtemp()
+PRIMARY = os.path.join(DIRECTORY, "primary.db")
+REPLICAS = [os.path.join(DIRECTORY, f"replica{i}.db") for i in (1, 2)]
+WINDOW = 1.0
+
+os.environ["DATABASE_URL"] = "sqlite:///" + PRIMARY
+os.environ["DATABASE_READ_URLS"] = ",".join("sqlite:///" + path for path in REPLICAS)
+os.environ["READ_BALANCE"] = "round_robin"
+os.environ["READ_YOUR_WRITES_SECONDS"] = str(WINDOW)
+os.environ.setdefault("SECRET_KEY", "read-replica-check")
+os.environ.setdefault("AI_FAKE_MODEL", "1")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+
+
+def replicate() -> None:
+    source = sqlite3.connect(PRIMARY)
+    for path in REPLICAS:
+        target = sqlite3.connect(path)
+        source.backup(target)
+        target.close()
+    source.close()
+
+
+def check(condition: bool, message: str) -> None:
+    print(("ok    " if condition else "FAIL  ") + message)
+    if not condition:
+        raise SystemExit(1)
+
+
+def log_count(client: TestClient, headers: dict) -> int:
+    response = client.get("/api/logs", headers=headers, params={"limit": 100})
+    response.raise_for_status()
+    return len(response.json()["items"])
+
+
+def add_log(client: TestClient, headers: dict, topic: str) -> None:
+    client.post("/api/logs", headers=headers, json={
+        "topic": topic, "hours": 1.0, "study_date": str(date.today()), "focus_level": "high",
+    }).raise_for_status()
+
+
+def main_() -> None:
+    router = database.router
+    check(router.replicas == 2, "two replicas configured")
+    with TestClient(main.app) as client:
+        token = client.post(
+            "/api/register", json={"email": "replica@example.com", "password": "password123"}
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        add_log(client, headers, "first")
+        replicate()
+
+        time.sleep(WINDOW)
+        check(log_count(client, headers) == 1, "replica serves the replicated log")
+
+        add_log(client, headers, "second")
+        before = router.pinned
+        check(log_count(client, headers) == 2, "own write is visible right away (read from the primary)")
+        check(router.pinned == before + 1, "read was pinned to the primary")
+
+        time.sleep(WINDOW)
+        check(log_count(client, headers) == 1, "after the window reads go back to the lagging replica")
+        replicate()
+        check(log_count(client, headers) == 2, "replica catches up once replicated")
+
+        for path in ("/api/dashboard/stats", "/api/users/me/stats", "/api/kanban/boards",
+                     "/api/leaderboard/global", "/api/study-groups/my",
+                     "/api/logs/export", "/api/tutor/history/export"):
+            response = client.get(path, headers=headers)
+            check(response.status_code == 200, f"GET {path} on a replica -> {response.status_code}")
+
+        router.routed = [0] * len(router.engines)
+        for _ in range(10):
+            log_count(client, headers)
+        check(router.routed == [0, 5, 5], f"round robin splits reads evenly {router.routed}")
+
+    least = database.ReadRouter(database.DATABASE_READ_URLS, "least_connections", WINDOW)
+    with least.engines[1].connect():
+        check(least.engine_for(1) is least.engines[2], "least_connections skips the busy replica")
+    with least.engines[2].connect(), least.engines[2].connect():
+        check(least.engine_for(1) is least.engines[1], "least_connections follows the load")
+    least.note_write(1)
+    check(least.engine_for(1) is least.engines[0], "a write pins the user to the primary")
+    check(least.engine_for(2) is not least.engines[0], "other users keep reading from replicas")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,84 @@
+"""
+Tutor cache privacy check across a restart, on a throwaway SQLite database
+and the offline fake model.
+
+    python benchmarks/check_tutor_cache_warm.py
+
+One student asks a first question on a topic (no history, so the answer is
+shareable) and then a follow-up (answered with their own conversation in
+the prompt). The app is restarted with an empty tutor cache, so startup
+warms it from the conversations table. Verifies that a second student gets
+the shared answer from the cache, but that the follow-up is sent to the
+model instead of being served from the first student's history. Exits
+non-zero on the first failure.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+DIRECTORY = tempfile.mkdtemp()
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(DIRECTORY, "app.db")
+os.environ["DATABASE_READ_URLS"] = ""
+os.environ["AI_FAKE_MODEL"] = "1"
+os.environ["AI_FAKE_FIRST_TOKEN_DELAY"] = "0"
+os.environ["AI_FAKE_TOKEN_DELAY"] = "0"
+os.environ["JOB_WORKER_IN_PROCESS"] = "0"
+os.environ.setdefault("SECRET_KEY", "tutor-cache-warm-check")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import ai_service  # noqa: E402
+import database  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+import semantic_cache  # noqa: E402
+
+TOPIC = "Photosynthesis"
+FIRST = "What is the role of chlorophyll in photosynthesis?"
+FOLLOW_UP = "Can you explain the last step again more slowly?"
+
+
+def check(condition: bool, message: str) -> None:
+    print(("ok    " if condition else "FAIL  ") + message)
+    if not condition:
+        raise SystemExit(1)
+
+
+def sign_up(client: TestClient, email: str) -> dict:
+    response = client.post("/api/register", json={"email": email, "password": "password123"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def ask(client: TestClient, headers: dict, question: str) -> dict:
+    response = client.post("/api/tutor/ask", headers=headers, json={"topic": TOPIC, "question": question})
+    response.raise_for_status()
+    return response.json()
+
+
+def main_() -> None:
+    with TestClient(main.app) as client:
+        alice = sign_up(client, "alice@example.com")
+        ask(client, alice, FIRST)
+        ask(client, alice, FOLLOW_UP)
+        bob = sign_up(client, "bob@example.com")
+
+    with database.SessionLocal() as db:
+        flags = dict(db.query(models.Conversation.question, models.Conversation.used_history))
+    check(flags == {FIRST: False, FOLLOW_UP: True}, f"used_history recorded per turn {flags}")
+
+    # a restart: the in-process cache is gone and startup warms a new one
+    ai_service.tutor_cache = semantic_cache.SemanticCache()
+    with TestClient(main.app) as client:
+        check(ai_service.tutor_cache.stats()["entries"] == 1, "startup warms only the answer without history")
+        check(ask(client, bob, FIRST)["prompt_tokens"] == 0, "shared answer is served from the warmed cache")
+        check(ask(client, bob, FOLLOW_UP)["prompt_tokens"] > 0,
+              "an answer built from another student's history is not served")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,321 @@
+"""
+Read throughput at high concurrency: the hot read endpoints on the async
+engine vs the same handlers as they were on the sync session/threadpool.
+
+    python benchmarks/load_async_reads.py [--clients 500] [--seconds 15]
+
+Starts uvicorn with this module's app: the real app plus copies of the old
+sync handlers under /legacy. Each of --clients concurrent clients loops over
+logs / dashboard / full board for its own user. Reports requests/s, p50/p99
+and errors per mode. Uses BENCH_DATABASE_URL if set (e.g. a local Postgres),
+otherwise a throwaway SQLite file; the target database is wiped and reseeded.
+Pool sizes come from DB_POOL_SIZE / DB_MAX_OVERFLOW / ASYNC_DB_* as usual.
+
+With Postgres, --db-latency-ms puts a TCP proxy between the server and the
+database that delays traffic each way, to stand in for a database across a
+network instead of on the same host.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", os.getenv(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "load_async_reads.db"),
+))
+os.environ.setdefault("SECRET_KEY", "load-async-reads")
+os.environ.setdefault("AI_FAKE_MODEL", "1")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import httpx  # noqa: E402
+from fastapi import Depends, HTTPException  # noqa: E402
+from sqlalchemy.orm import Session, selectinload  # noqa: E402
+
+import auth  # noqa: E402
+import database  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+import stats  # noqa: E402
+import pagination  # noqa: E402
+
+from sqlalchemy import make_url, select  # noqa: E402
+
+app = main.app
+USERS = 50
+LOGS_PER_USER = 60
+
+
+# The read handlers as they were before the async session, minus response shaping
+
+@app.get("/legacy/logs")
+def legacy_logs(
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+    limit: int = 10,
+    cursor: str | None = None,
+):
+    logs, next_cursor = pagination.paginate(
+        db,
+        select(models.StudyLog).where(models.StudyLog.user_id == current_user.id),
+        [(models.StudyLog.study_date, True), (models.StudyLog.id, True)],
+        limit,
+        cursor,
+    )
+    return {
+        "items": [schemas.StudyLogResponse.model_validate(log) for log in logs],
+        "next_cursor": next_cursor,
+    }
+
+
+@app.get("/legacy/dashboard")
+def legacy_dashboard(
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    summary = stats.read_user_stats(db, current_user.id)
+    seven_days_ago = datetime.utcnow().date() - timedelta(days=6)
+    recent_logs = (
+        db.query(models.StudyLog)
+        .filter(
+            models.StudyLog.user_id == current_user.id,
+            models.StudyLog.study_date >= seven_days_ago,
+        )
+        .all()
+    )
+    return {
+        "total_hours": float(summary.total_hours),
+        "recent_hours": sum(log.hours for log in recent_logs),
+    }
+
+
+@app.get("/legacy/boards/{board_id}/full")
+def legacy_board_full(
+    board_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    board = (
+        db.query(models.KanbanBoard)
+        .options(
+            selectinload(models.KanbanBoard.columns)
+            .selectinload(models.KanbanColumn.cards)
+        )
+        .filter_by(id=board_id, owner_id=current_user.id)
+        .first()
+    )
+    if not board:
+        raise HTTPException(status_code=404, detail="Board not found")
+    return schemas.KanbanBoardFullResponse.model_validate(board)
+
+
+MODES = {
+    "sync": ("/legacy/logs", "/legacy/dashboard", "/legacy/boards/{board}/full"),
+    "async": ("/api/logs", "/api/dashboard/stats", "/api/kanban/boards/{board}/full"),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(client: httpx.AsyncClient) -> None:
+    for _ in range(300):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def seed(client: httpx.AsyncClient) -> list:
+    """(auth headers, board id) per user."""
+    today = date.today()
+
+    async def seed_user(i: int):
+        token = (await client.post(
+            "/api/register", json={"email": f"reader{i}@example.com", "password": "password123"}
+        )).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        body = "topic,hours,study_date,focus_level\n" + "".join(
+            f"topic {d % 7},1.5,{today - timedelta(days=d)},high\n" for d in range(LOGS_PER_USER)
+        )
+        await client.post("/api/logs/import", headers={**headers, "Content-Type": "text/csv"}, content=body)
+        board = (await client.post("/api/kanban/boards", headers=headers, json={"name": "board"})).json()
+        for title in ("todo", "doing", "done"):
+            column = (await client.post("/api/kanban/columns", headers=headers, json={
+                "title": title, "board_id": board["id"],
+            })).json()
+            for n in range(5):
+                await client.post("/api/kanban/cards", headers=headers, json={
+                    "title": f"{title} {n}", "column_id": column["id"],
+                })
+        return headers, board["id"]
+
+    # a few users at a time: the import endpoint holds a pooled connection
+    # while it waits for threadpool slots, so a flood of them can starve both
+    # (and SQLite takes one writer at a time)
+    slots = asyncio.Semaphore(1 if database.engine.dialect.name == "sqlite" else 4)
+
+    async def seed_one(i: int):
+        async with slots:
+            return await seed_user(i)
+
+    return await asyncio.gather(*[seed_one(i) for i in range(USERS)])
+
+
+async def get(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str, authorization: str) -> int:
+    """
+    One keep-alive GET on a raw connection; returns the status code. httpx
+    spends more CPU per request than the server at hundreds of open
+    connections, so the load itself is generated with bare HTTP/1.1.
+    """
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: bench\r\nAuthorization: {authorization}\r\n\r\n".encode()
+    )
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(lines[0].split()[1])
+
+
+async def drive(port: int, users: list, paths: tuple, clients: int, seconds: float) -> dict:
+    latencies: list = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(n: int):
+        nonlocal errors
+        headers, board = users[n % len(users)]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        i = n
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)].format(board=board)
+            i += 1
+            started = time.perf_counter()
+            try:
+                ok = await get(reader, writer, path, headers["Authorization"]) == 200
+            except (OSError, asyncio.IncompleteReadError):
+                ok = False
+                writer.close()
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(n) for n in range(clients)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else float("nan"),
+        "errors": errors,
+    }
+
+
+async def delay_proxy(host: str, port: int, delay: float) -> asyncio.Server:
+    """Listen on a free local port and forward to host:port, `delay` seconds late each way."""
+
+    async def pump(reader, writer):
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def deliver():
+            while True:
+                due, data = await queue.get()
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+                if not data:
+                    writer.close()
+                    return
+                writer.write(data)
+
+        delivering = asyncio.create_task(deliver())
+        while True:
+            data = await reader.read(65536)
+            await queue.put((time.monotonic() + delay, data))
+            if not data:
+                break
+        await delivering
+
+    async def handle(client_reader, client_writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+            await asyncio.gather(
+                pump(client_reader, upstream_writer), pump(upstream_reader, client_writer)
+            )
+        except (OSError, asyncio.CancelledError):
+            client_writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def run(args) -> None:
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+    proxy = None
+    if args.db_latency_ms:
+        url = make_url(database.DATABASE_URL)
+        if url.get_backend_name() != "postgresql":
+            raise SystemExit("--db-latency-ms needs a Postgres BENCH_DATABASE_URL")
+        proxy = await delay_proxy(url.host or "127.0.0.1", url.port or 5432, args.db_latency_ms / 1000)
+        proxied = url.set(host="127.0.0.1", port=proxy.sockets[0].getsockname()[1])
+        env["DATABASE_URL"] = proxied.render_as_string(hide_password=False)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "load_async_reads:app", "--port", str(port),
+         "--log-level", "warning", "--app-dir", os.path.dirname(os.path.abspath(__file__))],
+        env=env,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            await wait_ready(client)
+            users = await seed(client)
+            print(f"{database.engine.dialect.name} (+{args.db_latency_ms:g}ms each way), "
+                  f"{args.clients} clients, {args.seconds:.0f}s per mode, "
+                  f"pool {database.DB_POOL_SIZE}+{database.DB_MAX_OVERFLOW} sync / "
+                  f"{database.ASYNC_DB_POOL_SIZE}+{database.ASYNC_DB_MAX_OVERFLOW} async")
+            print(f"{'mode':<8}{'req/s':>9}{'p50':>10}{'p99':>10}{'errors':>8}")
+            for mode, paths in MODES.items():
+                await drive(port, users, paths, min(args.clients, 20), 2)  # warm up
+                result = await drive(port, users, paths, args.clients, args.seconds)
+                print(f"{mode:<8}{result['rps']:>9.1f}{result['p50']:>8.0f}ms{result['p99']:>8.0f}ms{result['errors']:>8}")
+    finally:
+        server.terminate()
+        # the server closes its pool on the way out, through the proxy on this loop
+        await asyncio.to_thread(server.wait)
+        if proxy is not None:
+            proxy.close()
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--db-latency-ms", type=float, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,154 @@
+"""
+Latency of a cheap authenticated endpoint while a storm of logins hashes
+passwords, with bcrypt on the request threadpool vs in the process pool.
+
+    python benchmarks/load_login_storm.py [--logins 400] [--concurrency 64]
+
+Starts uvicorn on a throwaway SQLite database once per mode
+(PASSWORD_HASH_WORKERS=0 is the threadpool, as login used to run), measures
+GET /api/users/me p50/p99 on its own, then again while --concurrency clients
+keep logging in. Needs httpx and uvicorn.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PASSWORD = "storm-password"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, workers: int, rounds: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL="sqlite:///" + os.path.join(tempfile.mkdtemp(), "load_login_storm.db"),
+        SECRET_KEY=os.getenv("SECRET_KEY", "load-login-storm"),
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "unused"),
+        AI_FAKE_MODEL="1",
+        PASSWORD_HASH_WORKERS=str(workers),
+        BCRYPT_ROUNDS=str(rounds),
+        PYTHONWARNINGS="ignore",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND,
+        env=env,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient) -> None:
+    for _ in range(200):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def probe(client: httpx.AsyncClient, token: str, until: asyncio.Event, samples: list) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    while not until.is_set():
+        started = time.perf_counter()
+        response = await client.get("/api/users/me", headers=headers)
+        response.raise_for_status()
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def login_storm(client: httpx.AsyncClient, emails: list, logins: int, concurrency: int) -> float:
+    remaining = iter(range(logins))
+
+    async def worker():
+        for i in remaining:
+            response = await client.post(
+                "/api/login", data={"username": emails[i % len(emails)], "password": PASSWORD}
+            )
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - started
+
+
+async def run_mode(workers: int, args) -> dict:
+    port = free_port()
+    server = start_server(port, workers, args.rounds)
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as client:
+            await wait_ready(client)
+            emails = [f"storm{i}@example.com" for i in range(args.concurrency)]
+            token = None
+            for email in emails:
+                response = await client.post("/api/register", json={"email": email, "password": PASSWORD})
+                response.raise_for_status()
+                token = token or response.json()["access_token"]
+
+            baseline: list = []
+            done = asyncio.Event()
+            probing = asyncio.create_task(probe(client, token, done, baseline))
+            await asyncio.sleep(args.baseline_seconds)
+            done.set()
+            await probing
+
+            storm: list = []
+            done = asyncio.Event()
+            probing = asyncio.create_task(probe(client, token, done, storm))
+            elapsed = await login_storm(client, emails, args.logins, args.concurrency)
+            done.set()
+            await probing
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "baseline_p50": statistics.median(baseline),
+        "baseline_p99": percentile(baseline, 99),
+        "storm_p50": statistics.median(storm),
+        "storm_p99": percentile(storm, 99),
+        "logins_per_s": args.logins / elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="process pool size for the second run")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"bcrypt cost {args.rounds}, {args.logins} logins, {args.concurrency} concurrent clients")
+    print(f"{'mode':<16}{'idle p50':>10}{'idle p99':>10}{'storm p50':>11}{'storm p99':>11}{'logins/s':>10}")
+    for label, workers in (("threadpool", 0), (f"process pool x{args.workers}", args.workers)):
+        result = asyncio.run(run_mode(workers, args))
+        print(
+            f"{label:<16}{result['baseline_p50']:>8.1f}ms{result['baseline_p99']:>8.1f}ms"
+            f"{result['storm_p50']:>9.1f}ms{result['storm_p99']:>9.1f}ms{result['logins_per_s']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
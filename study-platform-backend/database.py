@@ -1,26 +1,63 @@
+import asyncio
+import itertools
 import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy import Engine, create_engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
 
 load_dotenv()
 
-DATABASE_URL: str = os.getenv("DATABASE_URL", "")
 
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+def _normalize(url: str) -> str:
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+DATABASE_URL: str = _normalize(os.getenv("DATABASE_URL", ""))
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL must be set")
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
-    pool_recycle=300,
-    future=True
-)
+# Optional comma-separated replicas that serve the read-only endpoints
+DATABASE_READ_URLS: List[str] = [
+    _normalize(url.strip()) for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()
+]
+# How reads are spread over the replicas: round_robin or least_connections
+READ_BALANCE: str = os.getenv("READ_BALANCE", "round_robin")
+# After a user's own write their reads stay on the primary this long; keep
+# it above the replicas' worst expected lag
+READ_YOUR_WRITES_SECONDS: float = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Connection pool sizing, per process
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "300"))
+# The async engine has its own pool; it is not bounded by the request threadpool
+ASYNC_DB_POOL_SIZE: int = int(os.getenv("ASYNC_DB_POOL_SIZE", str(DB_POOL_SIZE)))
+ASYNC_DB_MAX_OVERFLOW: int = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", str(DB_MAX_OVERFLOW)))
+
+
+def _create_engine(url: str) -> Engine:
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        future=True
+    )
+
+
+engine = _create_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(
     bind=engine,
@@ -29,6 +66,42 @@ SessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+
+def async_url(url: str) -> str:
+    """The same database through its asyncio driver (asyncpg / aiosqlite)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+        # asyncpg spells libpq's sslmode as ssl
+        if "sslmode" in parsed.query:
+            parsed = parsed.difference_update_query(["sslmode"]).update_query_dict(
+                {"ssl": parsed.query["sslmode"]}
+            )
+    elif backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
+
+def _create_async_engine(url: str):
+    return create_async_engine(
+        async_url(url),
+        pool_pre_ping=True,
+        pool_size=ASYNC_DB_POOL_SIZE,
+        max_overflow=ASYNC_DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+
+async_engine = _create_async_engine(DATABASE_URL)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 class Base(DeclarativeBase):
     pass
 
@@ -37,4 +110,125 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """
+    AsyncSession on the primary. Objects must be loaded eagerly (or
+    through `await db.run_sync(...)` helpers): lazy loads are not
+    available on this session.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+class ReadRouter:
+    """
+    Chooses the database behind a read-only request: the primary while the
+    user is inside the read-your-writes window after one of their own
+    writes, otherwise a replica picked round-robin or by fewest checked-out
+    connections. With no replicas everything reads from the primary.
+    Write times are kept per process, like the leaderboard.
+    """
+
+    BALANCES = ("round_robin", "least_connections")
+
+    def __init__(self, replica_urls: List[str], balance: str = READ_BALANCE, window: float = READ_YOUR_WRITES_SECONDS):
+        if balance not in self.BALANCES:
+            raise ValueError(f"READ_BALANCE must be one of {', '.join(self.BALANCES)}")
+        self.balance = balance
+        self.window = window
+        # index 0 is always the primary
+        self.engines: List[Engine] = [engine] + [_create_engine(url) for url in replica_urls]
+        self.async_engines = [async_engine] + [_create_async_engine(url) for url in replica_urls]
+        # one slot per pooled connection: async requests queue here in arrival
+        # order instead of all interleaving on the event loop while they wait
+        self._slots = [
+            asyncio.Semaphore(ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW) for _ in self.async_engines
+        ]
+        self._active = [0] * len(self.async_engines)
+        self._turn = itertools.count()
+        self._last_write: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.routed = [0] * len(self.engines)
+        self.pinned = 0
+
+    @property
+    def replicas(self) -> int:
+        return len(self.engines) - 1
+
+    def note_write(self, user_id: int) -> None:
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._last_write[user_id] = now
+            if len(self._last_write) > 10000:
+                self._last_write = {
+                    uid: at for uid, at in self._last_write.items() if now - at < self.window
+                }
+
+    def _recently_wrote(self, user_id: int) -> bool:
+        at = self._last_write.get(user_id)
+        return at is not None and time.monotonic() - at < self.window
+
+    def pick(self, user_id: int, checked_out) -> int:
+        """Index into engines/async_engines; `checked_out(i)` reports pool usage."""
+        if not self.replicas:
+            choice = 0
+        elif self._recently_wrote(user_id):
+            self.pinned += 1
+            choice = 0
+        elif self.balance == "least_connections":
+            choice = min(range(1, len(self.engines)), key=checked_out)
+        else:
+            choice = 1 + next(self._turn) % self.replicas
+        self.routed[choice] += 1
+        return choice
+
+    def engine_for(self, user_id: int) -> Engine:
+        return self.engines[self.pick(user_id, lambda i: self.engines[i].pool.checkedout())]
+
+    def session_for(self, user_id: int) -> Session:
+        return SessionLocal(bind=self.engine_for(user_id))
+
+    @asynccontextmanager
+    async def async_session_for(self, user_id: int):
+        # count requests queued for a slot too, not just connections in use
+        choice = self.pick(user_id, lambda i: self._active[i])
+        self._active[choice] += 1
+        try:
+            async with self._slots[choice]:
+                async with AsyncSessionLocal(bind=self.async_engines[choice]) as db:
+                    yield db
+        finally:
+            self._active[choice] -= 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "replicas": self.replicas,
+            "balance": self.balance,
+            "routed": {
+                ("primary" if i == 0 else f"replica_{i}"): count for i, count in enumerate(self.routed)
+            },
+            "read_your_writes_pins": self.pinned,
+        }
+
+    async def dispose(self) -> None:
+        for replica in self.engines[1:]:
+            replica.dispose()
+        for replica in self.async_engines[1:]:
+            await replica.dispose()
+
+
+router = ReadRouter(DATABASE_READ_URLS)
+
+
+def release_connection(db) -> None:
+    """
+    End the session's current transaction so its pooled connection goes back
+    to the pool while a handler awaits slow I/O (e.g. an AI call). Loaded
+    objects stay usable because sessions do not expire on commit.
+    """
+    db.commit()
@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime
+from typing import Iterator, Optional, Sequence
+
+from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Engine, Select, select
+
+import database
+import models
+
+load_dotenv()
+
+
+# Rows fetched from the server-side cursor and encoded per chunk
+EXPORT_BATCH_ROWS: int = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def study_logs_query(user_id: int) -> Select:
+    log = models.StudyLog
+    return (
+        select(log.id, log.topic, log.hours, log.study_date, log.focus_level, log.notes, log.created_at)
+        .where(log.user_id == user_id)
+        .order_by(log.study_date, log.id)
+    )
+
+
+def conversations_query(user_id: int) -> Select:
+    conversation = models.Conversation
+    return (
+        select(
+            conversation.id,
+            conversation.topic,
+            conversation.question,
+            conversation.answer,
+            conversation.created_at,
+        )
+        .where(conversation.user_id == user_id)
+        .order_by(conversation.created_at, conversation.id)
+    )
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _encode(fmt: str, columns: Sequence[str], rows: Sequence, header: bool) -> str:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps({name: _plain(value) for name, value in zip(columns, row)}) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(columns)
+    writer.writerows([_plain(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def stream_rows(
+    statement: Select, fmt: str, compress: bool = False, engine: Optional[Engine] = None,
+) -> Iterator[bytes]:
+    """
+    Encoded chunks of a query's rows, read through a server-side cursor
+    `EXPORT_BATCH_ROWS` at a time as plain tuples, so memory stays flat
+    however many rows there are. Uses its own connection (on `engine`, the
+    primary by default), held only while the response streams.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+
+    def emit(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    with (engine or database.engine).connect() as conn:
+        result = conn.execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_ROWS
+        ).execute(statement)
+        columns = list(result.keys())
+        header = fmt == "csv"
+        for rows in result.partitions():
+            chunk = emit(_encode(fmt, columns, rows, header))
+            header = False
+            if chunk:
+                yield chunk
+        if header:
+            # no rows: a CSV still gets its header line
+            yield emit(_encode(fmt, columns, [], True))
+    if compressor:
+        yield compressor.flush()
+
+
+def export_response(
+    statement: Select,
+    fmt: str,
+    filename: str,
+    accept_encoding: str | None,
+    engine: Optional[Engine] = None,
+) -> StreamingResponse:
+    """Chunked download of a query, gzip-encoded when the client accepts it."""
+    compress = "gzip" in (accept_encoding or "").lower()
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(
+        stream_rows(statement, fmt, compress, engine),
+        media_type=MEDIA_TYPES[fmt],
+        headers=headers,
+    )
@@ -0,0 +1,497 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import multiprocessing
+import os
+import random
+import secrets
+import signal
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+import ai_service
+import auth
+import database
+import kanban_access
+import models
+import rate_limit
+import schemas
+import stats
+import tutor_context
+
+load_dotenv()
+
+
+# Attempts per job before it is marked failed
+JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# First retry delay; doubled per attempt, with +/-50% jitter
+JOB_RETRY_BASE_SECONDS: float = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+# A running job whose worker has not finished it by then is handed out again
+JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+# Per user: jobs running at once, and jobs waiting or running before submit refuses
+JOB_USER_CONCURRENCY: int = int(os.getenv("JOB_USER_CONCURRENCY", "2"))
+JOB_USER_QUEUE_LIMIT: int = int(os.getenv("JOB_USER_QUEUE_LIMIT", "20"))
+# Jobs one worker process runs concurrently, and how often an idle worker polls
+JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_POLL_SECONDS: float = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# Run a worker inside each web process; 0 leaves jobs to `python jobs.py work`
+JOB_WORKER_IN_PROCESS: int = int(os.getenv("JOB_WORKER_IN_PROCESS", "1"))
+# Attempts to deliver a finished job to its webhook_url
+JOB_WEBHOOK_ATTEMPTS: int = int(os.getenv("JOB_WEBHOOK_ATTEMPTS", "3"))
+# Refuse plain-http webhooks (set in production)
+JOB_WEBHOOK_HTTPS_ONLY: int = int(os.getenv("JOB_WEBHOOK_HTTPS_ONLY", "0"))
+# Let webhooks reach loopback/private addresses (local development only)
+JOB_WEBHOOK_ALLOW_PRIVATE: int = int(os.getenv("JOB_WEBHOOK_ALLOW_PRIVATE", "0"))
+
+jobs = models.Job.__table__
+
+router = APIRouter()
+
+
+class PermanentJobError(Exception):
+    """The job can never succeed (bad payload, missing board, ...); not retried."""
+
+
+# Handlers: (user_id, validated payload) -> JSON-able result
+
+async def _run_tutor(user_id: int, request: schemas.ConversationCreate) -> Any:
+    history = await run_in_threadpool(_with_session, tutor_context.load, user_id, request.topic)
+    reply = await ai_service.generate_tutor_response(request.topic, request.question, history)
+    conversation = await run_in_threadpool(
+        _with_session, tutor_context.save_turn, user_id, request.topic, request.question, reply
+    )
+    tutor_context.schedule_refresh(user_id, request.topic)
+    return schemas.ConversationResponse.model_validate(conversation).model_dump(mode="json")
+
+
+async def _run_assessment(user_id: int, request: schemas.AssessmentRequest) -> Any:
+    notes = await run_in_threadpool(_with_session, stats.latest_notes, user_id, request.topic)
+    questions = await ai_service.generate_assessment_questions(request.topic, notes)
+    return {"topic": request.topic, "generated_at": datetime.utcnow().isoformat(), "questions": questions}
+
+
+async def _run_card_suggestion(user_id: int, request: schemas.KanbanSuggestionRequest) -> Any:
+    return await ai_service.generate_card_suggestion(
+        title=request.title, description=request.description or "", due_date=request.due_date,
+    )
+
+
+async def _run_card_suggestions(user_id: int, request: schemas.KanbanBatchSuggestRequest) -> Any:
+    cards = await run_in_threadpool(
+        _with_session, kanban_access.cards_to_suggest, user_id, request.board_id, request.column_id
+    )
+    if cards is None:
+        raise PermanentJobError("Board not found")
+    results: List[dict] = []
+    async for batch in ai_service.generate_card_suggestions(cards):
+        results.extend(batch)
+    return results
+
+
+# Jobs draw on the same per-user buckets as the inline endpoints
+RATE_LIMIT_BUCKETS: Dict[schemas.JobKind, str] = {
+    schemas.JobKind.tutor: "tutor",
+    schemas.JobKind.assessment: "assessment",
+    schemas.JobKind.card_suggestion: "kanban_suggest",
+    schemas.JobKind.card_suggestions: "kanban_suggest",
+}
+
+HANDLERS: Dict[schemas.JobKind, tuple] = {
+    schemas.JobKind.tutor: (schemas.ConversationCreate, _run_tutor),
+    schemas.JobKind.assessment: (schemas.AssessmentRequest, _run_assessment),
+    schemas.JobKind.card_suggestion: (schemas.KanbanSuggestionRequest, _run_card_suggestion),
+    schemas.JobKind.card_suggestions: (schemas.KanbanBatchSuggestRequest, _run_card_suggestions),
+}
+
+
+def _with_session(fn: Callable, *args):
+    with database.SessionLocal() as db:
+        return fn(db, *args)
+
+
+def webhook_address(url: str) -> Tuple[str, str]:
+    """
+    (host, IP to connect to) for a webhook URL. Raises ValueError for other
+    schemes and for hosts that resolve to anything but public addresses:
+    loopback, private ranges, link-local (cloud metadata), multicast, ...
+    Every address the name resolves to is checked, and delivery connects to
+    the checked one, so a DNS answer cannot change in between.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in (("https",) if JOB_WEBHOOK_HTTPS_ONLY else ("http", "https")):
+        raise ValueError("webhook_url must be an https URL" if JOB_WEBHOOK_HTTPS_ONLY else "webhook_url must be http(s)")
+    if not parts.hostname:
+        raise ValueError("webhook_url has no host")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"webhook_url host cannot be resolved: {e}") from e
+    addresses = []
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global and not JOB_WEBHOOK_ALLOW_PRIVATE:
+            raise ValueError("webhook_url must point to a public address")
+        addresses.append(str(address))
+    return parts.hostname, addresses[0]
+
+
+def _pinned(url: str, ip: str) -> Tuple[str, str]:
+    """(`url` with its host replaced by the already-checked IP, Host header for it)."""
+    parts = urlsplit(url)
+    port = f":{parts.port}" if parts.port else ""
+    userinfo = parts.netloc.rpartition("@")[0]
+    netloc = (userinfo + "@" if userinfo else "") + (f"[{ip}]" if ":" in ip else ip) + port
+    return parts._replace(netloc=netloc).geturl(), parts.hostname + port
+
+
+# Queue operations, each in its own short transaction
+
+def submit(db: Session, user_id: int, job: schemas.JobCreate) -> models.Job:
+    """Validate and enqueue a job. Raises ValueError (bad payload) or LookupError (user's queue full)."""
+    request_schema, _ = HANDLERS[job.kind]
+    try:
+        payload = request_schema.model_validate(job.payload)
+    except ValidationError as e:
+        raise ValueError(e.errors(include_url=False, include_context=False)) from e
+    if job.webhook_url:
+        webhook_address(job.webhook_url)
+    pending = db.scalar(
+        select(func.count())
+        .select_from(jobs)
+        .where(jobs.c.user_id == user_id, jobs.c.status.in_(("queued", "running")))
+    )
+    if pending >= JOB_USER_QUEUE_LIMIT:
+        raise LookupError(f"At most {JOB_USER_QUEUE_LIMIT} unfinished jobs per user")
+    row = models.Job(
+        user_id=user_id,
+        kind=job.kind.value,
+        payload=payload.model_dump_json(),
+        max_attempts=JOB_MAX_ATTEMPTS,
+        webhook_url=job.webhook_url,
+        webhook_secret=secrets.token_urlsafe(32) if job.webhook_url else None,
+    )
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    return row
+
+
+def claim(worker_id: str, limit: int) -> List[models.Job]:
+    """
+    Lease up to `limit` due jobs to this worker, skipping users already at
+    JOB_USER_CONCURRENCY running jobs. Each job is taken with a conditional
+    UPDATE, so two workers never run the same job; on Postgres candidates
+    are also locked with SKIP LOCKED so workers do not queue behind each
+    other. The per-user cap is checked at claim time and can be exceeded
+    briefly when several workers claim at once.
+    """
+    now = datetime.utcnow()
+    with database.SessionLocal() as db:
+        busy_users = (
+            select(jobs.c.user_id)
+            .where(jobs.c.status == "running")
+            .group_by(jobs.c.user_id)
+            .having(func.count() >= JOB_USER_CONCURRENCY)
+        )
+        candidates = db.execute(
+            select(jobs.c.id, jobs.c.user_id)
+            .where(
+                jobs.c.status == "queued",
+                jobs.c.run_after <= now,
+                jobs.c.user_id.not_in(busy_users),
+            )
+            .order_by(jobs.c.run_after, jobs.c.id)
+            .limit(limit * 4)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+        claimed: List[int] = []
+        per_user: Dict[int, int] = {}
+        for job_id, user_id in candidates:
+            if len(claimed) >= limit or per_user.get(user_id, 0) >= JOB_USER_CONCURRENCY:
+                continue
+            taken = db.execute(
+                update(jobs)
+                .where(jobs.c.id == job_id, jobs.c.status == "queued")
+                .values(
+                    status="running",
+                    attempts=jobs.c.attempts + 1,
+                    locked_by=worker_id,
+                    locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                )
+            ).rowcount
+            if taken:
+                claimed.append(job_id)
+                per_user[user_id] = per_user.get(user_id, 0) + 1
+        db.commit()
+        if not claimed:
+            return []
+        return db.scalars(select(models.Job).where(models.Job.id.in_(claimed)).order_by(models.Job.id)).all()
+
+
+def _finish(job_id: int, worker_id: str, **values) -> bool:
+    """Record an outcome, unless the lease was lost to another worker meanwhile."""
+    with database.SessionLocal() as db:
+        done = db.execute(
+            update(jobs)
+            .where(jobs.c.id == job_id, jobs.c.status == "running", jobs.c.locked_by == worker_id)
+            .values(locked_by=None, locked_until=None, **values)
+        ).rowcount
+        db.commit()
+        return bool(done)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter: base * 2^(attempts-1) * [0.5, 1.5)."""
+    return JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1) * random.uniform(0.5, 1.5)
+
+
+def requeue_expired() -> int:
+    """Hand out again jobs whose worker died (lease expired); fail those out of attempts."""
+    now = datetime.utcnow()
+    with database.SessionLocal() as db:
+        expired = (jobs.c.status == "running") & (jobs.c.locked_until < now)
+        failed = db.execute(
+            update(jobs)
+            .where(expired, jobs.c.attempts >= jobs.c.max_attempts)
+            .values(status="failed", error="Worker lease expired", locked_by=None,
+                    locked_until=None, finished_at=now)
+        ).rowcount
+        requeued = db.execute(
+            update(jobs)
+            .where(expired)
+            .values(status="queued", run_after=now, locked_by=None, locked_until=None)
+        ).rowcount
+        db.commit()
+        return failed + requeued
+
+
+async def _deliver(job_id: int) -> None:
+    """POST the finished job to its webhook, signed with HMAC-SHA256 of the body under the job's secret."""
+    job = await run_in_threadpool(_with_session, lambda db: db.get(models.Job, job_id))
+    if job is None or not job.webhook_url or not job.webhook_secret:
+        return
+    body = schemas.JobResponse.model_validate(job).model_dump_json().encode()
+    signature = hmac.new(job.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+    headers = {"Content-Type": "application/json", "X-Job-Signature": f"sha256={signature}"}
+    # redirects are not followed: they could lead anywhere
+    async with httpx.AsyncClient(timeout=10, follow_redirects=False) as client:
+        for attempt in range(1, JOB_WEBHOOK_ATTEMPTS + 1):
+            try:
+                # checked again at delivery, the name may resolve elsewhere by now
+                host, ip = await run_in_threadpool(webhook_address, job.webhook_url)
+                url, host_header = _pinned(job.webhook_url, ip)
+                response = await client.post(
+                    url,
+                    content=body,
+                    headers={**headers, "Host": host_header},
+                    extensions={"sni_hostname": host},
+                )
+                if response.status_code < 500:
+                    return
+            except ValueError as e:
+                print(f"Note: webhook for job {job_id} refused: {e}")
+                return
+            except httpx.HTTPError:
+                pass
+            if attempt < JOB_WEBHOOK_ATTEMPTS:
+                await asyncio.sleep(retry_delay(attempt))
+    print(f"Note: webhook for job {job_id} was not delivered")
+
+
+async def execute(job: models.Job, worker_id: str) -> None:
+    request_schema, handler = HANDLERS[schemas.JobKind(job.kind)]
+    try:
+        result = await handler(job.user_id, request_schema.model_validate_json(job.payload))
+    except asyncio.CancelledError:
+        # shutting down: let the job run again right away elsewhere
+        await run_in_threadpool(
+            _finish, job.id, worker_id, status="queued", run_after=datetime.utcnow(),
+            attempts=job.attempts - 1,
+        )
+        raise
+    except (PermanentJobError, ValidationError) as e:
+        finished = await run_in_threadpool(
+            _finish, job.id, worker_id, status="failed", error=str(e), finished_at=datetime.utcnow()
+        )
+    except Exception as e:
+        if job.attempts >= job.max_attempts:
+            finished = await run_in_threadpool(
+                _finish, job.id, worker_id, status="failed", error=str(e), finished_at=datetime.utcnow()
+            )
+        else:
+            delay = retry_delay(job.attempts)
+            if isinstance(e, ai_service.AIUnavailableError):
+                # no point retrying before the circuit breaker lets calls through
+                delay = max(delay, e.retry_after)
+            await run_in_threadpool(
+                _finish, job.id, worker_id, status="queued", error=str(e),
+                run_after=datetime.utcnow() + timedelta(seconds=delay),
+            )
+            return
+    else:
+        finished = await run_in_threadpool(
+            _finish, job.id, worker_id, status="succeeded", result=json.dumps(result),
+            error=None, finished_at=datetime.utcnow(),
+        )
+    if finished and job.webhook_url:
+        await _deliver(job.id)
+
+
+async def work(concurrency: int = JOB_WORKER_CONCURRENCY, stop: Optional[asyncio.Event] = None) -> None:
+    """Worker loop: claim due jobs while there is room, run them concurrently."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    running: set = set()
+    stop = stop or asyncio.Event()
+    next_sweep = 0.0
+    loop = asyncio.get_running_loop()
+    try:
+        while not stop.is_set():
+            if loop.time() >= next_sweep:
+                await run_in_threadpool(requeue_expired)
+                next_sweep = loop.time() + min(60, JOB_LEASE_SECONDS / 2)
+            claimed = []
+            if len(running) < concurrency:
+                claimed = await run_in_threadpool(claim, worker_id, concurrency - len(running))
+            for job in claimed:
+                task = asyncio.create_task(execute(job, worker_id))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            if not claimed:
+                try:
+                    await asyncio.wait_for(stop.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        for task in list(running):
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+def status_counts() -> dict:
+    """Job counts by status, for /health/jobs."""
+    with database.SessionLocal() as db:
+        counts = dict(db.execute(select(jobs.c.status, func.count()).group_by(jobs.c.status)).all())
+    return {state: counts.get(state, 0) for state in ("queued", "running", "succeeded", "failed")}
+
+
+_stop: Optional[asyncio.Event] = None
+
+
+async def run_in_process() -> None:
+    """Background task for the web app (JOB_WORKER_IN_PROCESS=1)."""
+    global _stop
+    _stop = asyncio.Event()
+    try:
+        await work(stop=_stop)
+    except Exception as e:
+        print(f"Note: in-process job worker stopped: {e}")
+
+
+def stop_in_process() -> None:
+    if _stop is not None:
+        _stop.set()
+
+
+# HTTP API
+
+@router.post("", response_model=schemas.JobCreated, status_code=status.HTTP_202_ACCEPTED)
+def submit_job(
+    job: schemas.JobCreate,
+    response: Response,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """
+    Queue a tutor answer, assessment or card suggestion(s). `payload` is
+    the body the matching inline endpoint takes. Poll GET /api/jobs/{id}
+    or pass `webhook_url` to have the finished job POSTed there, signed
+    with X-Job-Signature: sha256=HMAC-SHA256 of the body keyed with the
+    `webhook_secret` returned here (and nowhere else).
+    """
+    wait = rate_limit.limiter.check(current_user.id, RATE_LIMIT_BUCKETS[job.kind])
+    if wait is not None:
+        retry_after = rate_limit.retry_after_header(wait)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded, retry in {retry_after} seconds",
+            headers={"Retry-After": retry_after},
+        )
+    try:
+        row = submit(db, current_user.id, job)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=e.args[0])
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    response.headers["Location"] = f"/api/jobs/{row.id}"
+    return row
+
+
+@router.get("/{job_id}", response_model=schemas.JobResponse)
+def get_job(
+    job_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    job = db.scalar(select(models.Job).where(models.Job.id == job_id, models.Job.user_id == current_user.id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _work_process(concurrency: int) -> None:
+    async def main():
+        # SIGTERM/SIGINT: stop claiming, put running jobs back, exit
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        await work(concurrency, stop)
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background AI job workers")
+    parser.add_argument("command", choices=["work", "requeue-expired"])
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY,
+                        help="jobs each process runs at once")
+    args = parser.parse_args()
+
+    if args.command == "requeue-expired":
+        print(f"✓ Requeued or failed {requeue_expired()} expired jobs")
+    elif args.processes <= 1:
+        _work_process(args.concurrency)
+    else:
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=_work_process, args=(args.concurrency,)) for _ in range(args.processes)]
+        for process in workers:
+            process.start()
+
+        def forward(signum, frame):
+            for process in workers:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, forward)
+        for process in workers:
+            process.join()
@@ -1,42 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+import hashlib
+import json
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime
 
-import models, schemas, database, ai_service, auth
+import models, schemas, database, ai_service, auth, kanban_access, pagination, ranking
 
 router = APIRouter()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
-
-
-def get_db():
-    return database.get_db()
-
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    from jose import JWTError, jwt
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid or expired token",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        email: str | None = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    user = db.query(models.User).filter_by(email=email).first()
-    if not user:
-        raise credentials_exception
-    return user
-
-
 @router.post("/boards", response_model=schemas.KanbanBoardResponse, status_code=status.HTTP_201_CREATED)
-def create_board(board: schemas.KanbanBoardCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
+def create_board(board: schemas.KanbanBoardCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     new = models.KanbanBoard(name=board.name, owner_id=current_user.id)
     db.add(new)
     db.commit()
@@ -44,89 +21,308 @@ def create_board(board: schemas.KanbanBoardCreate, db: Session = Depends(databas
     return new
 
 
-@router.get("/boards")
-def list_boards(db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
-    return db.query(models.KanbanBoard).filter_by(owner_id=current_user.id).all()
+@router.get("/boards", response_model=schemas.Page[schemas.KanbanBoardResponse])
+async def list_boards(limit: int = 50, cursor: str | None = None, db: AsyncSession = Depends(auth.get_async_read_db), current_user: models.User = Depends(auth.get_current_user_async)):
+    boards, next_cursor = await pagination.paginate_async(
+        db,
+        select(models.KanbanBoard).where(models.KanbanBoard.owner_id == current_user.id),
+        [(models.KanbanBoard.id, False)],
+        limit,
+        cursor,
+    )
+    return {"items": boards, "next_cursor": next_cursor}
 
 
 @router.get("/boards/{board_id}")
-def get_board(board_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
-    board = db.query(models.KanbanBoard).filter_by(id=board_id, owner_id=current_user.id).first()
+async def get_board(board: models.KanbanBoard = Depends(kanban_access.get_owned_board)):
+    return board
+
+
+async def _board_etag(db: AsyncSession, board_id: int, owner_id: int) -> str | None:
+    """
+    Fingerprint of a board and everything on it from one aggregate query,
+    or None if the user owns no such board. Edits and moves bump the
+    columns' and cards' updated_at; adds and deletes change counts or id sums.
+    """
+    column = models.KanbanColumn
+    card = models.KanbanCard
+    columns = (
+        select(
+            func.count(column.id).label("columns"),
+            func.coalesce(func.sum(column.id), 0).label("column_ids"),
+            func.coalesce(func.sum(func.length(column.title)), 0).label("column_titles"),
+            func.max(column.updated_at).label("columns_updated_at"),
+        )
+        .where(column.board_id == board_id)
+        .subquery()
+    )
+    cards = (
+        select(
+            func.count(card.id).label("cards"),
+            func.coalesce(func.sum(card.id), 0).label("card_ids"),
+            func.max(card.updated_at).label("cards_updated_at"),
+        )
+        .join(column, card.column_id == column.id)
+        .where(column.board_id == board_id)
+        .subquery()
+    )
+    row = (await db.execute(
+        select(models.KanbanBoard.name, columns, cards)
+        .where(models.KanbanBoard.id == board_id, models.KanbanBoard.owner_id == owner_id)
+    )).first()
+    if row is None:
+        return None
+    raw = repr((board_id, *row))
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def _etag_matches(etag: str, if_none_match: str | None) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+@router.get("/boards/{board_id}/full", response_model=schemas.KanbanBoardFullResponse)
+async def get_board_full(
+    board_id: int,
+    db: AsyncSession = Depends(auth.get_async_read_db),
+    current_user: models.User = Depends(auth.get_current_user_async),
+    if_none_match: str | None = Header(None),
+):
+    """
+    Board with its ordered columns and cards in a fixed number of queries.
+    Send the returned ETag back as If-None-Match to get a 304 while unchanged.
+    """
+    etag = await _board_etag(db, board_id, current_user.id)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="Board not found")
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(etag, if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    board = await db.scalar(
+        select(models.KanbanBoard)
+        .options(
+            selectinload(models.KanbanBoard.columns)
+            .selectinload(models.KanbanColumn.cards)
+        )
+        .where(models.KanbanBoard.id == board_id, models.KanbanBoard.owner_id == current_user.id)
+        .limit(1)
+    )
     if not board:
         raise HTTPException(status_code=404, detail="Board not found")
-    return board
+    payload = schemas.KanbanBoardFullResponse.model_validate(board)
+    return Response(
+        content=payload.model_dump_json(),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def _parent(model):
+    return model.column_id if model is models.KanbanCard else model.board_id
+
+
+def _rank_slot(db: Session, model, parent_id: int, exclude_id: int | None = None, after=None, before=None) -> str:
+    """
+    Rank key for a card or column landing just below `after` and just above
+    `before` in its list; a missing side is looked up (one indexed query),
+    and with neither given the item goes to the end. Raises ValueError if
+    the neighbours are out of order.
+    """
+    siblings = select(model.rank).where(_parent(model) == parent_id, model.rank.is_not(None))
+    if exclude_id is not None:
+        siblings = siblings.where(model.id != exclude_id)
+    if after is not None and before is not None:
+        lower, upper = after.rank, before.rank
+    elif after is not None:
+        lower = after.rank
+        upper = db.execute(siblings.where(model.rank > lower).order_by(model.rank).limit(1)).scalar()
+    elif before is not None:
+        upper = before.rank
+        lower = db.execute(siblings.where(model.rank < upper).order_by(model.rank.desc()).limit(1)).scalar()
+    else:
+        lower = db.execute(siblings.order_by(model.rank.desc()).limit(1)).scalar()
+        upper = None
+    return ranking.rank_between(lower, upper)
+
+
+def _rank_at_index(db: Session, column_id: int, card_id: int, index: int | None) -> str:
+    """Rank key that puts a card at 0-based `index` among the column's other cards."""
+    if index is None:
+        return _rank_slot(db, models.KanbanCard, column_id, card_id)
+    card = models.KanbanCard
+    ranks = db.execute(
+        select(card.rank)
+        .where(card.column_id == column_id, card.id != card_id, card.rank.is_not(None))
+        .order_by(card.rank, card.id)
+        .offset(max(index - 1, 0))
+        .limit(2)
+    ).scalars().all()
+    if index <= 0:
+        return ranking.rank_between(None, ranks[0] if ranks else None)
+    if not ranks:
+        return _rank_slot(db, models.KanbanCard, column_id, card_id)
+    return ranking.rank_between(ranks[0], ranks[1] if len(ranks) > 1 else None)
 
 
 @router.post("/columns", response_model=schemas.KanbanColumnResponse, status_code=status.HTTP_201_CREATED)
-def create_column(col: schemas.KanbanColumnCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
-    # ensure board belongs to user
-    board = db.query(models.KanbanBoard).filter_by(id=col.board_id, owner_id=current_user.id).first()
-    if not board:
+def create_column(col: schemas.KanbanColumnCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if kanban_access.owned_board(db, col.board_id, current_user.id) is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    new = models.KanbanColumn(title=col.title, board_id=col.board_id)
+    new = models.KanbanColumn(
+        title=col.title,
+        board_id=col.board_id,
+        rank=_rank_slot(db, models.KanbanColumn, col.board_id),
+    )
     db.add(new)
     db.commit()
-    db.refresh(new)
     return new
 
 
 @router.post("/cards", response_model=schemas.KanbanCardResponse, status_code=status.HTTP_201_CREATED)
-def create_card(card: schemas.KanbanCardCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
-    # verify column belongs to board owned by user
-    col = db.query(models.KanbanColumn).filter_by(id=card.column_id).first()
-    if not col:
+def create_card(card: schemas.KanbanCardCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if kanban_access.owned_column(db, card.column_id, current_user.id) is None:
         raise HTTPException(status_code=404, detail="Column not found")
-    board = db.query(models.KanbanBoard).filter_by(id=col.board_id, owner_id=current_user.id).first()
-    if not board:
-        raise HTTPException(status_code=403, detail="Not allowed")
     new = models.KanbanCard(
         title=card.title,
         description=card.description,
         due_date=card.due_date,
         priority=card.priority or 3,
         column_id=card.column_id,
+        rank=_rank_slot(db, models.KanbanCard, card.column_id),
     )
     db.add(new)
     db.commit()
-    db.refresh(new)
     return new
 
 
 @router.patch("/cards/{card_id}", response_model=schemas.KanbanCardResponse)
-def update_card(card_id: int, payload: schemas.KanbanCardUpdate, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
-    card = db.query(models.KanbanCard).filter_by(id=card_id).first()
-    if not card:
-        raise HTTPException(status_code=404, detail="Card not found")
-    # ensure user owns the board
-    board = db.query(models.KanbanBoard).filter_by(id=card.column.board_id, owner_id=current_user.id).first()
-    if not board:
-        raise HTTPException(status_code=403, detail="Not allowed")
-    for k, v in payload.__dict__.items():
-        if v is not None:
-            setattr(card, k, v)
+def update_card(payload: schemas.KanbanCardUpdate, card: models.KanbanCard = Depends(kanban_access.get_owned_card), db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if payload.column_id is not None and payload.column_id != card.column_id:
+        target = kanban_access.owned_column(db, payload.column_id, current_user.id)
+        if target is None or target.board_id != card.column.board_id:
+            raise HTTPException(status_code=404, detail="Column not found")
+    updates = payload.model_dump(exclude_none=True)
+    if "column_id" in updates or "position" in updates:
+        # old clients reorder by index; translate that to a single rank change
+        # and keep the index out of the stored fields
+        column_id = updates.pop("column_id", card.column_id)
+        position = updates.pop("position", None)
+        try:
+            card.rank = _rank_at_index(db, column_id, card.id, position)
+        except ValueError:
+            raise HTTPException(status_code=409, detail="Cards are out of order; reload the board")
+        card.column_id = column_id
+    for k, v in updates.items():
+        setattr(card, k, v)
     db.commit()
-    db.refresh(card)
     return card
 
 
 @router.delete("/cards/{card_id}")
-def delete_card(card_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
-    card = db.query(models.KanbanCard).filter_by(id=card_id).first()
-    if not card:
+def delete_card(card_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if not kanban_access.delete_owned_card(db, card_id, current_user.id):
         raise HTTPException(status_code=404, detail="Card not found")
-    board = db.query(models.KanbanBoard).filter_by(id=card.column.board_id, owner_id=current_user.id).first()
-    if not board:
-        raise HTTPException(status_code=403, detail="Not allowed")
-    db.delete(card)
     db.commit()
     return {"deleted": True}
 
 
-@router.post("/suggest", response_model=schemas.KanbanSuggestionResponse)
-def suggest_card(payload: dict):
-    title = payload.get("title", "")
-    description = payload.get("description", "")
-    due = payload.get("due_date")
+@router.post("/moves", response_model=schemas.KanbanMoveResponse)
+def move_items(payload: schemas.KanbanMoveRequest, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Apply a batch of card and column moves in one transaction, in order.
+    Each move names the neighbours the item lands between and rewrites only
+    that item's rank key, so siblings are never renumbered.
+    """
+    card_ids = {
+        item_id
+        for move in payload.cards
+        for item_id in (move.card_id, move.after_id, move.before_id)
+        if item_id is not None
+    }
+    column_ids = {move.column_id for move in payload.cards if move.column_id is not None} | {
+        item_id
+        for move in payload.columns
+        for item_id in (move.column_id, move.after_id, move.before_id)
+        if item_id is not None
+    }
+    cards = kanban_access.owned_cards(db, card_ids, current_user.id)
+    columns = kanban_access.owned_columns(db, column_ids, current_user.id)
+    if card_ids - cards.keys():
+        raise HTTPException(status_code=404, detail="Card not found")
+    if column_ids - columns.keys():
+        raise HTTPException(status_code=404, detail="Column not found")
 
-    suggestion = ai_service.generate_card_suggestion(title=title, description=description, due_date=due)
+    def neighbour(items: dict, item_id: int | None, moving_id: int, parent_id: int, parent_attr: str):
+        if item_id is None:
+            return None
+        item = items[item_id]
+        if item_id == moving_id or getattr(item, parent_attr) != parent_id:
+            raise HTTPException(status_code=400, detail=f"Item {item_id} is not a neighbour in the target list")
+        return item
+
+    try:
+        for move in payload.cards:
+            card = cards[move.card_id]
+            column_id = move.column_id or card.column_id
+            if move.column_id is not None and columns[column_id].board_id != card.column.board_id:
+                raise HTTPException(status_code=400, detail="Cards can only move within their board")
+            after = neighbour(cards, move.after_id, card.id, column_id, "column_id")
+            before = neighbour(cards, move.before_id, card.id, column_id, "column_id")
+            db.flush()  # earlier moves in the batch must be visible to neighbour lookups
+            card.rank = _rank_slot(db, models.KanbanCard, column_id, card.id, after, before)
+            card.column_id = column_id
+
+        for move in payload.columns:
+            column = columns[move.column_id]
+            after = neighbour(columns, move.after_id, column.id, column.board_id, "board_id")
+            before = neighbour(columns, move.before_id, column.id, column.board_id, "board_id")
+            db.flush()
+            column.rank = _rank_slot(db, models.KanbanColumn, column.board_id, column.id, after, before)
+    except ValueError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Neighbours are out of order; reload the board")
+
+    db.commit()
+    return {
+        "cards": [cards[card_id] for card_id in dict.fromkeys(move.card_id for move in payload.cards)],
+        "columns": [columns[column_id] for column_id in dict.fromkeys(move.column_id for move in payload.columns)],
+    }
+
+
+@router.post("/suggest", response_model=schemas.KanbanSuggestionResponse)
+async def suggest_card(payload: schemas.KanbanSuggestionRequest, current_user: models.User = Depends(auth.get_current_user_async)):
+    try:
+        suggestion = await ai_service.generate_card_suggestion(
+            title=payload.title, description=payload.description or "", due_date=payload.due_date,
+        )
+    except ai_service.AIUnavailableError:
+        raise
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Could not generate a suggestion, please try again",
+        )
     return suggestion
+
+
+@router.post("/suggest/batch")
+def suggest_cards(payload: schemas.KanbanBatchSuggestRequest, db: Session = Depends(auth.get_read_db), current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Suggestions for every card on a board, or on one of its columns, in a
+    handful of model calls. Streams NDJSON, one line per card
+    ({"card_id", "suggested_title", ...} or {"card_id", "error"}), as each
+    batch of cards completes.
+    """
+    cards = kanban_access.cards_to_suggest(db, current_user.id, payload.board_id, payload.column_id)
+    if cards is None:
+        raise HTTPException(status_code=404, detail="Board not found")
+    database.release_connection(db)
+
+    async def lines():
+        async for batch in ai_service.generate_card_suggestions(cards):
+            yield "".join(json.dumps(item) + "\n" for item in batch)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,135 @@
+from typing import Dict, Iterable
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import delete, exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, contains_eager
+
+import auth
+import database
+import models
+
+Board = models.KanbanBoard
+Column = models.KanbanColumn
+Card = models.KanbanCard
+
+# Each helper checks "belongs to a board owned by the user" in the same
+# statement that loads or changes the object, so authorizing a mutation
+# costs no extra round-trips. Objects the user does not own look missing.
+
+
+def _board_owned_by(user_id: int, board_id_column):
+    return exists().where(Board.id == board_id_column, Board.owner_id == user_id)
+
+
+def _select_owned_board(board_id: int, user_id: int):
+    return select(Board).where(Board.id == board_id, Board.owner_id == user_id)
+
+
+def owned_board(db: Session, board_id: int, user_id: int) -> models.KanbanBoard | None:
+    return db.execute(_select_owned_board(board_id, user_id)).scalar_one_or_none()
+
+
+def owned_columns(db: Session, column_ids: Iterable[int], user_id: int) -> Dict[int, models.KanbanColumn]:
+    column_ids = set(column_ids)
+    if not column_ids:
+        return {}
+    rows = db.execute(
+        select(Column)
+        .join(Column.board)
+        .where(Column.id.in_(column_ids), Board.owner_id == user_id)
+    ).scalars()
+    return {column.id: column for column in rows}
+
+
+def owned_column(db: Session, column_id: int, user_id: int) -> models.KanbanColumn | None:
+    return owned_columns(db, [column_id], user_id).get(column_id)
+
+
+def owned_cards(db: Session, card_ids: Iterable[int], user_id: int) -> Dict[int, models.KanbanCard]:
+    """Cards with their column already loaded, keyed by id."""
+    card_ids = set(card_ids)
+    if not card_ids:
+        return {}
+    rows = db.execute(
+        select(Card)
+        .join(Card.column)
+        .join(Column.board)
+        .options(contains_eager(Card.column))
+        .where(Card.id.in_(card_ids), Board.owner_id == user_id)
+    ).scalars()
+    return {card.id: card for card in rows}
+
+
+def owned_card(db: Session, card_id: int, user_id: int) -> models.KanbanCard | None:
+    return owned_cards(db, [card_id], user_id).get(card_id)
+
+
+def delete_owned_card(db: Session, card_id: int, user_id: int) -> bool:
+    """Single DELETE ... WHERE EXISTS; returns False if nothing the user owns matched."""
+    in_owned_column = exists().where(
+        Column.id == Card.column_id,
+        _board_owned_by(user_id, Column.board_id),
+    )
+    result = db.execute(
+        delete(Card)
+        .where(Card.id == card_id, in_owned_column)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def cards_to_suggest(db: Session, user_id: int, board_id: int, column_id: int | None = None) -> list[dict] | None:
+    """
+    The cards of a board (or of one of its columns) as plain dicts for
+    ai_service.generate_card_suggestions, in board order; None if the user
+    owns no such board or column.
+    """
+    if column_id is not None:
+        column = owned_column(db, column_id, user_id)
+        if column is None or column.board_id != board_id:
+            return None
+    elif owned_board(db, board_id, user_id) is None:
+        return None
+
+    statement = (
+        select(Card.id, Card.title, Card.description, Card.due_date)
+        .join(Card.column)
+        .where(Column.board_id == board_id)
+        .order_by(Column.rank, Card.rank)
+    )
+    if column_id is not None:
+        statement = statement.where(Card.column_id == column_id)
+    return [
+        {
+            "id": row.id,
+            "title": row.title,
+            "description": row.description,
+            "due_date": row.due_date.isoformat() if row.due_date else None,
+        }
+        for row in db.execute(statement)
+    ]
+
+
+# Dependencies for routes addressed by path id
+
+async def get_owned_board(
+    board_id: int,
+    db: AsyncSession = Depends(auth.get_async_read_db),
+    current_user: models.User = Depends(auth.get_current_user_async),
+) -> models.KanbanBoard:
+    board = (await db.execute(_select_owned_board(board_id, current_user.id))).scalar_one_or_none()
+    if board is None:
+        raise HTTPException(status_code=404, detail="Board not found")
+    return board
+
+
+def get_owned_card(
+    card_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+) -> models.KanbanCard:
+    card = owned_card(db, card_id, current_user.id)
+    if card is None:
+        raise HTTPException(status_code=404, detail="Card not found")
+    return card
@@ -0,0 +1,219 @@
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+import models
+import pagination
+
+load_dotenv()
+
+
+# Each worker keeps its own copy; resync bounds drift from awards made elsewhere
+LEADERBOARD_RESYNC_SECONDS: int = int(os.getenv("LEADERBOARD_RESYNC_SECONDS", "300"))
+
+# (rank, user_id, total_xp)
+Row = Tuple[int, int, int]
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * levels
+        # width[i] = how many positions next[i] skips ahead
+        self.width: List[int] = [1] * levels
+
+
+class IndexableSkipList:
+    """
+    Sorted keys with O(log n) expected insert, remove, rank and positional
+    access (a skip list whose links also record how many items they skip).
+    """
+
+    MAX_LEVELS = 32
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVELS)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _random_levels(self) -> int:
+        levels = 1
+        while levels < self.MAX_LEVELS and random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def insert(self, key) -> None:
+        chain: List[_Node] = [self.head] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self.head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = self._random_levels()
+        new = _Node(key, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key) -> None:
+        chain: List[_Node] = [self.head] * self.MAX_LEVELS
+        node = self.head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def count_before(self, key, inclusive: bool = False) -> int:
+        """Number of keys < key (or <= key when inclusive)."""
+        node = self.head
+        position = 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and (
+                node.next[level].key <= key if inclusive else node.next[level].key < key
+            ):
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def slice(self, start: int, count: int) -> list:
+        """Up to `count` keys starting at 0-based position `start`."""
+        if start >= self.size or count <= 0:
+            return []
+        node = self.head
+        remaining = start + 1
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+def _key(user_id: int, total_xp: int) -> Tuple[int, int]:
+    # highest XP first, ties broken by the older account
+    return (-total_xp, user_id)
+
+
+class Leaderboard:
+    """Global XP ranking kept in memory, rebuilt from the users table."""
+
+    def __init__(self, resync_seconds: int = LEADERBOARD_RESYNC_SECONDS):
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+        self._ranking = IndexableSkipList()
+        self._xp: Dict[int, int] = {}
+        self._loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._ranking)
+
+    def rebuild(self, db: Session) -> None:
+        rows = db.query(models.User.id, models.User.total_xp).all()
+        ranking = IndexableSkipList()
+        xp: Dict[int, int] = {}
+        for user_id, total_xp in rows:
+            xp[user_id] = total_xp or 0
+            ranking.insert(_key(user_id, xp[user_id]))
+        with self._lock:
+            self._ranking = ranking
+            self._xp = xp
+            self._loaded_at = time.monotonic()
+
+    def ensure_fresh(self, db: Session) -> None:
+        if (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self.resync_seconds
+        ):
+            self.rebuild(db)
+
+    def update(self, user_id: int, total_xp: int) -> None:
+        """Record a user's new XP total (inserts unknown users)."""
+        total_xp = total_xp or 0
+        with self._lock:
+            old = self._xp.get(user_id)
+            if old == total_xp:
+                return
+            if old is not None:
+                self._ranking.remove(_key(user_id, old))
+            self._ranking.insert(_key(user_id, total_xp))
+            self._xp[user_id] = total_xp
+
+    def ensure(self, user_id: int, total_xp: int) -> None:
+        """Insert a user this worker has not seen yet; known users are left alone."""
+        if user_id not in self._xp:
+            self.update(user_id, total_xp)
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            old = self._xp.pop(user_id, None)
+            if old is not None:
+                self._ranking.remove(_key(user_id, old))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank, or None for unknown users."""
+        with self._lock:
+            xp = self._xp.get(user_id)
+            if xp is None:
+                return None
+            return self._ranking.count_before(_key(user_id, xp)) + 1
+
+    def page(self, start: int, limit: int) -> List[Row]:
+        """`limit` rows starting at 0-based position `start`."""
+        with self._lock:
+            keys = self._ranking.slice(start, limit)
+        return [(start + i + 1, user_id, -neg_xp) for i, (neg_xp, user_id) in enumerate(keys)]
+
+    def around(self, user_id: int, radius: int) -> List[Row]:
+        """The user's row with up to `radius` neighbours on each side."""
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(rank - 1 - radius, 0)
+        return self.page(start, rank - start + radius)
+
+    def encode_cursor(self, row: Row) -> str:
+        _, user_id, total_xp = row
+        return pagination.encode_cursor(total_xp, user_id)
+
+    def start_after(self, cursor: str) -> int:
+        """0-based position just after the row a cursor points at. Raises ValueError."""
+        total_xp, user_id = pagination.decode_cursor(cursor, [int, int])
+        with self._lock:
+            return self._ranking.count_before(_key(user_id, total_xp), inclusive=True)
+
+
+board = Leaderboard()
@@ -0,0 +1,197 @@
+import codecs
+import csv
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, List, Tuple
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+import stats
+import xp
+
+load_dotenv()
+
+
+# Rows validated and written per batch; memory use is bounded by this
+IMPORT_CHUNK_ROWS: int = int(os.getenv("IMPORT_CHUNK_ROWS", "1000"))
+# Only the first N row errors are reported back; the rest are counted
+IMPORT_MAX_ERRORS: int = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+FIELDS = tuple(schemas.StudyLogCreate.model_fields)
+REQUIRED_FIELDS = {name for name, field in schemas.StudyLogCreate.model_fields.items() if field.is_required()}
+FORMATS = ("csv", "ndjson")
+
+# (line number, parsed fields or an error message)
+Record = Tuple[int, dict | str]
+
+
+class ImportFormatError(ValueError):
+    """The upload as a whole cannot be read (unknown format, bad CSV header)."""
+
+
+def detect_format(content_type: str | None, requested: str | None) -> str:
+    if requested:
+        if requested not in FORMATS:
+            raise ImportFormatError(f"format must be one of {', '.join(FORMATS)}")
+        return requested
+    content_type = (content_type or "").lower()
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    raise ImportFormatError("send Content-Type text/csv or application/x-ndjson, or pass ?format=")
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into lines without holding more than one line."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Record]:
+    header = None
+    buffered: List[str] = []
+    start = quotes = line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not buffered:
+            start = line_no
+        buffered.append(line)
+        # an odd number of quotes so far means a quoted field spans lines
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        text = "\n".join(buffered)
+        buffered, quotes = [], 0
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            yield start, f"invalid CSV: {e}"
+            continue
+
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            missing = REQUIRED_FIELDS - set(header)
+            if missing:
+                raise ImportFormatError(f"CSV header is missing {', '.join(sorted(missing))}")
+            continue
+        if len(values) != len(header):
+            yield start, f"expected {len(header)} fields, got {len(values)}"
+            continue
+        yield start, {name: value or None for name, value in zip(header, values) if name in FIELDS}
+
+    if buffered:
+        yield start, "invalid CSV: unterminated quoted field"
+    if header is None:
+        raise ImportFormatError("CSV upload is empty")
+
+
+async def _ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Record]:
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"invalid JSON: {e}"
+            continue
+        if not isinstance(value, dict):
+            yield line_no, "expected a JSON object"
+            continue
+        yield line_no, value
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+def _write_chunk(db: Session, user_id: int, logs: List[schemas.StudyLogCreate]) -> None:
+    now = datetime.utcnow()
+    db.execute(insert(models.StudyLog.__table__), [
+        {
+            "topic": log.topic,
+            "hours": log.hours,
+            "study_date": log.study_date,
+            "focus_level": log.focus_level.value,
+            "notes": log.notes,
+            "user_id": user_id,
+            "created_at": now,
+        }
+        for log in logs
+    ])
+
+
+def _finish(db: Session, user_id: int, imported: int) -> int:
+    xp_awarded = imported * xp.STUDY_LOG_XP
+    if imported:
+        xp.award_many(db, [(user_id, xp_awarded, "study_log_import")])
+        stats.rebuild_user_stats(db, user_id)
+    db.commit()
+    return xp_awarded
+
+
+async def import_logs(db: Session, user_id: int, chunks: AsyncIterator[bytes], fmt: str) -> dict:
+    """
+    Validate an uploaded CSV/NDJSON body row by row as it arrives and insert
+    the valid rows in batches, all in one transaction. XP and the stats
+    summary are updated once at the end rather than per row.
+    """
+    records = _csv_records(_lines(chunks)) if fmt == "csv" else _ndjson_records(_lines(chunks))
+    batch: List[schemas.StudyLogCreate] = []
+    errors: List[dict] = []
+    imported = failed = 0
+    try:
+        async for line, raw in records:
+            if isinstance(raw, str):
+                problem = raw
+            else:
+                try:
+                    batch.append(schemas.StudyLogCreate.model_validate(raw))
+                    problem = None
+                except ValidationError as e:
+                    problem = _describe(e)
+            if problem is not None:
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({"line": line, "error": problem})
+            if len(batch) >= IMPORT_CHUNK_ROWS:
+                await run_in_threadpool(_write_chunk, db, user_id, batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            await run_in_threadpool(_write_chunk, db, user_id, batch)
+            imported += len(batch)
+        xp_awarded = await run_in_threadpool(_finish, db, user_id, imported)
+    except BaseException:
+        db.rollback()
+        raise
+
+    return {
+        "imported": imported,
+        "failed": failed,
+        "xp_awarded": xp_awarded,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+    }
@@ -1,16 +1,34 @@
+import asyncio
+import json
+import math
 from datetime import datetime, timedelta
-from typing import Annotated
-from fastapi import FastAPI, Depends, HTTPException, status
+from typing import Annotated, Literal
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from jose import JWTError, jwt
+from sqlalchemy import exists, func, select
 import models
 import schemas
 import database
 import ai_service
 import auth
+import exports
+import jobs
+import leaderboard
+import log_import
+import pagination
+import passwords
+import ranking
+import rate_limit
+import semantic_cache
+import stats
+import streaks
+import tutor_context
+import xp
 
 app = FastAPI(
     title="AI Study Platform",
@@ -23,6 +41,36 @@ app = FastAPI(
 def startup_event():
     models.Base.metadata.create_all(bind=database.engine)
     init_db()
+    with database.SessionLocal() as db:
+        xp.open_balances(db)
+        leaderboard.board.rebuild(db)
+        ranking.rebalance(db)
+        recent = db.execute(
+            select(models.Conversation.topic, models.Conversation.question, models.Conversation.answer)
+            .where(models.Conversation.used_history.is_(False))
+            .order_by(models.Conversation.id.desc())
+            .limit(semantic_cache.SEMANTIC_CACHE_WARM_ROWS)
+        ).all()
+        ai_service.warm_tutor_cache(reversed(recent))
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    if xp.XP_COMPACT_INTERVAL_SECONDS > 0:
+        asyncio.create_task(xp.maintenance_loop())
+    if ranking.RANK_REBALANCE_INTERVAL_SECONDS > 0:
+        asyncio.create_task(ranking.rebalance_loop())
+    if jobs.JOB_WORKER_IN_PROCESS:
+        asyncio.create_task(jobs.run_in_process())
+    passwords.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    jobs.stop_in_process()
+    passwords.shutdown()
+    await database.async_engine.dispose()
+    await database.router.dispose()
 
 # Database migration helper - add missing columns to existing tables
 def init_db():
@@ -51,63 +99,99 @@ def init_db():
         except Exception as e:
             print(f"Note: created_at column may already exist: {e}")
 
+    # Kanban rank keys (rows left unranked are filled in by ranking.rebalance),
+    # tutor token counts and history flags, and job webhook secrets
+    rank_ddl = 'VARCHAR(255) COLLATE "C"' if database.engine.dialect.name == 'postgresql' else 'VARCHAR(255)'
+    for table, column, ddl in (
+        ('kanban_columns', 'rank', rank_ddl),
+        ('kanban_columns', 'updated_at', 'TIMESTAMP'),
+        ('kanban_cards', 'rank', rank_ddl),
+        ('conversations', 'prompt_tokens', 'INTEGER'),
+        ('conversations', 'answer_tokens', 'INTEGER'),
+        ('conversations', 'used_history', 'BOOLEAN'),
+        ('jobs', 'webhook_secret', 'VARCHAR'),
+    ):
+        if table not in inspector.get_table_names():
+            continue
+        try:
+            if column not in [col['name'] for col in inspector.get_columns(table)]:
+                with database.engine.connect() as conn:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                    conn.commit()
+                    print(f"✓ Added {column} column to {table} table")
+        except Exception as e:
+            print(f"Note: {column} column may already exist on {table}: {e}")
+
+    # One XP balance row per user (xp_events tables created before the index lack it)
+    if 'xp_events' in inspector.get_table_names():
+        try:
+            with database.engine.connect() as conn:
+                conn.execute(text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS uq_xp_events_user_id_balance "
+                    "ON xp_events (user_id) WHERE reason = 'balance'"
+                ))
+                conn.commit()
+        except Exception as e:
+            print(f"Note: could not add the xp_events balance index: {e}")
+
 origins = [
     "https://study-coach-ai-ashen.vercel.app", 
     "http://localhost:3000",
     "http://localhost:5173",           
 ]
 
+app.add_middleware(auth.ReadYourWritesMiddleware)
+app.add_middleware(rate_limit.RateLimitMiddleware)
+
+
+@app.exception_handler(ai_service.AIUnavailableError)
+async def ai_unavailable_handler(request: Request, exc: ai_service.AIUnavailableError):
+    """Model timed out, kept failing or its circuit is open: 503, retry later"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "The AI service is temporarily unavailable, please try again shortly"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,    
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "Location"],
 )
 
 
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
 DBSession = Annotated[Session, Depends(database.get_db)]
-TokenDep = Annotated[str, Depends(oauth2_scheme)]
 
+CurrentUser = Annotated[models.User, Depends(auth.get_current_user)]
 
-# Auth Dependency
-def get_current_user(
-    token: TokenDep,
-    db: DBSession,
-) -> models.User:
+# Read-only endpoints, on a replica when DATABASE_READ_URLS is set
+ReadSession = Annotated[Session, Depends(auth.get_read_db)]
 
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid or expired token",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+# Hot read endpoints run on the async engine instead of the threadpool
+AsyncReadSession = Annotated[AsyncSession, Depends(auth.get_async_read_db)]
 
-    try:
-        payload = jwt.decode(
-            token,
-            auth.SECRET_KEY,
-            algorithms=[auth.ALGORITHM],
-        )
-        email: str | None = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+AsyncCurrentUser = Annotated[models.User, Depends(auth.get_current_user_async)]
 
-    user = db.query(models.User).filter_by(email=email).first()
-    if not user:
-        raise credentials_exception
+# Register kanban router (import here to avoid circular imports)
+import kanban
+app.include_router(kanban.router, prefix="/api/kanban")
+app.include_router(jobs.router, prefix="/api/jobs")
 
-    return user
 
+# The auth routes are async so password hashing can be awaited; their
+# session work goes to the threadpool through these
+def _user_by_email(db: Session, email: str) -> models.User | None:
+    return db.query(models.User).filter_by(email=email).first()
 
-CurrentUser = Annotated[models.User, Depends(get_current_user)]
 
-# Register kanban router (import here to avoid circular imports)
-import kanban
-app.include_router(kanban.router, prefix="/api/kanban")
+def _commit(db: Session, *instances) -> None:
+    db.commit()
+    for instance in instances:
+        db.refresh(instance)
 
 
 #Auth Routes
@@ -116,29 +200,32 @@ app.include_router(kanban.router, prefix="/api/kanban")
     response_model=schemas.Token,
     status_code=status.HTTP_201_CREATED,
 )
-def register(
+async def register(
     user_data: schemas.UserCreate,
     db: DBSession,
 ) -> schemas.Token:
 
-    if db.query(models.User).filter_by(email=user_data.email).first():
+    if await run_in_threadpool(_user_by_email, db, user_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
+    await run_in_threadpool(database.release_connection, db)
+    hashed_password = await passwords.hash_password(user_data.password)
     user = models.User(
         email=user_data.email,
-        hashed_password=auth.hash_password(user_data.password),
+        hashed_password=hashed_password,
         created_at=datetime.utcnow(),
         total_xp=0,
     )
 
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await run_in_threadpool(_commit, db, user)
+    database.router.note_write(user.id)
+    leaderboard.board.update(user.id, user.total_xp)
 
-    token = auth.create_access_token({"sub": user.email})
+    token = auth.create_access_token({"sub": str(user.id)})
 
     return {"access_token": token, "token_type": "bearer"}
 
@@ -147,16 +234,15 @@ def register(
     "/api/login",
     response_model=schemas.Token,
 )
-def login(
+async def login(
     db: DBSession,
     form_data: OAuth2PasswordRequestForm = Depends(),
 ) -> schemas.Token:
 
-    user = db.query(models.User).filter_by(
-        email=form_data.username
-    ).first()
+    user = await run_in_threadpool(_user_by_email, db, form_data.username)
+    await run_in_threadpool(database.release_connection, db)
 
-    if not user or not auth.verify_password(
+    if not user or not await passwords.verify_password(
         form_data.password,
         user.hashed_password,
     ):
@@ -165,7 +251,12 @@ def login(
             detail="Invalid email or password",
         )
 
-    token = auth.create_access_token({"sub": user.email})
+    if passwords.needs_rehash(user.hashed_password):
+        # upgrade hashes made with an older cost factor while we have the password
+        user.hashed_password = await passwords.hash_password(form_data.password)
+        await run_in_threadpool(_commit, db)
+
+    token = auth.create_access_token({"sub": str(user.id)})
 
     return {"access_token": token, "token_type": "bearer"}
 
@@ -178,14 +269,21 @@ def get_profile(current_user: CurrentUser):
 
 
 @app.patch("/api/users/me", response_model=schemas.UserResponse)
-def update_profile(
+async def update_profile(
     updates: schemas.UserUpdate,
     db: DBSession,
     current_user: CurrentUser,
 ):
     """Update email and/or password"""
+    hashed_password = None
+    if updates.password:
+        '''Hash the new password before storing — storing a plaintext
+        password here would be a critical security vulnerability'''
+        await run_in_threadpool(database.release_connection, db)
+        hashed_password = await passwords.hash_password(updates.password)
+
     if updates.email and updates.email != current_user.email:
-        existing = db.query(models.User).filter_by(email=updates.email).first()
+        existing = await run_in_threadpool(_user_by_email, db, updates.email)
         if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -193,13 +291,11 @@ def update_profile(
             )
         current_user.email = updates.email
 
-    if updates.password:
-        '''Hash the new password before storing — storing a plaintext
-        password here would be a critical security vulnerability'''
-        current_user.hashed_password = auth.hash_password(updates.password)
+    if hashed_password:
+        current_user.hashed_password = hashed_password
 
-    db.commit()
-    db.refresh(current_user)
+    await run_in_threadpool(_commit, db, current_user)
+    auth.user_cache.invalidate(current_user.id)
     return current_user
 
 
@@ -209,49 +305,25 @@ def delete_account(
     current_user: CurrentUser,
 ):
     """Permanently delete the current user's account and all associated data"""
+    user_id = current_user.id
     db.delete(current_user)
     db.commit()
+    auth.user_cache.invalidate(user_id)
+    leaderboard.board.remove(user_id)
 
 
 @app.get("/api/users/me/stats")
-def get_profile_stats(
-    db: DBSession,
-    current_user: CurrentUser,
+async def get_profile_stats(
+    db: AsyncReadSession,
+    current_user: AsyncCurrentUser,
 ):
     """Return aggregated stats for the Profile page"""
-    total_hours = (
-        db.query(func.coalesce(func.sum(models.StudyLog.hours), 0))
-        .filter(models.StudyLog.user_id == current_user.id)
-        .scalar()
-    )
-    total_sessions = (
-        db.query(func.count(models.StudyLog.id))
-        .filter(models.StudyLog.user_id == current_user.id)
-        .scalar()
-    )
-
-    # Streak
-    today = datetime.utcnow().date()
-    all_logs = (
-        db.query(models.StudyLog.study_date)
-        .filter(models.StudyLog.user_id == current_user.id)
-        .order_by(models.StudyLog.study_date.desc())
-        .all()
-    )
-    streak = 0
-    if all_logs:
-        current_date = today
-        for log in all_logs:
-            if log.study_date == current_date or log.study_date == current_date - timedelta(days=1):
-                streak += 1
-                current_date = log.study_date
-            else:
-                break
+    summary = await db.run_sync(stats.read_user_stats, current_user.id)
 
     return {
-        "streak": streak,
-        "total_study_hours": float(total_hours),
-        "total_sessions": total_sessions,
+        "streak": stats.current_streak(summary),
+        "total_study_hours": float(summary.total_hours),
+        "total_sessions": summary.session_count,
         "total_xp": current_user.total_xp or 0,
     }
 
@@ -276,77 +348,84 @@ def create_study_log(
         user_id=current_user.id,
     )
 
-    db.add(new_log)
+    stats.record_study_log(db, new_log)
+    xp.award(db, current_user.id, xp.STUDY_LOG_XP, "study_log")
     db.commit()
     db.refresh(new_log)
-    current_user.total_xp = (current_user.total_xp or 0) + 15
-    db.commit()
 
     return new_log
 
 
-@app.get("/api/logs")
-def get_study_logs(
+@app.post(
+    "/api/logs/import",
+    response_model=schemas.StudyLogImportResponse,
+)
+async def import_study_logs(
+    request: Request,
     db: DBSession,
     current_user: CurrentUser,
+    format: Literal["csv", "ndjson"] | None = None,
+):
+    """
+    Bulk-load study logs from a CSV (with a header row) or NDJSON body.
+    Valid rows are imported; invalid ones are reported by line number.
+    """
+    try:
+        fmt = log_import.detect_format(request.headers.get("content-type"), format)
+        return await log_import.import_logs(db, current_user.id, request.stream(), fmt)
+    except log_import.ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@app.get("/api/logs", response_model=schemas.Page[schemas.StudyLogResponse])
+async def get_study_logs(
+    db: AsyncReadSession,
+    current_user: AsyncCurrentUser,
     limit: int = 10,
+    cursor: str | None = None,
 ):
-    logs = (
-        db.query(models.StudyLog)
-        .filter(models.StudyLog.user_id == current_user.id)
-        .order_by(models.StudyLog.study_date.desc())
-        .limit(limit)
-        .all()
+    """Study logs, newest study day first (pass back `next_cursor`)"""
+    logs, next_cursor = await pagination.paginate_async(
+        db,
+        select(models.StudyLog).where(models.StudyLog.user_id == current_user.id),
+        [(models.StudyLog.study_date, True), (models.StudyLog.id, True)],
+        limit,
+        cursor,
     )
-    return logs
+    return {"items": logs, "next_cursor": next_cursor}
 
 
-#dashboard api
-@app.get("/api/dashboard/stats")
-def get_dashboard_stats(
-    db: DBSession,
+@app.get("/api/logs/export")
+def export_study_logs(
     current_user: CurrentUser,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    accept_encoding: str | None = Header(None),
 ):
-    # Total hours
-    total_hours: float = (
-        db.query(func.coalesce(func.sum(models.StudyLog.hours), 0))
-        .filter(models.StudyLog.user_id == current_user.id)
-        .scalar()
+    """Full study history as a streamed NDJSON or CSV download."""
+    return exports.export_response(
+        exports.study_logs_query(current_user.id), format, "study-logs", accept_encoding,
+        database.router.engine_for(current_user.id),
     )
 
+
+#dashboard api
+@app.get("/api/dashboard/stats")
+async def get_dashboard_stats(
+    db: AsyncReadSession,
+    current_user: AsyncCurrentUser,
+):
+    summary = await db.run_sync(stats.read_user_stats, current_user.id)
+
     today = datetime.utcnow().date()
     seven_days_ago = today - timedelta(days=6)
 
-    recent_logs = (
-        db.query(models.StudyLog)
-        .filter(
+    recent_logs = (await db.execute(
+        select(models.StudyLog.study_date, models.StudyLog.hours, models.StudyLog.focus_level)
+        .where(
             models.StudyLog.user_id == current_user.id,
             models.StudyLog.study_date >= seven_days_ago,
         )
-        .all()
-    )
-
-    # Calculate study streak
-    all_logs = (
-        db.query(models.StudyLog.study_date)
-        .filter(models.StudyLog.user_id == current_user.id)
-        .order_by(models.StudyLog.study_date.desc())
-        .all()
-    )
-
-    '''Deduplicate dates before streak calculation — if a user logged
-     multiple sessions on the same day, the original loop incremented streak
-    once per session row rather than once per day, producing inflated streaks'''
-    streak = 0
-    if all_logs:
-        unique_dates = sorted(set(log.study_date for log in all_logs), reverse=True)
-        current_date = today
-        for date in unique_dates:
-            if date == current_date or date == current_date - timedelta(days=1):
-                streak += 1
-                current_date = date
-            else:
-                break
+    )).all()
 
     # Prepare chart data
     chart_data = {}
@@ -384,19 +463,12 @@ def get_dashboard_stats(
     else:
         avg_focus_score = 0
 
-    # Unique topics
-    unique_topics = (
-        db.query(func.count(func.distinct(models.StudyLog.topic)))
-        .filter(models.StudyLog.user_id == current_user.id)
-        .scalar()
-    )
-
     return {
         "user": current_user.email,
-        "total_hours": float(total_hours),
-        "study_streak": streak,
+        "total_hours": float(summary.total_hours),
+        "study_streak": stats.current_streak(summary, today),
         "average_focus": avg_focus_score,
-        "topics_studied": unique_topics or 0,
+        "topics_studied": summary.topic_count,
         "chart_data": chart_array,
     }
 
@@ -406,28 +478,21 @@ def get_dashboard_stats(
     "/api/assessment/generate",
     response_model=schemas.AssessmentResponse,
 )
-def generate_assessment(
+async def generate_assessment(
     request: schemas.AssessmentRequest,
     db: DBSession,
     current_user: CurrentUser,
 ):
-    last_log = (
-        db.query(models.StudyLog.notes)
-        .filter(
-            models.StudyLog.user_id == current_user.id,
-            models.StudyLog.topic == request.topic,
-        )
-        .order_by(models.StudyLog.id.desc())
-        .first()
-    )
-
-    notes = last_log[0] if last_log else ""
+    notes = await run_in_threadpool(stats.latest_notes, db, current_user.id, request.topic)
+    await run_in_threadpool(database.release_connection, db)
 
     try:
-        questions = ai_service.generate_assessment_questions(
+        questions = await ai_service.generate_assessment_questions(
             request.topic,
             notes,
         )
+    except ai_service.AIUnavailableError:
+        raise
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -446,54 +511,130 @@ def generate_assessment(
     "/api/tutor/ask",
     response_model=schemas.ConversationResponse,
 )
-def ask_tutor(
+async def ask_tutor(
     request: schemas.ConversationCreate,
     db: DBSession,
     current_user: CurrentUser,
 ):
-    """AI Tutor responds to student questions"""
+    """AI Tutor responds to student questions, with the student's earlier turns on the topic as context"""
+    history = await run_in_threadpool(tutor_context.load, db, current_user.id, request.topic)
+    await run_in_threadpool(database.release_connection, db)
     try:
-        answer = ai_service.generate_tutor_response(
+        reply = await ai_service.generate_tutor_response(
             request.topic,
             request.question,
+            history,
         )
+    except ai_service.AIUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to generate response: {str(e)}",
         )
 
-    conversation = models.Conversation(
-        user_id=current_user.id,
-        topic=request.topic,
-        question=request.question,
-        answer=answer,
+    conversation = await run_in_threadpool(
+        tutor_context.save_turn, db, current_user.id, request.topic, request.question, reply
     )
-
-    db.add(conversation)
-    db.commit()
-    db.refresh(conversation)
-    current_user.total_xp = (current_user.total_xp or 0) + 10
-    db.commit()
+    tutor_context.schedule_refresh(current_user.id, request.topic)
 
     return conversation
 
 
-@app.get("/api/tutor/history")
-def get_chat_history(
+def _sse(data: dict, event: str | None = None) -> str:
+    """Format one Server-Sent Event frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+def _save_conversation(user_id: int, topic: str, question: str, reply: ai_service.TutorReply) -> models.Conversation:
+    """Persist a finished streamed answer in its own short-lived session"""
+    with database.SessionLocal() as db:
+        return tutor_context.save_turn(db, user_id, topic, question, reply)
+
+
+@app.post("/api/tutor/ask/stream")
+async def ask_tutor_stream(
+    request: schemas.ConversationCreate,
     db: DBSession,
     current_user: CurrentUser,
+):
+    """
+    Stream the tutor's answer as Server-Sent Events: one `data: {"delta": ...}`
+    frame per chunk, then an `event: done` frame carrying the saved conversation
+    (or `event: error`). The conversation is written once, when the stream completes.
+    """
+    user_id = current_user.id
+    history = await run_in_threadpool(tutor_context.load, db, user_id, request.topic)
+    await run_in_threadpool(database.release_connection, db)
+
+    async def event_stream():
+        reply = ai_service.TutorReply()
+        try:
+            async for delta in ai_service.stream_tutor_response(
+                request.topic,
+                request.question,
+                history,
+                reply,
+            ):
+                yield _sse({"delta": delta})
+        except ai_service.AIUnavailableError as e:
+            yield _sse({
+                "detail": "The AI service is temporarily unavailable, please try again shortly",
+                "retry_after": math.ceil(e.retry_after),
+            }, event="error")
+            return
+        except Exception as e:
+            yield _sse({"detail": f"Failed to generate response: {str(e)}"}, event="error")
+            return
+
+        conversation = await run_in_threadpool(
+            _save_conversation,
+            user_id,
+            request.topic,
+            request.question,
+            reply,
+        )
+        tutor_context.schedule_refresh(user_id, request.topic)
+        payload = schemas.ConversationResponse.model_validate(conversation)
+        yield _sse(payload.model_dump(mode="json"), event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/tutor/history", response_model=schemas.Page[schemas.ConversationResponse])
+def get_chat_history(
+    db: ReadSession,
+    current_user: CurrentUser,
     limit: int = 20,
+    cursor: str | None = None,
 ):
-    """Get user's chat history"""
-    conversations = (
-        db.query(models.Conversation)
-        .filter(models.Conversation.user_id == current_user.id)
-        .order_by(models.Conversation.created_at.desc())
-        .limit(limit)
-        .all()
+    """Get user's chat history, newest first (pass back `next_cursor`)"""
+    conversations, next_cursor = pagination.paginate(
+        db,
+        select(models.Conversation).where(models.Conversation.user_id == current_user.id),
+        [(models.Conversation.created_at, True), (models.Conversation.id, True)],
+        limit,
+        cursor,
+    )
+    return {"items": conversations, "next_cursor": next_cursor}
+
+
+@app.get("/api/tutor/history/export")
+def export_chat_history(
+    current_user: CurrentUser,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    accept_encoding: str | None = Header(None),
+):
+    """Full tutor history as a streamed NDJSON or CSV download."""
+    return exports.export_response(
+        exports.conversations_query(current_user.id), format, "tutor-history", accept_encoding,
+        database.router.engine_for(current_user.id),
     )
-    return conversations
 
 
 #Study Groups api
@@ -524,36 +665,56 @@ def create_study_group(
     group.members.append(current_user)
 
     db.add(group)
+    db.flush()
+    xp.award(db, current_user.id, xp.GROUP_CREATED_XP, "group_created")
     db.commit()
     db.refresh(group)
 
-    current_user.total_xp = (current_user.total_xp or 0) + 50
-    db.commit()
-
     return group
 
 
-@app.get("/api/study-groups")
+@app.get("/api/study-groups", response_model=schemas.Page[schemas.StudyGroupResponse])
 def list_study_groups(
-    db: DBSession,
+    db: ReadSession,
     current_user: CurrentUser,
+    limit: int = 20,
+    cursor: str | None = None,
 ):
-    """List all public study groups"""
-    groups = (
-        db.query(models.StudyGroup)
-        .filter(models.StudyGroup.is_public == True)
-        .order_by(models.StudyGroup.created_at.desc())
-        .all()
+    """List public study groups, newest first (pass back `next_cursor`)"""
+    groups, next_cursor = pagination.paginate(
+        db,
+        select(models.StudyGroup).where(models.StudyGroup.is_public == True),
+        [(models.StudyGroup.created_at, True), (models.StudyGroup.id, True)],
+        limit,
+        cursor,
     )
-    return groups
+    members = models.study_group_members
+    member_counts = dict(
+        db.query(members.c.group_id, func.count())
+        .filter(members.c.group_id.in_([g.id for g in groups]))
+        .group_by(members.c.group_id)
+        .all()
+    ) if groups else {}
+    items = [
+        schemas.StudyGroupResponse.model_validate(group).model_copy(
+            update={"member_count": member_counts.get(group.id, 0)}
+        )
+        for group in groups
+    ]
+    return {"items": items, "next_cursor": next_cursor}
 
 @app.get("/api/study-groups/my")
 def list_my_study_groups(
-    db: DBSession,
+    db: ReadSession,
     current_user: CurrentUser,
 ):
     """List all study groups the current user is a member of"""
-    return current_user.study_groups
+    members = models.study_group_members
+    return db.scalars(
+        select(models.StudyGroup)
+        .join(members, members.c.group_id == models.StudyGroup.id)
+        .where(members.c.user_id == current_user.id)
+    ).all()
 
 
 @app.get("/api/study-groups/{group_id}")
@@ -600,7 +761,7 @@ def join_study_group(
         )
 
     group.members.append(current_user)
-    current_user.total_xp = (current_user.total_xp or 0) + 20
+    xp.award(db, current_user.id, xp.GROUP_JOINED_XP, "group_joined")
     db.commit()
 
     return {"message": "Successfully joined study group", "group_id": group_id}
@@ -637,120 +798,180 @@ def leave_study_group(
 
 #leaderboards api
 
-@app.get("/api/leaderboard/global")
-def get_global_leaderboard(
-    db: DBSession,
-    current_user: CurrentUser,
-    limit: int = 50,
-):
-    """Get global XP leaderboard"""
-    top_users = (
-        db.query(models.User)
-        .order_by(models.User.total_xp.desc())
-        .limit(limit)
+def _leaderboard_entries(
+    db: Session,
+    rows: list[leaderboard.Row],
+) -> list[schemas.LeaderboardEntry]:
+    """Decorate ranked (rank, user_id, xp) rows with email, hours and streak"""
+    user_ids = [user_id for _, user_id, _ in rows]
+    if not user_ids:
+        return []
+    emails = dict(
+        db.query(models.User.id, models.User.email)
+        .filter(models.User.id.in_(user_ids))
         .all()
     )
-    user_ids = [u.id for u in top_users]
-    hours_by_user = dict(
-        db.query(
-            models.StudyLog.user_id,
-            func.coalesce(func.sum(models.StudyLog.hours), 0),
+    hours_by_user = stats.total_hours_by_user(db, user_ids)
+    streak_by_user = streaks.current_streaks(db, user_ids)
+
+    return [
+        schemas.LeaderboardEntry(
+            rank=rank,
+            user_email=emails[user_id],
+            total_xp=total_xp,
+            study_hours=hours_by_user[user_id],
+            streak=streak_by_user[user_id],
         )
-        .filter(models.StudyLog.user_id.in_(user_ids))
-        .group_by(models.StudyLog.user_id)
-        .all()
-    )
+        for rank, user_id, total_xp in rows
+        if user_id in emails
+    ]
 
-    entries = []
-    for idx, user in enumerate(top_users, 1):
-        entries.append(
-            schemas.LeaderboardEntry(
-                rank=idx,
-                user_email=user.email,
-                total_xp=user.total_xp or 0,
-                study_hours=float(hours_by_user.get(user.id, 0)),
-                streak=0,
-            )
+
+@app.get("/api/leaderboard/global", response_model=schemas.LeaderboardResponse)
+async def get_global_leaderboard(
+    db: AsyncReadSession,
+    current_user: AsyncCurrentUser,
+    limit: int = 50,
+    cursor: str | None = None,
+):
+    """Get global XP leaderboard, one page at a time (pass back `next_cursor`)"""
+    board = leaderboard.board
+    await db.run_sync(board.ensure_fresh)
+    board.ensure(current_user.id, current_user.total_xp)
+    limit = pagination.clamp_limit(limit)
+
+    try:
+        start = board.start_after(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
         )
 
+    rows = board.page(start, limit)
+    entries = await db.run_sync(_leaderboard_entries, rows)
+    next_cursor = (
+        board.encode_cursor(rows[-1])
+        if rows and start + len(rows) < len(board)
+        else None
+    )
+
     user_rank = next(
         (e for e in entries if e.user_email == current_user.email), None
     )
     if not user_rank:
-        user_position = (
-            db.query(func.count(models.User.id))
-            .filter(models.User.total_xp > (current_user.total_xp or 0))
-            .scalar()
-        ) + 1  
-
-        user_hours = float(
-            db.query(func.coalesce(func.sum(models.StudyLog.hours), 0))
-            .filter(models.StudyLog.user_id == current_user.id)
-            .scalar()
-        )
-        user_rank = schemas.LeaderboardEntry(
-            rank=user_position,
-            user_email=current_user.email,
-            total_xp=current_user.total_xp or 0,
-            study_hours=user_hours,
-            streak=0,
-        )
+        user_rank = (await db.run_sync(
+            _leaderboard_entries,
+            [(board.rank(current_user.id), current_user.id, current_user.total_xp or 0)],
+        ))[0]
+
+    return schemas.LeaderboardResponse(
+        entries=entries,
+        user_rank=user_rank,
+        next_cursor=next_cursor,
+    )
+
+
+@app.get("/api/leaderboard/global/around", response_model=schemas.LeaderboardResponse)
+async def get_leaderboard_around_me(
+    db: AsyncReadSession,
+    current_user: AsyncCurrentUser,
+    radius: int = 5,
+):
+    """Get the users ranked just above and below the current user"""
+    board = leaderboard.board
+    await db.run_sync(board.ensure_fresh)
+    board.ensure(current_user.id, current_user.total_xp)
+    radius = max(0, min(radius, 50))
+
+    entries = await db.run_sync(_leaderboard_entries, board.around(current_user.id, radius))
+    user_rank = next(
+        (e for e in entries if e.user_email == current_user.email), None
+    )
 
     return schemas.LeaderboardResponse(entries=entries, user_rank=user_rank)
 
-@app.get("/api/leaderboard/group/{group_id}")
-def get_group_leaderboard(
+@app.get("/api/leaderboard/group/{group_id}", response_model=schemas.LeaderboardResponse)
+async def get_group_leaderboard(
     group_id: int,
-    db: DBSession,
-    current_user: CurrentUser,
+    db: AsyncReadSession,
+    current_user: AsyncCurrentUser,
+    limit: int = 50,
+    cursor: str | None = None,
 ):
-    """Get leaderboard for a specific study group"""
-    group = db.query(models.StudyGroup).filter_by(id=group_id).first()
+    """Get leaderboard for a specific study group, one page at a time (pass back `next_cursor`)"""
+    group = await db.get(models.StudyGroup, group_id)
 
     if not group:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Study group not found",
         )
-    
-    if not group.is_public and current_user not in group.members and group.creator_id != current_user.id:
+
+    membership = models.study_group_members
+    is_member = await db.scalar(select(exists().where(
+        membership.c.group_id == group_id,
+        membership.c.user_id == current_user.id,
+    )))
+    if not group.is_public and not is_member and group.creator_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have access to this group's leaderboard",
         )
 
-    member_ids = [m.id for m in group.members]
-    hours_by_member = dict(
-        db.query(
-            models.StudyLog.user_id,
-            func.coalesce(func.sum(models.StudyLog.hours), 0),
-        )
-        .filter(models.StudyLog.user_id.in_(member_ids))
-        .group_by(models.StudyLog.user_id)
-        .all()
-    ) if member_ids else {}
+    members = (
+        select(models.User)
+        .join(membership, membership.c.user_id == models.User.id)
+        .where(membership.c.group_id == group_id)
+    )
+    keys = [(models.User.total_xp, True), (models.User.id, False)]
+    page, next_cursor = await pagination.paginate_async(db, members, keys, limit, cursor)
 
-    entries = []
-    for idx, member in enumerate(
-        sorted(group.members, key=lambda u: u.total_xp or 0, reverse=True), 1
-    ):
-        entries.append(
-            schemas.LeaderboardEntry(
-                rank=idx,
-                user_email=member.email,
-                total_xp=member.total_xp or 0,
-                study_hours=float(hours_by_member.get(member.id, 0)),
-                streak=0,
-            )
-        )
+    first_rank = (
+        await pagination.count_before_async(db, members, keys, [page[0].total_xp, page[0].id]) + 1
+        if cursor and page
+        else 1
+    )
+    entries = await db.run_sync(_leaderboard_entries, [
+        (first_rank + i, member.id, member.total_xp or 0)
+        for i, member in enumerate(page)
+    ])
 
     user_rank = next(
         (e for e in entries if e.user_email == current_user.email), None
     )
+    if not user_rank and is_member:
+        rank = await pagination.count_before_async(
+            db, members, keys, [current_user.total_xp or 0, current_user.id]
+        ) + 1
+        user_rank = (await db.run_sync(
+            _leaderboard_entries, [(rank, current_user.id, current_user.total_xp or 0)]
+        ))[0]
+
+    return schemas.LeaderboardResponse(
+        entries=entries,
+        user_rank=user_rank,
+        next_cursor=next_cursor,
+    )
 
-    return schemas.LeaderboardResponse(entries=entries, user_rank=user_rank)
-
-#health check endpoint
+#health check endpoint (in-process counters only, so a slow database
+# cannot fail the liveness probe)
 @app.get("/health", tags=["health"])
 def health_check():
-    return {"status": "online"}
\ No newline at end of file
+    return {
+        "status": "online",
+        "assessment_cache": ai_service.assessment_cache.stats(),
+        "tutor_cache": ai_service.tutor_cache.stats(),
+        "tokens": ai_service.token_meter.stats(),
+        "ai_upstream": ai_service.client.stats(),
+        "structured_output": ai_service.parse_stats.stats(),
+        "user_cache": auth.user_cache.stats(),
+        "read_routing": database.router.stats(),
+        "rate_limits": rate_limit.limiter.stats(),
+    }
+
+
+@app.get("/health/jobs", tags=["health"])
+def job_queue_stats():
+    """Job counts by status; queries the database, unlike /health"""
+    return jobs.status_counts()
\ No newline at end of file
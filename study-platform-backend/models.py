@@ -1,23 +1,32 @@
 from sqlalchemy import (
     Column, Integer, String, Float, Date, DateTime,
     ForeignKey, Text, Table, Boolean, func,
-    UniqueConstraint,
+    UniqueConstraint, Index, text,
 )
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime as dt
 
+# Rank keys compare byte-wise; Postgres must not apply locale collation to them
+RankKey = String(255).with_variant(String(255, collation="C"), "postgresql")
+
 
 study_group_members = Table(
     "study_group_members",
     Base.metadata,
     Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
     Column("group_id", Integer, ForeignKey("study_groups.id", ondelete="CASCADE"), primary_key=True),
+    # the primary key already covers lookups by user_id; this covers member lists
+    Index("ix_study_group_members_group_id", "group_id"),
 )
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # leaderboard ordering and rank counting
+        Index("ix_users_total_xp_id", "total_xp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
@@ -47,10 +56,28 @@ class User(Base):
         cascade="all",
         foreign_keys="StudyGroup.creator_id",
     )
+    study_stats = relationship(
+        "UserStudyStats",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+    xp_events = relationship(
+        "XPEvent",
+        cascade="all, delete-orphan",
+    )
 
 
 class StudyLog(Base):
     __tablename__ = "study_logs"
+    __table_args__ = (
+        # per-user history ordered by day; covers streaks and hour sums on Postgres
+        Index(
+            "ix_study_logs_user_id_study_date", "user_id", "study_date",
+            postgresql_include=["hours"],
+        ),
+        # latest notes for a topic (assessments) and the distinct-topic check
+        Index("ix_study_logs_user_id_topic_id", "user_id", "topic", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     topic = Column(String, index=True, nullable=False)
@@ -64,8 +91,46 @@ class StudyLog(Base):
     owner = relationship("User", back_populates="logs")
 
 
+class UserStudyStats(Base):
+    """Per-user study aggregates, maintained incrementally by stats.record_study_log"""
+    __tablename__ = "user_study_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_hours = Column(Float, default=0.0, nullable=False)
+    session_count = Column(Integer, default=0, nullable=False)
+    topic_count = Column(Integer, default=0, nullable=False)
+    # length of the consecutive-day run that ends on last_study_date
+    streak_length = Column(Integer, default=0, nullable=False)
+    last_study_date = Column(Date, nullable=True)
+    updated_at = Column(DateTime, default=dt.utcnow, onupdate=dt.utcnow, nullable=True)
+
+
+class XPEvent(Base):
+    """Append-only XP ledger; users.total_xp is the running total of these rows"""
+    __tablename__ = "xp_events"
+    __table_args__ = (
+        Index("ix_xp_events_user_id_created_at", "user_id", "created_at"),
+        # one opening/compacted balance per user, however many workers seed them
+        Index(
+            "uq_xp_events_user_id_balance", "user_id", unique=True,
+            sqlite_where=text("reason = 'balance'"),
+            postgresql_where=text("reason = 'balance'"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    amount = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False)
+    created_at = Column(DateTime, default=dt.utcnow, nullable=False)
+
+
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_user_id_created_at", "user_id", "created_at"),
+        Index("ix_conversations_user_id_topic_id", "user_id", "topic", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -73,12 +138,66 @@ class Conversation(Base):
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
     created_at = Column(DateTime, default=dt.utcnow, nullable=True)
+    # estimated model tokens; prompt_tokens is 0 for an answer served from cache
+    prompt_tokens = Column(Integer, nullable=True)
+    answer_tokens = Column(Integer, nullable=True)
+    # the answer was generated with the student's earlier turns in the prompt;
+    # only rows where this is false may seed the shared tutor cache
+    used_history = Column(Boolean, nullable=True)
 
     user = relationship("User", back_populates="conversations")
 
 
+class TutorContext(Base):
+    """Running summary of a user's older tutor turns on one topic, maintained by tutor_context"""
+    __tablename__ = "tutor_contexts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "topic", name="uq_tutor_contexts_user_id_topic"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    topic = Column(String, nullable=False)
+    summary = Column(Text, default="", nullable=False)
+    # conversations up to this id are folded into the summary
+    summarized_through_id = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=dt.utcnow, onupdate=dt.utcnow, nullable=True)
+
+
+class Job(Base):
+    """Queued AI work run by jobs.py workers, polled or delivered by webhook"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_user_id_status", "user_id", "status"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)
+    # queued -> running -> succeeded | failed (running -> queued again on retry)
+    status = Column(String, default="queued", nullable=False)
+    payload = Column(Text, nullable=False)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, nullable=False)
+    run_after = Column(DateTime, default=dt.utcnow, nullable=False)
+    # the worker holding a running job, until when
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    webhook_url = Column(String, nullable=True)
+    # HMAC key for this job's webhook deliveries; shown to the submitter once
+    webhook_secret = Column(String, nullable=True)
+    created_at = Column(DateTime, default=dt.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
 class StudyGroup(Base):
     __tablename__ = "study_groups"
+    __table_args__ = (
+        Index("ix_study_groups_is_public_created_at", "is_public", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False, unique=True)
@@ -102,6 +221,9 @@ class StudyGroup(Base):
 
 class KanbanBoard(Base):
     __tablename__ = "kanban_boards"
+    __table_args__ = (
+        Index("ix_kanban_boards_owner_id", "owner_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
@@ -112,29 +234,38 @@ class KanbanBoard(Base):
         "KanbanColumn",
         back_populates="board",
         cascade="all, delete-orphan",
-        order_by="KanbanColumn.position",
+        order_by="[KanbanColumn.rank, KanbanColumn.id]",
     )
 
 
 class KanbanColumn(Base):
     __tablename__ = "kanban_columns"
+    __table_args__ = (
+        Index("ix_kanban_columns_board_id_rank", "board_id", "rank"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     position = Column(Integer, default=0, nullable=False)
+    # lexicographic order key (see ranking.py); position is kept for old clients
+    rank = Column(RankKey, nullable=True)
     board_id = Column(Integer, ForeignKey("kanban_boards.id", ondelete="CASCADE"), nullable=False)
+    updated_at = Column(DateTime, default=dt.utcnow, onupdate=dt.utcnow, nullable=True)
 
     board = relationship("KanbanBoard", back_populates="columns")
     cards = relationship(
         "KanbanCard",
         back_populates="column",
         cascade="all, delete-orphan",
-        order_by="KanbanCard.position",
+        order_by="[KanbanCard.rank, KanbanCard.id]",
     )
 
 
 class KanbanCard(Base):
     __tablename__ = "kanban_cards"
+    __table_args__ = (
+        Index("ix_kanban_cards_column_id_rank", "column_id", "rank"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -142,6 +273,7 @@ class KanbanCard(Base):
     due_date = Column(DateTime, nullable=True)
     priority = Column(Integer, default=3, nullable=False)
     position = Column(Integer, default=0, nullable=False)
+    rank = Column(RankKey, nullable=True)
     ai_suggestion = Column(Text, nullable=True)
     column_id = Column(Integer, ForeignKey("kanban_columns.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime, default=dt.utcnow, nullable=True)
@@ -0,0 +1,133 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+PAGE_MAX_LIMIT = 100
+
+# (column, descending); the last key must be unique (normally the id) and
+# no key may be NULL, so every row has exactly one place in the order
+SortKey = Tuple[Any, bool]
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, PAGE_MAX_LIMIT))
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(*values) -> str:
+    """Opaque cursor for the sort-key values of the last row on a page."""
+    raw = json.dumps([_plain(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> list:
+    """Sort-key values from a cursor, coerced to `types`. Raises ValueError."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError("malformed cursor") from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("cursor does not match this listing")
+    decoded = []
+    for value, kind in zip(values, types):
+        if kind is datetime:
+            decoded.append(datetime.fromisoformat(value))
+        elif kind is date:
+            decoded.append(date.fromisoformat(value))
+        else:
+            decoded.append(kind(value))
+    return decoded
+
+
+def _seek(keys: Sequence[SortKey], values: Sequence) -> Any:
+    """Rows strictly after `values` in key order: k1 beyond v1, or k1 = v1 and k2 beyond v2, ..."""
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*[keys[j][0] == values[j] for j in range(i)], beyond))
+    # the redundant bound on the leading key lets the planner start the
+    # index range at the cursor instead of filtering from the first row
+    first, descending = keys[0]
+    bound = first <= values[0] if descending else first >= values[0]
+    return and_(bound, or_(*clauses))
+
+
+def _page_statement(statement: Select, keys: Sequence[SortKey], limit: int, cursor: Optional[str]) -> Select:
+    if cursor:
+        try:
+            values = decode_cursor(cursor, [column.type.python_type for column, _ in keys])
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        statement = statement.where(_seek(keys, values))
+
+    statement = statement.order_by(
+        *[column.desc() if descending else column.asc() for column, descending in keys]
+    )
+    # one extra row tells us whether there is a next page
+    return statement.limit(limit + 1)
+
+
+def _page(items: Sequence, keys: Sequence[SortKey], limit: int) -> Tuple[List[Any], Optional[str]]:
+    if len(items) <= limit:
+        return list(items), None
+    items = list(items[:limit])
+    last = items[-1]
+    return items, encode_cursor(*[getattr(last, column.key) for column, _ in keys])
+
+
+def paginate(
+    db: Session,
+    statement: Select,
+    keys: Sequence[SortKey],
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    One page of the entities `statement` selects, in `keys` order, starting
+    after `cursor`. Seeks past the previous page through the index instead
+    of using OFFSET, so deep pages cost the same as the first. Returns the
+    items and the cursor for the next page (None on the last page).
+    Raises HTTP 400 for a cursor that cannot be decoded.
+    """
+    limit = clamp_limit(limit)
+    items = db.scalars(_page_statement(statement, keys, limit, cursor)).all()
+    return _page(items, keys, limit)
+
+
+async def paginate_async(
+    db: AsyncSession,
+    statement: Select,
+    keys: Sequence[SortKey],
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """paginate() on an AsyncSession."""
+    limit = clamp_limit(limit)
+    items = (await db.scalars(_page_statement(statement, keys, limit, cursor))).all()
+    return _page(items, keys, limit)
+
+
+def _count_before_statement(statement: Select, keys: Sequence[SortKey], values: Sequence) -> Select:
+    reverse = [(column, not descending) for column, descending in keys]
+    return select(func.count()).select_from(statement.where(_seek(reverse, values)).subquery())
+
+
+def count_before(db: Session, statement: Select, keys: Sequence[SortKey], values: Sequence) -> int:
+    """How many rows of `statement` sort strictly before `values` (e.g. to number a page)."""
+    return db.scalar(_count_before_statement(statement, keys, values))
+
+
+async def count_before_async(db: AsyncSession, statement: Select, keys: Sequence[SortKey], values: Sequence) -> int:
+    return await db.scalar(_count_before_statement(statement, keys, values))
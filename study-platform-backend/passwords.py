@@ -0,0 +1,84 @@
+import asyncio
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+load_dotenv()
+
+
+# bcrypt cost factor for new hashes; older hashes are upgraded on login
+BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Worker processes for hashing; 0 hashes on the shared threadpool instead
+PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_COST = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+# Plain functions run inside the worker processes. This module imports
+# nothing from the app so spawned workers start quickly.
+
+def hash_sync(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    password_bytes = password.encode("utf-8")[:72]
+    return bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def verify_sync(password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8")[:72], hashed_password.encode("utf-8"))
+    except Exception:
+        return False
+
+
+def needs_rehash(hashed_password: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    """True for hashes made with a different cost factor than the current one."""
+    match = _COST.match(hashed_password or "")
+    return match is None or int(match.group(1)) != rounds
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the server process has threads and open connections
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def _run(fn, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return await run_in_threadpool(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+
+
+async def hash_password(password: str) -> str:
+    """bcrypt hash computed off the event loop and off the request threadpool."""
+    return await _run(hash_sync, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run(verify_sync, password, hashed_password)
+
+
+def start() -> None:
+    """Spin the workers up front so the first logins do not pay for it."""
+    if PASSWORD_HASH_WORKERS > 0:
+        executor = _get_executor()
+        for _ in range(PASSWORD_HASH_WORKERS):
+            executor.submit(needs_rehash, "")
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import os
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, func, select, union, update
+from sqlalchemy.orm import Session
+
+import database
+import models
+
+load_dotenv()
+
+
+# Keys longer than this are respaced by the rebalance job
+RANK_MAX_LENGTH: int = int(os.getenv("RANK_MAX_LENGTH", "24"))
+# 0 disables the in-process background job (run `python ranking.py rebalance` instead)
+RANK_REBALANCE_INTERVAL_SECONDS: int = int(os.getenv("RANK_REBALANCE_INTERVAL_SECONDS", "3600"))
+
+# Ascending in byte order, so keys sort the same in Python, SQLite and
+# Postgres "C" collation
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+_VALUE = {digit: value for value, digit in enumerate(DIGITS)}
+
+
+def _midpoint(low: str, high: Optional[str]) -> str:
+    """
+    A key strictly between `low` ("" = start) and `high` (None = end).
+    Keys are base-62 fractions (digits after the point), never ending in
+    "0", so there is always room for another key in between.
+    """
+    if high is not None:
+        # copy the shared prefix, treating a short `low` as padded with zeros
+        n = 0
+        while n < len(high) and (low[n] if n < len(low) else "0") == high[n]:
+            n += 1
+        if n:
+            return high[:n] + _midpoint(low[n:], high[n:])
+
+    low_digit = _VALUE[low[0]] if low else 0
+    high_digit = _VALUE[high[0]] if high is not None else BASE
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    # adjacent first digits
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[low_digit] + _midpoint(low[1:], None)
+
+
+def rank_between(before: Optional[str], after: Optional[str]) -> str:
+    """
+    Rank key that sorts after `before` and before `after`; either may be
+    None for the start or end of the list. Raises ValueError if they are
+    out of order.
+    """
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"rank {before!r} does not sort before {after!r}")
+    # appends and prepends step the earliest digit that has room rather
+    # than halving the gap, so keys grow slowly at either end of a list
+    if after is None and before:
+        for i, digit in enumerate(before):
+            if digit != DIGITS[-1]:
+                return before[:i] + DIGITS[_VALUE[digit] + 1]
+    if before is None and after:
+        for i, digit in enumerate(after):
+            if _VALUE[digit] > 1:
+                return after[:i] + DIGITS[_VALUE[digit] - 1]
+    return _midpoint(before or "", after)
+
+
+def spread(count: int) -> List[str]:
+    """`count` ascending keys spaced evenly, as short as possible."""
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width / (count + 1)
+    keys = []
+    for i in range(1, count + 1):
+        value = int(step * i)
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
+
+
+def _respace(db: Session, model, parent, parent_id: int) -> int:
+    table = model.__table__
+    ids = db.execute(
+        select(table.c.id)
+        .where(parent == parent_id)
+        .order_by(table.c.rank.is_(None), table.c.rank, table.c.position, table.c.id)
+    ).scalars().all()
+    if ids:
+        db.execute(
+            update(table).where(table.c.id == bindparam("row_id")).values(rank=bindparam("new_rank")),
+            [{"row_id": row_id, "new_rank": key} for row_id, key in zip(ids, spread(len(ids)))],
+        )
+    return len(ids)
+
+
+def _parents_needing_work(db: Session, model, parent, max_length: int) -> List[int]:
+    # lists with unranked rows, overlong keys, or keys that collided when
+    # two items were appended concurrently
+    table = model.__table__
+    overgrown = select(parent).where(
+        table.c.rank.is_(None) | (func.length(table.c.rank) > max_length)
+    )
+    colliding = (
+        select(parent)
+        .where(table.c.rank.is_not(None))
+        .group_by(parent, table.c.rank)
+        .having(func.count() > 1)
+    )
+    return db.execute(union(overgrown, colliding)).scalars().all()
+
+
+def rebalance(db: Session, max_length: int = RANK_MAX_LENGTH) -> int:
+    """
+    Respace every column (and board) holding a missing, duplicated or
+    longer-than-`max_length` rank, keeping the current order. Returns
+    lists rewritten.
+    """
+    rewritten = 0
+    for model, parent in (
+        (models.KanbanCard, models.KanbanCard.__table__.c.column_id),
+        (models.KanbanColumn, models.KanbanColumn.__table__.c.board_id),
+    ):
+        for parent_id in _parents_needing_work(db, model, parent, max_length):
+            _respace(db, model, parent, parent_id)
+            db.commit()
+            rewritten += 1
+    return rewritten
+
+
+def run_rebalance() -> int:
+    with database.SessionLocal() as db:
+        return rebalance(db)
+
+
+async def rebalance_loop(interval: int = RANK_REBALANCE_INTERVAL_SECONDS) -> None:
+    """Background task: respace overgrown rank keys every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            rewritten = await run_in_threadpool(run_rebalance)
+            if rewritten:
+                print(f"✓ Kanban ranks: respaced {rewritten} lists")
+        except Exception as e:
+            print(f"Note: Kanban rank rebalance failed: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain Kanban rank keys")
+    parser.add_argument("command", choices=["rebalance"])
+    parser.add_argument("--max-length", type=int, default=RANK_MAX_LENGTH)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as session:
+        print(f"✓ Respaced {rebalance(session, args.max_length)} lists")
@@ -0,0 +1,277 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+import auth
+
+load_dotenv()
+
+
+# memory (per process) | sqlite | redis (shared by every worker)
+RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_URL: str = os.getenv("RATE_LIMIT_URL", "")
+# Per user and bucket: requests allowed in a burst, and refilled per minute
+RATE_LIMIT_TUTOR_BURST: int = int(os.getenv("RATE_LIMIT_TUTOR_BURST", "5"))
+RATE_LIMIT_TUTOR_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_TUTOR_PER_MINUTE", "10"))
+RATE_LIMIT_ASSESSMENT_BURST: int = int(os.getenv("RATE_LIMIT_ASSESSMENT_BURST", "3"))
+RATE_LIMIT_ASSESSMENT_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_ASSESSMENT_PER_MINUTE", "4"))
+RATE_LIMIT_SUGGEST_BURST: int = int(os.getenv("RATE_LIMIT_SUGGEST_BURST", "10"))
+RATE_LIMIT_SUGGEST_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_SUGGEST_PER_MINUTE", "20"))
+# Buckets kept by the memory backend; least recently used go first
+RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class Limit:
+    """A token bucket: `burst` tokens, refilled at `per_minute`."""
+
+    def __init__(self, burst: int, per_minute: float):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+
+
+LIMITS: Dict[str, Limit] = {
+    "tutor": Limit(RATE_LIMIT_TUTOR_BURST, RATE_LIMIT_TUTOR_PER_MINUTE),
+    "assessment": Limit(RATE_LIMIT_ASSESSMENT_BURST, RATE_LIMIT_ASSESSMENT_PER_MINUTE),
+    "kanban_suggest": Limit(RATE_LIMIT_SUGGEST_BURST, RATE_LIMIT_SUGGEST_PER_MINUTE),
+}
+
+# POST routes that draw from each bucket (the streaming and batch variants
+# share their route's bucket)
+ROUTES: Dict[str, str] = {
+    "/api/tutor/ask": "tutor",
+    "/api/tutor/ask/stream": "tutor",
+    "/api/assessment/generate": "assessment",
+    "/api/kanban/suggest": "kanban_suggest",
+    "/api/kanban/suggest/batch": "kanban_suggest",
+}
+
+
+def _refill(tokens: float, updated_at: float, limit: Limit, now: float) -> float:
+    return min(float(limit.burst), tokens + max(0.0, now - updated_at) * limit.rate)
+
+
+def _outcome(tokens: float, limit: Limit) -> Tuple[float, float]:
+    """(tokens left after taking one, seconds until one is available if none was)."""
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.rate if limit.rate else math.inf
+
+
+class MemoryBuckets:
+    """Buckets in this process only; each worker enforces the limit on its own."""
+
+    # take() never waits on I/O, so the middleware calls it inline
+    blocking = False
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (limit.burst, now))
+            tokens, wait = _outcome(_refill(tokens, updated_at, limit, now), limit)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file shared by the workers of one host."""
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            " key TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def take(self, key: str, limit: Limit, now: float) -> float:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so read-modify-write
+            # is atomic across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limits WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated_at = row if row else (limit.burst, now)
+                tokens, wait = _outcome(_refill(tokens, updated_at, limit, now), limit)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return wait
+
+
+class RedisBuckets:
+    """
+    Any Redis-protocol server (Redis, Valkey, KeyDB, ...). The bucket is
+    updated by a Lua script, so it is atomic across workers and hosts;
+    idle buckets expire once they would be full again.
+    """
+
+    blocking = True
+
+    SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local burst, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+elseif rate > 0 then
+  wait = (1 - tokens) / rate
+else
+  wait = -1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+if rate > 0 then
+  redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+end
+return tostring(wait)
+"""
+
+    def __init__(self, url: str, prefix: str = "rate_limit:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError("RATE_LIMIT_BACKEND=redis requires the 'redis' package") from e
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key: str, limit: Limit, now: float) -> float:
+        wait = float(self._script(keys=[self.prefix + key], args=[limit.burst, limit.rate, now]))
+        return math.inf if wait < 0 else wait
+
+
+class RateLimiter:
+    """Token buckets per (user, bucket name) on a storage backend, with counters for /health."""
+
+    def __init__(self, backend, limits: Dict[str, Limit] = LIMITS):
+        self.backend = backend
+        self.limits = limits
+        self.allowed: Dict[str, int] = {name: 0 for name in limits}
+        self.rejected: Dict[str, int] = {name: 0 for name in limits}
+        self.errors = 0
+
+    def check(self, user_id: int, name: str) -> Optional[float]:
+        """
+        Take a token from the user's `name` bucket. None if the call may
+        proceed, else the seconds until it would be allowed.
+        """
+        limit = self.limits[name]
+        try:
+            wait = self.backend.take(f"{name}:{user_id}", limit, time.time())
+        except Exception:
+            # a broken store must not take the AI endpoints down with it
+            self.errors += 1
+            return None
+        if wait > 0:
+            self.rejected[name] += 1
+            return wait
+        self.allowed[name] += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "limits": {
+                name: {"burst": limit.burst, "per_minute": round(limit.rate * 60, 2)}
+                for name, limit in self.limits.items()
+            },
+            "allowed": dict(self.allowed),
+            "rejected": dict(self.rejected),
+            "errors": self.errors,
+        }
+
+
+def build_limiter(backend: str = RATE_LIMIT_BACKEND, url: str = RATE_LIMIT_URL) -> RateLimiter:
+    """Build a limiter from RATE_LIMIT_BACKEND (memory | sqlite | redis) and RATE_LIMIT_URL."""
+    if backend == "memory":
+        return RateLimiter(MemoryBuckets())
+    if backend == "sqlite":
+        return RateLimiter(SQLiteBuckets(url or "rate_limits.sqlite3"))
+    if backend == "redis":
+        return RateLimiter(RedisBuckets(url or "redis://localhost:6379/0"))
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+limiter = build_limiter()
+
+
+def retry_after_header(wait: float) -> str:
+    return str(max(1, math.ceil(min(wait, 86400))))
+
+
+class RateLimitMiddleware:
+    """
+    Rejects a signed-in user's POST to a rate-limited AI route with 429 and
+    Retry-After once their bucket for it is empty. Requests without a valid
+    token pass through and are turned away by the route's own auth.
+    """
+
+    def __init__(self, app, routes: Dict[str, str] = ROUTES):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        name = (
+            self.routes.get(scope["path"].rstrip("/"))
+            if scope["type"] == "http" and scope["method"] == "POST"
+            else None
+        )
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        user_id = auth.token_user_id(headers.get(b"authorization", b"").decode("latin-1"))
+        if user_id is None:
+            wait = None
+        elif limiter.backend.blocking:
+            # a file lock or a network round-trip must not stall the event loop
+            wait = await run_in_threadpool(limiter.check, user_id, name)
+        else:
+            wait = limiter.check(user_id, name)
+        if wait is None:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = retry_after_header(wait)
+        body = json.dumps({"detail": f"Rate limit exceeded, retry in {retry_after} seconds"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", retry_after.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
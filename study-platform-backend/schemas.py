@@ -1,5 +1,6 @@
+import json
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Any, Generic, Optional, List, TypeVar
 from enum import Enum
 from pydantic import BaseModel, EmailStr, Field, field_validator
 
@@ -12,6 +13,15 @@ class ORMBase(BaseModel):
     class Config:
         from_attributes = True
 
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    """One page of a listing; pass `next_cursor` back as `cursor` for the next."""
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 #Study Logs
 class StudyLogBase(BaseModel):
     topic: str = Field(..., min_length=2, max_length=100)
@@ -29,6 +39,19 @@ class StudyLogResponse(ORMBase, StudyLogBase):
     user_id: int
     created_at: Optional[datetime] = None
 
+
+class StudyLogImportError(BaseModel):
+    line: int
+    error: str
+
+
+class StudyLogImportResponse(BaseModel):
+    imported: int
+    failed: int
+    xp_awarded: int
+    errors: List[StudyLogImportError] = []
+    errors_truncated: bool = False
+
 #users
 class UserBase(BaseModel):
     email: EmailStr
@@ -84,6 +107,8 @@ class ConversationResponse(ORMBase):
     question: str
     answer: str
     created_at: datetime
+    prompt_tokens: Optional[int] = None
+    answer_tokens: Optional[int] = None
 
 
 #Study Groups 
@@ -128,6 +153,7 @@ class LeaderboardEntry(BaseModel):
 class LeaderboardResponse(BaseModel):
     entries: List[LeaderboardEntry]
     user_rank: Optional[LeaderboardEntry] = None
+    next_cursor: Optional[str] = None
 
 
 #kanban
@@ -151,6 +177,7 @@ class KanbanColumnResponse(ORMBase):
     id: int
     title: str
     position: int
+    rank: Optional[str] = None
     board_id: int
 
 
@@ -178,11 +205,101 @@ class KanbanCardResponse(ORMBase):
     due_date: Optional[datetime] = None
     priority: int
     position: int
+    rank: Optional[str] = None
     ai_suggestion: Optional[str] = None
     column_id: int
 
 
+class KanbanColumnWithCardsResponse(KanbanColumnResponse):
+    cards: List[KanbanCardResponse] = []
+
+
+class KanbanBoardFullResponse(KanbanBoardResponse):
+    columns: List[KanbanColumnWithCardsResponse] = []
+
+
+class KanbanCardMove(BaseModel):
+    card_id: int
+    # target column; defaults to the card's current column
+    column_id: Optional[int] = None
+    # neighbours the card should land between; omit both to move to the end
+    after_id: Optional[int] = None
+    before_id: Optional[int] = None
+
+
+class KanbanColumnMove(BaseModel):
+    column_id: int
+    after_id: Optional[int] = None
+    before_id: Optional[int] = None
+
+
+class KanbanMoveRequest(BaseModel):
+    cards: List[KanbanCardMove] = Field(default_factory=list, max_length=500)
+    columns: List[KanbanColumnMove] = Field(default_factory=list, max_length=100)
+
+
+class KanbanMoveResponse(BaseModel):
+    cards: List[KanbanCardResponse] = []
+    columns: List[KanbanColumnResponse] = []
+
+
 class KanbanSuggestionResponse(BaseModel):
     suggested_title: str
     suggested_priority: int = Field(..., ge=1, le=5)
-    suggested_notes: Optional[str] = None
\ No newline at end of file
+    suggested_notes: Optional[str] = None
+
+class KanbanBatchSuggestRequest(BaseModel):
+    board_id: int
+    # only this column's cards; the whole board when omitted
+    column_id: Optional[int] = None
+
+
+class KanbanCardSuggestion(KanbanSuggestionResponse):
+    card_id: int
+
+
+class KanbanCardSuggestionBatch(BaseModel):
+    suggestions: List[KanbanCardSuggestion]
+
+
+class KanbanSuggestionRequest(BaseModel):
+    title: str = ""
+    description: Optional[str] = None
+    due_date: Optional[str] = None
+
+
+#Background jobs
+class JobKind(str, Enum):
+    tutor = "tutor"
+    assessment = "assessment"
+    card_suggestion = "card_suggestion"
+    card_suggestions = "card_suggestions"
+
+
+class JobCreate(BaseModel):
+    kind: JobKind
+    # the body the matching inline endpoint takes: ConversationCreate,
+    # AssessmentRequest, KanbanSuggestionRequest or KanbanBatchSuggestRequest
+    payload: dict
+    webhook_url: Optional[str] = Field(None, max_length=2000, pattern=r"^https?://")
+
+
+class JobResponse(ORMBase):
+    id: int
+    kind: JobKind
+    status: str
+    attempts: int
+    result: Any = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    @field_validator("result", mode="before")
+    @classmethod
+    def decode_result(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+
+class JobCreated(JobResponse):
+    # key of the X-Job-Signature HMAC; only returned here, when the job is submitted
+    webhook_secret: Optional[str] = None
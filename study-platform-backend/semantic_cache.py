@@ -0,0 +1,263 @@
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+import ai_cache
+
+load_dotenv()
+
+
+# Cosine similarity a stored question needs to be served instead of a model call
+SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+# Dimensions of the hashed embedding
+SEMANTIC_CACHE_DIM: int = int(os.getenv("SEMANTIC_CACHE_DIM", "256"))
+# Answers kept per topic and topics kept overall; least recently used go first
+SEMANTIC_CACHE_TOPIC_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_TOPIC_ENTRIES", "1000"))
+SEMANTIC_CACHE_MAX_TOPICS: int = int(os.getenv("SEMANTIC_CACHE_MAX_TOPICS", "500"))
+# Recent conversations loaded into the cache at startup
+SEMANTIC_CACHE_WARM_ROWS: int = int(os.getenv("SEMANTIC_CACHE_WARM_ROWS", "5000"))
+
+# LSH layout: TABLES hash tables of BITS random hyperplanes each. A lookup
+# probes its own bucket and every bucket one bit away in each table, which
+# finds neighbours above ~0.85 cosine with high probability.
+LSH_TABLES = 4
+LSH_BITS = 10
+# Partitions this small are scanned exactly; probing buckets costs more
+EXACT_SCAN_ENTRIES = 256
+
+_TOKEN = re.compile(r"\w+")
+# Function words and pleasantries that do not change what is being asked;
+# question words (what, why, how, ...) are kept
+_STOP_WORDS = frozenset(
+    "a an the is are was were be been am to of in on at for and or it this that "
+    "i me my you your can could would will please hey hi hello quick question just so "
+    "do does did s explain tell about".split()
+)
+
+
+# Tokens whose change turns a question into a different one however similar
+# the rest is: numbers, math operators, single-letter variables, formulas and
+# names written with inner capitals or all caps (HCl, NaCl, DNA, H2O)
+_EXACT_TOKEN = re.compile(
+    r"\d+(?:\.\d+)?"
+    r"|[\^+*/=<>%√∑∫π]|(?<=\s)-(?=\s)|-(?=\d)"
+    r"|\b\w*[A-Za-z]\w*\d\w*\b|\b\w*\d\w*[A-Za-z]\w*\b"
+    r"|\b[A-Za-z]+[A-Z]\w*\b"
+    r"|(?<!['’])\b[b-hj-zB-HJ-Z]\b"
+)
+_NEGATION = re.compile(
+    r"\b(?:not|no|never|nor|none|nobody|nothing|neither|cannot|without)\b|n['’]t\b",
+    re.IGNORECASE,
+)
+
+QuestionKey = Tuple[frozenset, int]
+
+
+def question_key(question: str) -> QuestionKey:
+    """
+    What two questions must share to get the same answer, whatever their
+    cosine: the same exact tokens (see _EXACT_TOKEN, case-insensitive) and
+    the same number of negations. "derivative of x^2" vs "x^3", "Is HCl
+    ionic" vs "Is NaCl ionic" and "is" vs "is not" all differ here.
+    """
+    tokens = frozenset(token.casefold() for token in _EXACT_TOKEN.findall(question))
+    return tokens, len(_NEGATION.findall(question))
+
+
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    digest = zlib.crc32(feature.encode("utf-8"))
+    return digest % dim, 1.0 if digest & 0x80000000 else -1.0
+
+
+def embed(topic: str, question: str, dim: int = SEMANTIC_CACHE_DIM) -> np.ndarray:
+    """
+    Unit-length feature-hashed vector of a question: its content words,
+    word pairs and character trigrams, plus the topic's words. Deterministic
+    across processes and needs no model; filler words, punctuation and typos
+    move it little while a different question moves it a lot.
+    """
+    words = [word for word in _TOKEN.findall(question.casefold()) if word not in _STOP_WORDS]
+    features = list(words)
+    features += [a + " " + b for a, b in zip(words, words[1:])]
+    text = " " + " ".join(words) + " "
+    features += ["#" + text[i:i + 3] for i in range(len(text) - 2)]
+    features += ["topic:" + word for word in _TOKEN.findall(topic.casefold())]
+
+    vector = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vector
+    for feature in features:
+        index, sign = _bucket(feature, dim)
+        vector[index] += sign
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class _Partition:
+    """The vectors and answers of one topic, with LRU slot reuse."""
+
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, 64), dim), dtype=np.float32)
+        self.codes = np.zeros((min(capacity, 64), LSH_TABLES), dtype=np.int64)
+        self.last_used = np.zeros(min(capacity, 64), dtype=np.int64)
+        self.answers: List[str] = []
+        self.keys: List[QuestionKey] = []
+        self.buckets: List[Dict[int, Set[int]]] = [{} for _ in range(LSH_TABLES)]
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def _grow(self) -> None:
+        size = min(self.capacity, 2 * len(self.vectors))
+        self.vectors = np.resize(self.vectors, (size, self.vectors.shape[1]))
+        self.codes = np.resize(self.codes, (size, LSH_TABLES))
+        self.last_used = np.resize(self.last_used, size)
+
+    def candidates(self, codes: np.ndarray) -> np.ndarray:
+        size = len(self)
+        if size <= EXACT_SCAN_ENTRIES:
+            return np.arange(size)
+        found: Set[int] = set()
+        for table, code in enumerate(codes.tolist()):
+            buckets = self.buckets[table]
+            found.update(buckets.get(code, ()))
+            for bit in range(LSH_BITS):
+                found.update(buckets.get(code ^ (1 << bit), ()))
+        return np.fromiter(found, dtype=np.int64, count=len(found))
+
+    def add(self, vector: np.ndarray, codes: np.ndarray, key: QuestionKey, answer: str, tick: int) -> bool:
+        """Store an answer; True when it replaced the least recently used one."""
+        evicted = len(self) >= self.capacity
+        if evicted:
+            slot = int(np.argmin(self.last_used))
+            for table, code in enumerate(self.codes[slot].tolist()):
+                self.buckets[table][code].discard(slot)
+            self.answers[slot] = answer
+            self.keys[slot] = key
+        else:
+            slot = len(self)
+            if slot == len(self.vectors):
+                self._grow()
+            self.answers.append(answer)
+            self.keys.append(key)
+        self.vectors[slot] = vector
+        self.codes[slot] = codes
+        self.last_used[slot] = tick
+        for table, code in enumerate(codes.tolist()):
+            self.buckets[table].setdefault(code, set()).add(slot)
+        return evicted
+
+
+class SemanticCache:
+    """
+    Tutor answers looked up by meaning rather than exact text. Each
+    normalized topic is its own partition (a question only ever matches
+    within its topic) holding a NumPy matrix of embeddings; lookups take
+    LSH candidates with the same question_key and rank them by exact cosine. Entries and whole topics
+    are evicted least recently used first. In process, like the leaderboard.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        dim: int = SEMANTIC_CACHE_DIM,
+        topic_entries: int = SEMANTIC_CACHE_TOPIC_ENTRIES,
+        max_topics: int = SEMANTIC_CACHE_MAX_TOPICS,
+    ):
+        self.threshold = threshold
+        self.dim = dim
+        self.topic_entries = topic_entries
+        self.max_topics = max_topics
+        self._planes = np.random.default_rng(0).standard_normal(
+            (LSH_TABLES * LSH_BITS, dim)
+        ).astype(np.float32)
+        self._powers = 1 << np.arange(LSH_BITS, dtype=np.int64)
+        self._partitions: "OrderedDict[str, _Partition]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._tick = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _codes(self, vector: np.ndarray) -> np.ndarray:
+        bits = (self._planes @ vector > 0).reshape(LSH_TABLES, LSH_BITS)
+        return bits.astype(np.int64) @ self._powers
+
+    def _best(
+        self, partition: _Partition, vector: np.ndarray, codes: np.ndarray, key: QuestionKey,
+    ) -> Tuple[int, float]:
+        """Most similar stored question with the same question_key, and its cosine."""
+        rows = partition.candidates(codes)
+        rows = rows[[partition.keys[row] == key for row in rows.tolist()]] if len(rows) else rows
+        if not len(rows):
+            return -1, 0.0
+        similarities = partition.vectors[rows] @ vector
+        best = int(np.argmax(similarities))
+        return int(rows[best]), float(similarities[best])
+
+    def lookup(self, topic: str, question: str) -> Optional[str]:
+        """A stored answer to a question similar enough to this one, or None."""
+        vector = embed(topic, question, self.dim)
+        codes = self._codes(vector)
+        exact = question_key(question)
+        key = ai_cache.normalize_topic(topic)
+        with self._lock:
+            partition = self._partitions.get(key)
+            slot, similarity = self._best(partition, vector, codes, exact) if partition else (-1, 0.0)
+            if slot < 0 or similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._tick += 1
+            partition.last_used[slot] = self._tick
+            self._partitions.move_to_end(key)
+            return partition.answers[slot]
+
+    def add(self, topic: str, question: str, answer: str) -> None:
+        vector = embed(topic, question, self.dim)
+        if not vector.any():
+            return
+        codes = self._codes(vector)
+        exact = question_key(question)
+        key = ai_cache.normalize_topic(topic)
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _Partition(self.dim, self.topic_entries)
+                while len(self._partitions) > self.max_topics:
+                    _, dropped = self._partitions.popitem(last=False)
+                    self.evictions += len(dropped)
+            elif self._best(partition, vector, codes, exact)[1] >= 0.999:
+                # the same question again (e.g. two misses racing)
+                return
+            self._partitions.move_to_end(key)
+            self._tick += 1
+            if partition.add(vector, codes, exact, answer, self._tick):
+                self.evictions += 1
+
+    def warm(self, rows: Iterable[Tuple[str, str, str]]) -> None:
+        """Load (topic, question, answer) rows, oldest first."""
+        for topic, question, answer in rows:
+            self.add(topic, question, answer)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = sum(len(partition) for partition in self._partitions.values())
+            topics = len(self._partitions)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "topics": topics,
+            "evictions": self.evictions,
+            "threshold": self.threshold,
+        }
@@ -0,0 +1,181 @@
+import argparse
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import database
+import models
+import streaks
+
+
+def _latest_run_length(db: Session, user_id: int) -> int:
+    _, length = streaks.latest_runs(db, [user_id]).get(user_id, (None, 0))
+    return length
+
+
+def _summarize(db: Session, user_id: int, row: models.UserStudyStats) -> models.UserStudyStats:
+    total_hours, session_count, topic_count, last_study_date = (
+        db.query(
+            func.coalesce(func.sum(models.StudyLog.hours), 0),
+            func.count(models.StudyLog.id),
+            func.count(func.distinct(models.StudyLog.topic)),
+            func.max(models.StudyLog.study_date),
+        )
+        .filter(models.StudyLog.user_id == user_id)
+        .one()
+    )
+    row.total_hours = float(total_hours)
+    row.session_count = session_count
+    row.topic_count = topic_count
+    row.last_study_date = last_study_date
+    row.streak_length = _latest_run_length(db, user_id)
+    row.updated_at = datetime.utcnow()
+    return row
+
+
+def rebuild_user_stats(db: Session, user_id: int) -> models.UserStudyStats:
+    """Recompute a user's summary row from their full study history."""
+    row = db.get(models.UserStudyStats, user_id)
+    if row is None:
+        row = models.UserStudyStats(user_id=user_id)
+        db.add(row)
+    _summarize(db, user_id, row)
+    db.flush()
+    return row
+
+
+def _ensure_row(db: Session, user_id: int) -> None:
+    # an empty row, unless a concurrent request already made one
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    db.execute(
+        insert(models.UserStudyStats)
+        .values(user_id=user_id, total_hours=0.0, session_count=0, topic_count=0, streak_length=0)
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    )
+
+
+def record_study_log(db: Session, log: models.StudyLog) -> models.UserStudyStats:
+    """
+    Add a new study log to the session and fold it into its owner's
+    summary row. Runs inside the caller's transaction; the caller commits.
+    Concurrent logs of one user serialise on the summary row's lock.
+    """
+    _ensure_row(db, log.user_id)
+    row = (
+        db.query(models.UserStudyStats)
+        .filter_by(user_id=log.user_id)
+        .with_for_update()
+        .populate_existing()
+        .one()
+    )
+
+    if not row.session_count:
+        # just created (or no logs yet): nothing to add on to
+        db.add(log)
+        db.flush()
+        return _summarize(db, log.user_id, row)
+
+    # only checked under the lock, so two new-topic logs are not both counted
+    new_topic = not db.query(
+        db.query(models.StudyLog.id)
+        .filter(
+            models.StudyLog.user_id == log.user_id,
+            models.StudyLog.topic == log.topic,
+        )
+        .exists()
+    ).scalar()
+
+    db.add(log)
+    db.flush()
+
+    row.total_hours = (row.total_hours or 0) + log.hours
+    row.session_count = (row.session_count or 0) + 1
+    if new_topic:
+        row.topic_count = (row.topic_count or 0) + 1
+
+    last = row.last_study_date
+    day = log.study_date
+    if last is None or day > last + timedelta(days=1):
+        row.last_study_date = day
+        row.streak_length = 1
+    elif day == last + timedelta(days=1):
+        row.last_study_date = day
+        row.streak_length = (row.streak_length or 0) + 1
+    elif day == last - timedelta(days=row.streak_length or 0):
+        # back-dated log fills the gap just before the current run and
+        # may join it to an older run
+        row.streak_length = _latest_run_length(db, log.user_id)
+
+    row.updated_at = datetime.utcnow()
+    return row
+
+
+def read_user_stats(db: Session, user_id: int) -> models.UserStudyStats:
+    """
+    Summary row for a user. A missing row is computed on the fly and not
+    stored, so this is safe on a read replica.
+    """
+    row = db.get(models.UserStudyStats, user_id)
+    if row is None:
+        row = _summarize(db, user_id, models.UserStudyStats(user_id=user_id))
+    return row
+
+
+def total_hours_by_user(db: Session, user_ids: list[int]) -> dict[int, float]:
+    """Total study hours per user, from summary rows where they exist."""
+    if not user_ids:
+        return {}
+    hours = dict(
+        db.query(models.UserStudyStats.user_id, models.UserStudyStats.total_hours)
+        .filter(models.UserStudyStats.user_id.in_(user_ids))
+        .all()
+    )
+    missing = [uid for uid in user_ids if uid not in hours]
+    if missing:
+        hours.update(
+            db.query(
+                models.StudyLog.user_id,
+                func.coalesce(func.sum(models.StudyLog.hours), 0),
+            )
+            .filter(models.StudyLog.user_id.in_(missing))
+            .group_by(models.StudyLog.user_id)
+            .all()
+        )
+    return {uid: float(hours.get(uid, 0)) for uid in user_ids}
+
+
+def latest_notes(db: Session, user_id: int, topic: str) -> str:
+    """Notes of the user's most recent log on `topic` ("" if none), to ground an assessment."""
+    notes = db.scalar(
+        select(models.StudyLog.notes)
+        .where(models.StudyLog.user_id == user_id, models.StudyLog.topic == topic)
+        .order_by(models.StudyLog.id.desc())
+        .limit(1)
+    )
+    return notes or ""
+
+
+def current_streak(row: models.UserStudyStats, today: date | None = None) -> int:
+    return streaks.streak_from_run(row.last_study_date, row.streak_length or 0, today)
+
+
+def backfill(db: Session) -> int:
+    """Rebuild the summary row of every user. Returns the number of users."""
+    user_ids = [uid for (uid,) in db.query(models.User.id).order_by(models.User.id)]
+    for user_id in user_ids:
+        rebuild_user_stats(db, user_id)
+        db.commit()
+    return len(user_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the user_study_stats table")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as session:
+        count = backfill(session)
+    print(f"✓ Rebuilt study stats for {count} users")
@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import Date, Integer, cast, func, literal, select
+from sqlalchemy.orm import Session
+
+import models
+
+
+def _day_number(db: Session, column):
+    """Integer day number for a DATE column, so consecutive days differ by 1."""
+    if db.get_bind().dialect.name == "postgresql":
+        # date - date yields an integer number of days on Postgres
+        return column - cast(literal("1970-01-01"), Date)
+    # SQLite (and the rest) fall back to the Julian day number
+    return cast(func.julianday(column), Integer)
+
+
+def latest_runs(db: Session, user_ids: Iterable[int]) -> Dict[int, Tuple[date, int]]:
+    """
+    For each user, the most recent run of consecutive study days as
+    (last day of the run, run length in days). Users without logs are omitted.
+
+    Gaps-and-islands in one query: over each user's distinct study days,
+    `day_number - row_number()` is constant within a run of consecutive days,
+    so grouping by it yields the runs; the window then keeps the newest run.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+
+    log = models.StudyLog
+    days = (
+        select(log.user_id, log.study_date)
+        .where(log.user_id.in_(user_ids))
+        .distinct()
+        .subquery()
+    )
+    islands = select(
+        days.c.user_id,
+        days.c.study_date,
+        (
+            _day_number(db, days.c.study_date)
+            - func.row_number().over(
+                partition_by=days.c.user_id,
+                order_by=days.c.study_date,
+            )
+        ).label("island"),
+    ).subquery()
+    runs = (
+        select(
+            islands.c.user_id,
+            func.max(islands.c.study_date).label("end_date"),
+            func.count().label("length"),
+        )
+        .group_by(islands.c.user_id, islands.c.island)
+        .subquery()
+    )
+    ranked = select(
+        runs.c.user_id,
+        runs.c.end_date,
+        runs.c.length,
+        func.row_number().over(
+            partition_by=runs.c.user_id,
+            order_by=runs.c.end_date.desc(),
+        ).label("rank"),
+    ).subquery()
+
+    rows = db.execute(
+        select(ranked.c.user_id, ranked.c.end_date, ranked.c.length)
+        .where(ranked.c.rank == 1)
+    )
+    return {
+        user_id: (_as_date(end_date), length)
+        for user_id, end_date, length in rows
+    }
+
+
+def _as_date(value) -> date:
+    # SQLite hands back the raw ISO string for aggregated DATE values
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def streak_from_run(end_date: date | None, length: int, today: date | None = None) -> int:
+    """A run only counts as a streak while its last day is today or yesterday."""
+    today = today or datetime.utcnow().date()
+    if end_date in (today, today - timedelta(days=1)):
+        return length
+    return 0
+
+
+def current_streaks(
+    db: Session,
+    user_ids: Iterable[int],
+    today: date | None = None,
+) -> Dict[int, int]:
+    """Current streak for each user id (0 for users without an active streak)."""
+    user_ids = list(user_ids)
+    runs = latest_runs(db, user_ids)
+    return {
+        user_id: streak_from_run(*runs.get(user_id, (None, 0)), today=today)
+        for user_id in user_ids
+    }
@@ -0,0 +1,170 @@
+import asyncio
+import os
+from typing import List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import ai_service
+import database
+import models
+import xp
+
+load_dotenv()
+
+
+# Most recent turns on a topic that go into the prompt verbatim
+TUTOR_CONTEXT_TURNS: int = int(os.getenv("TUTOR_CONTEXT_TURNS", "4"))
+# Longest answer quoted back verbatim; longer ones are cut
+TUTOR_CONTEXT_ANSWER_CHARS: int = int(os.getenv("TUTOR_CONTEXT_ANSWER_CHARS", "1200"))
+# Length cap on the running summary of the turns before those
+TUTOR_SUMMARY_MAX_WORDS: int = int(os.getenv("TUTOR_SUMMARY_MAX_WORDS", "150"))
+# Older turns folded into the summary per model call
+TUTOR_SUMMARY_BATCH: int = int(os.getenv("TUTOR_SUMMARY_BATCH", "8"))
+
+Turn = Tuple[str, str]
+
+_conversations = models.Conversation
+
+# (user_id, topic) pairs with a summary update in flight, and the tasks
+# themselves so they are not garbage collected mid-run
+_refreshing: Set[Tuple[int, str]] = set()
+_tasks: Set[asyncio.Task] = set()
+
+
+def _clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit].rstrip() + " ..."
+
+
+def load(db: Session, user_id: int, topic: str) -> str:
+    """
+    Prompt section with the user's conversation so far on `topic`: the
+    running summary plus the last TUTOR_CONTEXT_TURNS turns verbatim.
+    Bounded in size however long the history is; empty for a new topic.
+    """
+    summary = db.scalar(
+        select(models.TutorContext.summary)
+        .where(models.TutorContext.user_id == user_id, models.TutorContext.topic == topic)
+    )
+    turns: List[Turn] = db.execute(
+        select(_conversations.question, _conversations.answer)
+        .where(_conversations.user_id == user_id, _conversations.topic == topic)
+        .order_by(_conversations.id.desc())
+        .limit(TUTOR_CONTEXT_TURNS)
+    ).all()
+    if not summary and not turns:
+        return ""
+
+    lines = ["", "Conversation so far on this topic (use it to understand follow-up questions):"]
+    if summary:
+        lines.append(f"Summary of earlier turns: {_clip(summary, TUTOR_SUMMARY_MAX_WORDS * 8)}")
+    for question, answer in reversed(turns):
+        lines.append(f"Student: {question}")
+        lines.append(f"Tutor: {_clip(answer, TUTOR_CONTEXT_ANSWER_CHARS)}")
+    return "\n".join(lines) + "\n"
+
+
+def save_turn(db: Session, user_id: int, topic: str, question: str, reply: ai_service.TutorReply) -> models.Conversation:
+    """Store an answered question and award its XP; commits. Call schedule_refresh() after."""
+    conversation = models.Conversation(
+        user_id=user_id,
+        topic=topic,
+        question=question,
+        answer=reply.answer,
+        prompt_tokens=reply.prompt_tokens,
+        answer_tokens=reply.answer_tokens,
+        used_history=reply.used_history,
+    )
+    db.add(conversation)
+    xp.award(db, user_id, xp.TUTOR_QUESTION_XP, "tutor_question")
+    db.commit()
+    db.refresh(conversation)
+    return conversation
+
+
+def _pending(user_id: int, topic: str) -> Tuple[Optional[int], str, int, List[Tuple[int, str, str]]]:
+    """(context id, summary, summarized-through id, turns that dropped out of the window, oldest first)."""
+    with database.SessionLocal() as db:
+        row = db.execute(
+            select(
+                models.TutorContext.id,
+                models.TutorContext.summary,
+                models.TutorContext.summarized_through_id,
+            ).where(models.TutorContext.user_id == user_id, models.TutorContext.topic == topic)
+        ).first()
+        context_id, summary, through = row if row else (None, "", 0)
+        # the newest batch beyond the verbatim window; anything older than
+        # that is left out rather than summarized in many calls
+        turns = db.execute(
+            select(_conversations.id, _conversations.question, _conversations.answer)
+            .where(
+                _conversations.user_id == user_id,
+                _conversations.topic == topic,
+                _conversations.id > through,
+            )
+            .order_by(_conversations.id.desc())
+            .offset(TUTOR_CONTEXT_TURNS)
+            .limit(TUTOR_SUMMARY_BATCH)
+        ).all()
+    return context_id, summary, through, list(reversed(turns))
+
+
+def _store(user_id: int, topic: str, context_id: Optional[int], through: int, summary: str, new_through: int) -> None:
+    with database.SessionLocal() as db:
+        if context_id is None:
+            db.add(models.TutorContext(
+                user_id=user_id, topic=topic, summary=summary, summarized_through_id=new_through,
+            ))
+        else:
+            # only if nobody else moved the summary on in the meantime
+            db.execute(
+                update(models.TutorContext)
+                .where(
+                    models.TutorContext.id == context_id,
+                    models.TutorContext.summarized_through_id == through,
+                )
+                .values(summary=summary, summarized_through_id=new_through)
+            )
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+
+
+async def refresh(user_id: int, topic: str) -> None:
+    """Fold turns that left the verbatim window into the running summary."""
+    context_id, summary, through, turns = await run_in_threadpool(_pending, user_id, topic)
+    if not turns:
+        return
+    try:
+        new_summary = await ai_service.summarize_tutor_turns(
+            topic,
+            summary,
+            [(question, _clip(answer, TUTOR_CONTEXT_ANSWER_CHARS)) for _, question, answer in turns],
+            TUTOR_SUMMARY_MAX_WORDS,
+        )
+    except Exception:
+        # keep the old summary; the same turns are retried after the next question
+        return
+    await run_in_threadpool(_store, user_id, topic, context_id, through, new_summary, turns[-1][0])
+
+
+def schedule_refresh(user_id: int, topic: str) -> None:
+    """Run refresh() in the background after a new turn has been saved."""
+    key = (user_id, topic)
+    if key in _refreshing:
+        return
+    _refreshing.add(key)
+
+    async def run():
+        try:
+            await refresh(user_id, topic)
+        finally:
+            _refreshing.discard(key)
+
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
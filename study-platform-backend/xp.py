@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, Tuple
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, event, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.util import identity_key
+
+import auth
+import database
+import leaderboard
+import models
+
+load_dotenv()
+
+
+STUDY_LOG_XP = 15
+TUTOR_QUESTION_XP = 10
+GROUP_CREATED_XP = 50
+GROUP_JOINED_XP = 20
+
+# Ledger rows older than this are folded into one "balance" row per user
+XP_COMPACT_AFTER_DAYS: int = int(os.getenv("XP_COMPACT_AFTER_DAYS", "30"))
+# 0 disables the in-process background job (run `python xp.py compact` instead)
+XP_COMPACT_INTERVAL_SECONDS: int = int(os.getenv("XP_COMPACT_INTERVAL_SECONDS", "3600"))
+
+users = models.User.__table__
+xp_events = models.XPEvent.__table__
+
+
+def _remember(db: Session, user_id: int, total_xp: int) -> None:
+    # keep the caller's loaded User in step without marking it dirty
+    user = db.identity_map.get(identity_key(models.User, user_id))
+    if user is not None:
+        attributes.set_committed_value(user, "total_xp", total_xp)
+    # published to the leaderboard once the transaction commits
+    db.info.setdefault("xp_totals", {})[user_id] = total_xp
+
+
+def award(db: Session, user_id: int, amount: int, reason: str) -> int:
+    """
+    Append a ledger row and bump users.total_xp atomically in SQL.
+    Runs inside the caller's transaction; the caller commits.
+    Returns the user's new total.
+    """
+    db.execute(insert(xp_events).values(
+        user_id=user_id,
+        amount=amount,
+        reason=reason,
+        created_at=datetime.utcnow(),
+    ))
+    total_xp = db.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        .values(total_xp=func.coalesce(users.c.total_xp, 0) + amount)
+        .returning(users.c.total_xp)
+    ).scalar_one()
+    _remember(db, user_id, total_xp)
+    return total_xp
+
+
+def award_many(db: Session, awards: Iterable[Tuple[int, int, str]]) -> dict[int, int]:
+    """
+    Bulk version of award for (user_id, amount, reason) triples: one
+    executemany for the ledger and one per-user aggregated UPDATE.
+    Returns {user_id: new total}.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "amount": amount, "reason": reason, "created_at": now}
+        for user_id, amount, reason in awards
+    ]
+    if not rows:
+        return {}
+
+    deltas: dict[int, int] = defaultdict(int)
+    for row in rows:
+        deltas[row["user_id"]] += row["amount"]
+
+    db.execute(insert(xp_events), rows)
+    db.execute(
+        update(users)
+        .where(users.c.id == bindparam("uid"))
+        .values(total_xp=func.coalesce(users.c.total_xp, 0) + bindparam("delta")),
+        [{"uid": user_id, "delta": delta} for user_id, delta in deltas.items()],
+    )
+    totals = dict(db.execute(
+        select(users.c.id, users.c.total_xp).where(users.c.id.in_(list(deltas)))
+    ).all())
+    for user_id, total_xp in totals.items():
+        _remember(db, user_id, total_xp)
+    return totals
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_totals(db: Session) -> None:
+    for user_id, total_xp in db.info.pop("xp_totals", {}).items():
+        leaderboard.board.update(user_id, total_xp)
+        auth.user_cache.update(user_id, total_xp=total_xp)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_totals(db: Session) -> None:
+    db.info.pop("xp_totals", None)
+
+
+def open_balances(db: Session) -> int:
+    """
+    Seed a "balance" row for users whose XP predates the ledger, so ledger
+    sums cover their whole history. Returns the number of users seeded.
+    Safe to run from several workers at once: the unique balance index
+    turns away all but the first, which then seed nothing.
+    """
+    has_events = select(xp_events.c.id).where(xp_events.c.user_id == users.c.id).exists()
+    try:
+        result = db.execute(
+            insert(xp_events).from_select(
+                ["user_id", "amount", "reason", "created_at"],
+                select(
+                    users.c.id,
+                    users.c.total_xp,
+                    literal("balance"),
+                    func.coalesce(users.c.created_at, datetime.utcnow()),
+                ).where(users.c.total_xp > 0, ~has_events),
+            )
+        )
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return 0
+    return result.rowcount
+
+
+def compact(db: Session, older_than: timedelta = timedelta(days=XP_COMPACT_AFTER_DAYS)) -> int:
+    """Fold each user's old ledger rows into one balance row. Returns users compacted."""
+    cutoff = datetime.utcnow() - older_than
+    user_ids = db.execute(
+        select(xp_events.c.user_id)
+        .where(xp_events.c.created_at < cutoff)
+        .group_by(xp_events.c.user_id)
+        .having(func.count() > 1)
+    ).scalars().all()
+
+    for user_id in user_ids:
+        # serialise with awards and other compactors for this user
+        db.execute(select(users.c.id).where(users.c.id == user_id).with_for_update())
+        old = (xp_events.c.user_id == user_id) & (xp_events.c.created_at < cutoff)
+        total, count = db.execute(
+            select(func.coalesce(func.sum(xp_events.c.amount), 0), func.count()).where(old)
+        ).one()
+        if count > 1:
+            db.execute(xp_events.delete().where(old))
+            db.execute(insert(xp_events).values(
+                user_id=user_id, amount=total, reason="balance", created_at=cutoff,
+            ))
+        db.commit()
+    return len(user_ids)
+
+
+def reconcile(db: Session) -> int:
+    """Reset users.total_xp to the ledger sum wherever they drifted. Returns rows fixed."""
+    ledger_total = (
+        select(func.coalesce(func.sum(xp_events.c.amount), 0))
+        .where(xp_events.c.user_id == users.c.id)
+        .scalar_subquery()
+    )
+    result = db.execute(
+        update(users)
+        .where(func.coalesce(users.c.total_xp, 0) != ledger_total)
+        .values(total_xp=ledger_total)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def run_maintenance() -> Tuple[int, int]:
+    with database.SessionLocal() as db:
+        compacted = compact(db)
+        fixed = reconcile(db)
+        if fixed:
+            leaderboard.board.rebuild(db)
+    return compacted, fixed
+
+
+async def maintenance_loop(interval: int = XP_COMPACT_INTERVAL_SECONDS) -> None:
+    """Background task: compact and reconcile the ledger every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            compacted, fixed = await run_in_threadpool(run_maintenance)
+            if compacted or fixed:
+                print(f"✓ XP ledger: compacted {compacted} users, reconciled {fixed} totals")
+        except Exception as e:
+            print(f"Note: XP ledger maintenance failed: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the xp_events ledger")
+    parser.add_argument("command", choices=["open-balances", "compact", "reconcile"])
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as session:
+        if args.command == "open-balances":
+            print(f"✓ Seeded opening balances for {open_balances(session)} users")
+        elif args.command == "compact":
+            print(f"✓ Compacted the ledger of {compact(session)} users")
+        else:
+            print(f"✓ Reconciled {reconcile(session)} user totals")
@@ -5,8 +5,10 @@ function authHeaders() {
   return token ? { Authorization: `Bearer ${token}` } : {};
 }
 
-export async function fetchBoards() {
-  const res = await fetch(`${apiBase}/boards`, { headers: { ...authHeaders() } });
+// first page of boards; pass the previous page's next_cursor to continue
+export async function fetchBoards(cursor) {
+  const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+  const res = await fetch(`${apiBase}/boards${query}`, { headers: { ...authHeaders() } });
   return res.json();
 }
 
@@ -46,6 +48,16 @@ export async function updateCard(id, payload) {
   return res.json();
 }
 
+// Batch of { card_id, column_id?, after_id?, before_id? } moves, applied in one transaction
+export async function moveCards(cards, columns = []) {
+  const res = await fetch(`${apiBase}/moves`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", ...authHeaders() },
+    body: JSON.stringify({ cards, columns }),
+  });
+  return res.json();
+}
+
 export async function suggestCard(payload) {
   const res = await fetch(`${apiBase}/suggest`, {
     method: "POST",
@@ -63,4 +75,4 @@ export async function deleteCard(id) {
   return res.json();
 }
 
-export default { fetchBoards, createBoard, createColumn, createCard, updateCard, suggestCard, deleteCard };
+export default { fetchBoards, createBoard, createColumn, createCard, updateCard, moveCards, suggestCard, deleteCard };
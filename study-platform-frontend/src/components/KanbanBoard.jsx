@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react'
 import KanbanColumn from './KanbanColumn'
-import { createColumn, updateCard } from '../api/kanban'
+import { createColumn, moveCards } from '../api/kanban'
 import { DragDropContext, Droppable, Draggable } from 'react-beautiful-dnd'
 
 export default function KanbanBoard({ board, onBoardChange }){
@@ -21,6 +21,16 @@ export default function KanbanBoard({ board, onBoardChange }){
     return cols.find(c => String(c.id) === String(id))
   }
 
+  // only the moved card is rewritten; its new neighbours anchor the position
+  function moveFor(card, columnId, cards, index){
+    return {
+      card_id: card.id,
+      column_id: columnId,
+      after_id: index > 0 ? cards[index - 1].id : null,
+      before_id: index < cards.length - 1 ? cards[index + 1].id : null,
+    }
+  }
+
   const onDragEnd = async (result) => {
     if(!result.destination) return
     const sourceColId = result.source.droppableId
@@ -36,10 +46,7 @@ export default function KanbanBoard({ board, onBoardChange }){
       newCards.splice(destIndex,0,moved)
       const newCols = cols.map(c => c.id === col.id ? { ...c, cards: newCards } : c)
       setCols(newCols)
-      // update positions on server for cards in this column
-      for(let i=0;i<newCards.length;i++){
-        await updateCard(newCards[i].id, { position: i })
-      }
+      await moveCards([moveFor(moved, col.id, newCards, destIndex)])
       if(onBoardChange) onBoardChange({ ...board, columns: newCols })
       return
     }
@@ -60,15 +67,7 @@ export default function KanbanBoard({ board, onBoardChange }){
     })
 
     setCols(newCols)
-    // persist changed card
-    await updateCard(moved.id, { column_id: destCol.id, position: destIndex })
-    // update positions for affected cards
-    for(let i=0;i<destCards.length;i++){
-      await updateCard(destCards[i].id, { position: i })
-    }
-    for(let i=0;i<sourceCards.length;i++){
-      await updateCard(sourceCards[i].id, { position: i })
-    }
+    await moveCards([moveFor(moved, destCol.id, destCards, destIndex)])
 
     if(onBoardChange) onBoardChange({ ...board, columns: newCols })
   }
@@ -48,9 +48,10 @@ export default function ChatTutor() {
   const fetchChatHistory = async () => {
     try {
       const res = await API.get("/tutor/history");
-      if (res.data && res.data.length > 0) {
+      const history = res.data?.items || [];
+      if (history.length > 0) {
         setMessages(
-          res.data.reverse().map((conv) => ({
+          history.reverse().map((conv) => ({
             id: conv.id,
             topic: conv.topic,
             question: conv.question,
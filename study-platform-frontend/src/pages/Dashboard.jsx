@@ -48,7 +48,7 @@ export default function Dashboard() {
           API.get("/logs?limit=5"),
         ]);
         setStats(statsRes.data);
-        setLogs(logsRes.data);
+        setLogs(logsRes.data.items);
         setError(null);
       } catch (err) {
         // FIX 4: Removed console.error leak of full error object
@@ -40,7 +40,7 @@ export default function StudyGroups() {
     try {
       if (activeTab === "browse") {
         const res = await API.get("/study-groups");
-        setGroups(res.data);
+        setGroups(res.data.items);
       } else if (activeTab === "my-groups") {
         // FIX 3: Removed the duplicate API.get("/study-groups") call that was
         // made inside the my-groups branch — the original code fetched all